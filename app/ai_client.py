@@ -1,15 +1,66 @@
-"""Simple AI client interface for food analysis."""
+"""AI client interface for food analysis: a sample client, and one for an HTTP vision endpoint."""
 
+import asyncio
+import base64
+import copy
+import importlib.util
 import logging
-from typing import Optional, Dict, Any
+import os
+import threading
+import time
+from typing import BinaryIO, Optional, Dict, Any, List, Union
+
+import httpx
+
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.latency_tracker import LatencyTracker
+from app.services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# An image handed to the client: its bytes, a view of them (such as a memory-mapped stored
+# file), an open binary file, or text that is already base64-encoded. Clients only encode
+# when their transport needs text, see image_base64.
+ImageData = Union[bytes, memoryview, BinaryIO, str]
+
+
+def image_base64(image: ImageData) -> str:
+    """Base64 text of an image, for transports that embed it in JSON. Encodes straight from the source buffer."""
+    if isinstance(image, str):
+        return image
+    if isinstance(image, (bytes, memoryview)):
+        return base64.b64encode(image).decode("ascii")
+    return base64.b64encode(image.read()).decode("ascii")
+
+
+# Answer of the sample client, and of the stand-in server for every image
+SAMPLE_ANALYSIS: Dict[str, Any] = {
+    "food_items": ["mixed salad", "grilled chicken"],
+    "confidence_score": 0.85,
+    "nutritional_info": {
+        "calories": 185.0,
+        "protein_g": 25.3,
+        "carbohydrates_g": 8.2,
+        "total_fat_g": 6.1,
+        "saturated_fat_g": 1.4,
+        "fiber_g": 3.2,
+        "sugar_g": 4.1,
+        "sodium_mg": 320.0,
+    },
+    "estimated_portion_g": 250.0,
+    "vitamins": {"vitamin_c_mg": 35.2, "vitamin_a_iu": 1250.0, "folate_mcg": 65.0},
+    "minerals": {"calcium_mg": 85.0, "iron_mg": 2.8, "potassium_mg": 420.0},
+    "allergens": [{"name": "dairy", "confidence": 0.2, "detected_in": "possible dressing"}],
+}
+
 
 class AIClient:
     """Simple AI client for food image analysis."""
 
-    def analyze_food_image(self, image_data: str) -> Optional[Dict[str, Any]]:
+    # Identifies the model behind the results; cached results of other versions are not reused
+    model_version = os.environ.get("APP_AI_MODEL_VERSION", "food-vision-ai")
+
+    def analyze_food_image(self, image_data: ImageData) -> Optional[Dict[str, Any]]:
         """
         Analyze food image and return nutritional information.
         For now, returns a realistic sample response.
@@ -18,24 +69,7 @@ class AIClient:
         try:
             # For demonstration, return a sample analysis
             # In production, this would send image_data to AI service
-            sample_response = {
-                "food_items": ["mixed salad", "grilled chicken"],
-                "confidence_score": 0.85,
-                "nutritional_info": {
-                    "calories": 185.0,
-                    "protein_g": 25.3,
-                    "carbohydrates_g": 8.2,
-                    "total_fat_g": 6.1,
-                    "saturated_fat_g": 1.4,
-                    "fiber_g": 3.2,
-                    "sugar_g": 4.1,
-                    "sodium_mg": 320.0,
-                },
-                "estimated_portion_g": 250.0,
-                "vitamins": {"vitamin_c_mg": 35.2, "vitamin_a_iu": 1250.0, "folate_mcg": 65.0},
-                "minerals": {"calcium_mg": 85.0, "iron_mg": 2.8, "potassium_mg": 420.0},
-                "allergens": [{"name": "dairy", "confidence": 0.2, "detected_in": "possible dressing"}],
-            }
+            sample_response = copy.deepcopy(SAMPLE_ANALYSIS)
 
             logger.info("Generated sample food analysis response")
             return sample_response
@@ -44,7 +78,312 @@ class AIClient:
             logger.error(f"Error in AI food analysis: {e}")
             return None
 
+    def analyze_food_images(self, images: List[ImageData]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Analyze several food images in one request; results line up with images.
+        Backends with batched vision inference answer all of them in one call. This one
+        has no batch endpoint, so it analyzes them one by one.
+        """
+        return [self.analyze_food_image(image_data) for image_data in images]
+
+    async def analyze_food_image_async(self, image_data: ImageData) -> Optional[Dict[str, Any]]:
+        """Same as analyze_food_image, without blocking the event loop."""
+        return await asyncio.to_thread(self.analyze_food_image, image_data)
+
+    def close(self) -> None:
+        """Release connections and other resources held by the client."""
+
+
+class HTTPAIClient(AIClient):
+    """
+    Client for an HTTP vision endpoint, see app/ai_standin.py for the protocol.
+
+    All requests share one pooled httpx.AsyncClient with keep-alive connections, and HTTP/2
+    multiplexing when the h2 package is installed and the server offers it. The client runs on
+    a private event loop thread, so blocking callers (analysis worker threads, the batcher) and
+    coroutines on any loop use the same pool.
+
+    Every request has a deadline covering connecting, sending and waiting for the whole answer:
+    TIMEOUT_MULTIPLIER times the TIMEOUT_PERCENTILE of recent latencies, within MIN_TIMEOUT_SECONDS
+    and timeout_seconds, so a stalled backend is given up on as soon as it is clearly slower than
+    usual. BREAKER_FAILURES consecutive failures open the circuit breaker, and requests are then
+    rejected with CircuitOpenError without touching the network until a probe gets through.
+    Probes get the full timeout_seconds, so a backend that has become slower for good can recover.
+
+    Optionally, requests still unanswered after the HEDGE_PERCENTILE of recent latencies are sent
+    a second time, to hedge_endpoint (by default the same one), and whichever answer comes first
+    is used. Each request earns hedge_budget hedges, up to HEDGE_BURST saved up, so hedging adds
+    at most that share of extra calls; a budget of 0 turns it off.
+    """
+
+    ENDPOINT = os.environ.get("APP_AI_ENDPOINT", "")
+    API_KEY = os.environ.get("APP_AI_API_KEY", "")
+    TIMEOUT_SECONDS = float(os.environ.get("APP_AI_TIMEOUT_SECONDS", 30))
+    CONNECT_TIMEOUT_SECONDS = float(os.environ.get("APP_AI_CONNECT_TIMEOUT_SECONDS", 5))
+    MAX_CONNECTIONS = int(os.environ.get("APP_AI_MAX_CONNECTIONS", 20))
+    KEEPALIVE_SECONDS = float(os.environ.get("APP_AI_KEEPALIVE_SECONDS", 30))
+    HTTP2 = importlib.util.find_spec("h2") is not None
+    BREAKER_FAILURES = int(os.environ.get("APP_AI_BREAKER_FAILURES", 5))
+    BREAKER_RESET_SECONDS = float(os.environ.get("APP_AI_BREAKER_RESET_SECONDS", 30))
+    TIMEOUT_PERCENTILE = float(os.environ.get("APP_AI_TIMEOUT_PERCENTILE", 0.99))
+    TIMEOUT_MULTIPLIER = float(os.environ.get("APP_AI_TIMEOUT_MULTIPLIER", 3))
+    MIN_TIMEOUT_SECONDS = float(os.environ.get("APP_AI_MIN_TIMEOUT_SECONDS", 1))
+    HEDGE_ENDPOINT = os.environ.get("APP_AI_HEDGE_ENDPOINT", "")
+    HEDGE_BUDGET = float(os.environ.get("APP_AI_HEDGE_BUDGET", 0))
+    HEDGE_PERCENTILE = float(os.environ.get("APP_AI_HEDGE_PERCENTILE", 0.95))
+    HEDGE_BURST = 10
+    # Latencies the adaptive timeout and hedge delay are computed from, and how many they need to apply
+    LATENCY_WINDOW = 200
+    MIN_LATENCY_SAMPLES = 20
+
+    def __init__(
+        self,
+        endpoint: str = ENDPOINT,
+        timeout_seconds: float = TIMEOUT_SECONDS,
+        max_connections: int = MAX_CONNECTIONS,
+        http2: bool = HTTP2,
+        hedge_endpoint: str = HEDGE_ENDPOINT,
+        hedge_budget: float = HEDGE_BUDGET,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.hedge_endpoint = (hedge_endpoint or endpoint).rstrip("/")
+        self.hedge_budget = max(0.0, hedge_budget)
+        self.timeout_seconds = timeout_seconds
+        self.max_connections = max(1, max_connections)
+        self.http2 = http2
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self.breaker = CircuitBreaker("ai", self.BREAKER_FAILURES, self.BREAKER_RESET_SECONDS)
+        self.latencies = LatencyTracker(self.LATENCY_WINDOW)
+        # Touched only on the client's event loop
+        self._hedge_tokens = 0.0
+        self._hedges = 0
+        self._hedge_wins = 0
+
+    def analyze_food_image(self, image_data: ImageData) -> Optional[Dict[str, Any]]:
+        """Analyze one image; None if the request fails. Raises CircuitOpenError while the circuit is open."""
+        try:
+            return self.analyze_food_images([image_data])[0]
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in AI food analysis: {e}")
+            return None
+
+    def analyze_food_images(self, images: List[ImageData]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Analyze several images in one request.
+        Raises CircuitOpenError, or httpx.HTTPError, TimeoutError or ValueError on failure.
+        """
+        # Encoded in the caller, while views of memory-mapped files are still valid
+        payload = self._payload(images)
+        return asyncio.run_coroutine_threadsafe(self._call(payload, None), self._start()).result()
+
+    async def analyze_food_image_async(
+        self, image_data: ImageData, timeout_seconds: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Analyze one image from a coroutine on any event loop; None if the request fails."""
+        try:
+            results = await self.analyze_food_images_async([image_data], timeout_seconds)
+            return results[0]
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in AI food analysis: {e}")
+            return None
+
+    async def analyze_food_images_async(
+        self, images: List[ImageData], timeout_seconds: Optional[float] = None
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Analyze several images in one request from a coroutine on any event loop, with an optional deadline."""
+        payload = self._payload(images)
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self._call(payload, timeout_seconds), self._start())
+        )
+
+    def current_timeout(self) -> float:
+        """Deadline for the next request, adapted to recent latencies."""
+        if len(self.latencies) < self.MIN_LATENCY_SAMPLES:
+            return self.timeout_seconds
+        latency = self.latencies.percentile(self.TIMEOUT_PERCENTILE) or 0.0
+        return min(self.timeout_seconds, max(self.MIN_TIMEOUT_SECONDS, latency * self.TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self) -> Optional[float]:
+        """How long a request may run before it is hedged; None while hedging is off or latencies are too few."""
+        if self.hedge_budget <= 0 or len(self.latencies) < self.MIN_LATENCY_SAMPLES:
+            return None
+        return self.latencies.percentile(self.HEDGE_PERCENTILE)
+
+    def close(self) -> None:
+        """Close the pooled connections and stop the client's event loop."""
+        with self._lock:
+            loop, thread, self._loop, self._thread = self._loop, self._thread, None, None
+        if loop is None or thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close_http(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def _payload(self, images: List[ImageData]) -> Dict[str, Any]:
+        return {"model": self.model_version, "images": [image_base64(image) for image in images]}
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                if not self.HTTP2:
+                    logger.warning("h2 is not installed: the AI client uses HTTP/1.1, one connection per request")
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="ai-client", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _call(self, payload: Dict[str, Any], timeout_seconds: Optional[float]) -> List[Optional[Dict[str, Any]]]:
+        probe = self.breaker.acquire()
+        if timeout_seconds is None:
+            timeout_seconds = self.timeout_seconds if probe else self.current_timeout()
+        metrics.set_gauge("ai.timeout_seconds", timeout_seconds)
+
+        try:
+            # httpx timeouts bound each phase; the deadline bounds the whole call, hedge included
+            results = await asyncio.wait_for(self._send(payload, hedge=not probe), timeout_seconds)
+        except asyncio.CancelledError:
+            # Says nothing about the backend, but a probe must not keep its slot
+            self.breaker.release(probe)
+            raise
+        except Exception as e:
+            if isinstance(e, TimeoutError):
+                metrics.increment("ai.timeouts")
+            if self._is_backend_failure(e):
+                self.breaker.record_failure(probe)
+            else:
+                self.breaker.record_success(probe)
+            raise
+
+        self.breaker.record_success(probe)
+        return results
+
+    async def _send(self, payload: Dict[str, Any], hedge: bool) -> List[Optional[Dict[str, Any]]]:
+        """Post the request, hedging it once it has taken longer than hedge_delay() if the budget allows."""
+        self._hedge_tokens = min(self.HEDGE_BURST, self._hedge_tokens + self.hedge_budget)
+        primary = self._attempt(self.endpoint, payload)
+        attempts = {primary: time.monotonic()}
+        try:
+            delay = self.hedge_delay() if hedge else None
+            if delay is not None:
+                done, _ = await asyncio.wait([primary], timeout=delay)
+                if not done and self._hedge_tokens >= 1:
+                    self._hedge_tokens -= 1
+                    metrics.increment("ai.hedge.sent")
+                    attempts[self._attempt(self.hedge_endpoint, payload)] = time.monotonic()
+                elif not done:
+                    metrics.increment("ai.hedge.over_budget")
+
+            winner = await self._first_success(list(attempts))
+            if len(attempts) > 1:
+                self._count_hedge(won=winner is not primary)
+            return winner.result()
+        finally:
+            now = time.monotonic()
+            for attempt, started in attempts.items():
+                if not attempt.done():
+                    attempt.cancel()
+                    # Abandoned attempts, outrun by a hedge or cut off at the deadline, took at least this long.
+                    # Leaving them out would drag the percentiles, and with them the hedge delay and the timeout, down
+                    self.latencies.record(now - started)
+
+    def _attempt(self, endpoint: str, payload: Dict[str, Any]) -> asyncio.Future:
+        """Start one post, recording its latency once it succeeds. _send records the ones it abandons."""
+        started = time.monotonic()
+        attempt = asyncio.ensure_future(self._post(endpoint, payload))
+
+        def record(done: asyncio.Future) -> None:
+            if not done.cancelled() and done.exception() is None:
+                self.latencies.record(time.monotonic() - started)
+
+        attempt.add_done_callback(record)
+        return attempt
+
+    @staticmethod
+    async def _first_success(attempts: List[asyncio.Future]) -> asyncio.Future:
+        """The first attempt to succeed. Raises the first error if all of them fail."""
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Every finished attempt's outcome is read, so no error goes unretrieved
+            errors = {attempt: attempt.exception() for attempt in done}
+            succeeded = [attempt for attempt, attempt_error in errors.items() if attempt_error is None]
+            if succeeded:
+                return succeeded[0]
+            error = error or next(iter(errors.values()))
+        assert error is not None
+        raise error
+
+    def _count_hedge(self, won: bool) -> None:
+        self._hedges += 1
+        if won:
+            self._hedge_wins += 1
+            metrics.increment("ai.hedge.wins")
+        metrics.set_gauge("ai.hedge.win_rate", self._hedge_wins / self._hedges)
+
+    @staticmethod
+    def _is_backend_failure(error: Exception) -> bool:
+        """Whether an error says the backend is struggling, rather than that the request was bad."""
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            return status >= 500 or status == 429
+        return True
+
+    async def _post(self, endpoint: str, payload: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        if self._http is None:
+            headers = {"Authorization": f"Bearer {self.API_KEY}"} if self.API_KEY else {}
+            self._http = httpx.AsyncClient(
+                headers=headers,
+                http2=self.http2,
+                timeout=httpx.Timeout(self.timeout_seconds, connect=self.CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.KEEPALIVE_SECONDS,
+                ),
+            )
+
+        response = await self._http.post(f"{endpoint}/v1/analyze", json=payload)
+        response.raise_for_status()
+        results = response.json().get("results")
+        if not isinstance(results, list) or len(results) != len(payload["images"]):
+            raise ValueError(f"Malformed response from the AI backend for {len(payload['images'])} images")
+        return results
+
+    async def _close_http(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+_client: Optional[AIClient] = None
+_client_lock = threading.Lock()
+
 
 def get_ai_client() -> AIClient:
-    """Get AI client instance."""
-    return AIClient()
+    """
+    Get the process-wide AI client, created on first use: an HTTPAIClient when
+    APP_AI_ENDPOINT is set, otherwise the sample client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPAIClient() if HTTPAIClient.ENDPOINT else AIClient()
+        return _client
+
+
+def shutdown_ai_client() -> None:
+    """Close the process-wide AI client if it was created."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -0,0 +1,116 @@
+"""
+Local stand-in for the AI vision endpoint, for development, tests and offline load tests.
+
+Protocol: POST /v1/analyze with {"model": str, "images": [base64 str, ...]} answers
+{"results": [analysis or null, ...]}, one entry per image in order. The stand-in answers
+every image that is valid base64 with SAMPLE_ANALYSIS, and null for the others, after a
+configurable latency. A share of requests can be made to fail with 503, and a share to take
+slow_ms instead, for a latency tail like a real model's.
+
+Run with: python -m app.ai_standin [--port 8001] [--latency-ms 200] [--jitter-ms 50] [--failure-rate 0.1]
+                                   [--slow-rate 0.02] [--slow-ms 2000]
+and point the app at it with APP_AI_ENDPOINT=http://127.0.0.1:8001
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from app.ai_client import SAMPLE_ANALYSIS
+
+
+class AnalyzeRequest(BaseModel):
+    model: str
+    images: List[str]
+
+
+def create_standin_app(
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    failure_rate: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_ms: float = 0.0,
+) -> FastAPI:
+    """
+    Stand-in app answering after latency_ms plus up to jitter_ms, or after slow_ms for slow_rate
+    of requests, and failing failure_rate of requests.
+    """
+    standin = FastAPI(title="AI stand-in")
+
+    @standin.post("/v1/analyze")
+    async def analyze(request: AnalyzeRequest) -> Dict[str, Any]:
+        delay_ms = slow_ms if random.random() < slow_rate else latency_ms + random.uniform(0, jitter_ms)
+        await asyncio.sleep(delay_ms / 1000)
+        if random.random() < failure_rate:
+            raise HTTPException(status_code=503, detail="Stand-in failure")
+        return {"results": [_analyze(image) for image in request.images]}
+
+    return standin
+
+
+def _analyze(image: str) -> Optional[Dict[str, Any]]:
+    try:
+        base64.b64decode(image, validate=True)
+    except binascii.Error:
+        return None
+    return SAMPLE_ANALYSIS
+
+
+@contextmanager
+def run_standin_server(
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    failure_rate: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_ms: float = 0.0,
+    host: str = "127.0.0.1",
+) -> Iterator[str]:
+    """Serve a stand-in on a free port in a background thread. Yields its base URL."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+    standin = create_standin_app(latency_ms, jitter_ms, failure_rate, slow_rate, slow_ms)
+    config = uvicorn.Config(standin, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, name="ai-standin", daemon=True)
+    thread.start()
+    try:
+        deadline = time.monotonic() + 10
+        while not server.started:
+            if not thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("AI stand-in server did not start")
+            time.sleep(0.01)
+        yield f"http://{host}:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    standin = create_standin_app(args.latency_ms, args.jitter_ms, args.failure_rate, args.slow_rate, args.slow_ms)
+    uvicorn.run(standin, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from nicegui import ui
 from typing import List, Optional, Callable
 from app.models import NutritionalAnalysis
+from app.image_api import rendition_url
 from app.services.nutrition_service import NutritionAnalysisService
 
 
@@ -46,6 +47,11 @@ class HistoryComponent:
             f"w-full p-4 shadow-md rounded-lg border {card_style} hover:shadow-lg transition-shadow cursor-pointer"
         ):
             with ui.row().classes("items-start justify-between w-full"):
+                # Thumbnail from the small rendition, never the full-size file
+                thumbnail = self._thumbnail_url(analysis, 128)
+                if thumbnail:
+                    ui.image(thumbnail).classes("w-16 h-16 rounded-lg").props("fit=cover")
+
                 # Left side - main info
                 with ui.column().classes("flex-1"):
                     # Food items
@@ -125,6 +131,13 @@ class HistoryComponent:
                     </script>
                 """)
 
+    def _thumbnail_url(self, analysis: NutritionalAnalysis, min_size: int) -> Optional[str]:
+        """URL of a rendition of the analysed image, if one was generated."""
+        food_image = analysis.food_image
+        if food_image is None or not food_image.renditions:
+            return None
+        return rendition_url(food_image.renditions, min_size)
+
     def _get_confidence_color(self, confidence: float) -> str:
         """Get color class based on confidence level."""
         if confidence >= 80:
@@ -155,6 +168,10 @@ class HistoryComponent:
     def _create_compact_analysis_item(self, analysis: NutritionalAnalysis):
         """Create a compact analysis item for sidebar."""
         with ui.row().classes("items-center justify-between w-full p-2 hover:bg-gray-50 rounded"):
+            thumbnail = self._thumbnail_url(analysis, 128)
+            if thumbnail:
+                ui.image(thumbnail).classes("w-10 h-10 rounded").props("fit=cover")
+
             with ui.column().classes("flex-1"):
                 # Food name
                 food_name = ", ".join(analysis.food_items) if analysis.food_items else "Unknown"
@@ -1,15 +1,191 @@
+import zipfile
+from enum import Enum
 from nicegui import ui, events
-from typing import Callable, Optional
+from typing import Callable, Dict, List, Optional
 from pathlib import Path
 
+from app.image_api import rendition_url
+from app.services.file_service import FileService
+from app.services.resumable_upload import ResumableUploadStore, UploadSessionError, get_resumable_store
+from app.services.upload_spool import SpooledUpload, UploadTooLargeError, expand_archive, spool_upload
+
+# Size of the rendition shown once an upload has been saved
+PREVIEW_SIZE = 512
+
+# Runs in the browser when a file is picked: the preview reads the local file directly,
+# so the image never travels back over the websocket
+OBJECT_URL_PREVIEW_JS = """(files) => {
+    const img = getHtmlElement(%d);
+    if (!img || !files.length) return;
+    if (img.dataset.objectUrl) URL.revokeObjectURL(img.dataset.objectUrl);
+    img.dataset.objectUrl = URL.createObjectURL(files[0]);
+    img.src = img.dataset.objectUrl;
+    getHtmlElement(%d)?.classList.remove("hidden");
+}"""
+
+# Runs in the browser when a file is picked with pre-resize on: the file is swapped for a canvas
+# re-encode bounded by the server's MAX_IMAGE_SIZE, then uploaded. Files that fail to decode, or
+# would not get smaller, are sent unchanged; the server validates whatever arrives either way.
+PRE_RESIZE_JS = r"""async (files) => {
+    const uploader = getElement(%(upload_id)d)?.$refs.qRef;
+    if (!uploader) return;
+    const shrink = async (file) => {
+        const bitmap = await createImageBitmap(file, { imageOrientation: "from-image" });
+        const scale = Math.min(1, %(max_width)d / bitmap.width, %(max_height)d / bitmap.height);
+        if (scale === 1 && file.type === "image/jpeg") return file;
+        const canvas = document.createElement("canvas");
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        const context = canvas.getContext("2d");
+        context.imageSmoothingQuality = "high";
+        context.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+        const blob = await new Promise((resolve) => canvas.toBlob(resolve, "image/jpeg", %(quality).2f));
+        if (!blob || blob.size >= file.size) return file;
+        return new File([blob], file.name.replace(/\.[^.]*$/, "") + ".jpg", { type: "image/jpeg" });
+    };
+    const ready = [];
+    for (const file of files) {
+        if (file.__preResized) continue;
+        uploader.removeFile(file);
+        let resized = file;
+        try {
+            resized = await shrink(file);
+        } catch (error) {
+            console.warn("Pre-resize failed, uploading original", error);
+        }
+        resized.__preResized = true;
+        ready.push(resized);
+    }
+    // Re-added together, so a multi-file selection stays one batch
+    if (ready.length) uploader.addFiles(ready);
+    if (files.every((file) => file.__preResized) && %(start_upload)s) uploader.upload();
+}"""
+
+# JPEG quality of browser re-encodes, matching the server's own encode
+PRE_RESIZE_QUALITY = 0.85
+
+# Runs in the browser when files are ready to send in resumable mode: each file goes to /uploads
+# in checksummed chunks, and the completed session ids are reported together. Network errors and
+# bad chunks are retried from the offset the server reports, so a dropped connection only costs
+# the chunk in flight. Session ids are kept in localStorage, so picking the same file again after
+# a reload resumes it as well.
+RESUMABLE_UPLOAD_JS = r"""async (files) => {
+    const uploader = getElement(%(upload_id)d)?.$refs.qRef;
+    if (!uploader) return;
+    const base = window.path_prefix + "/uploads";
+    const crcTable = (window.__crc32Table ||= Array.from({ length: 256 }, (_, n) => {
+        let c = n;
+        for (let k = 0; k < 8; k++) c = c & 1 ? 0xedb88320 ^ (c >>> 1) : c >>> 1;
+        return c >>> 0;
+    }));
+    const crc32 = (bytes) => {
+        let c = 0xffffffff;
+        for (const b of bytes) c = crcTable[(c ^ b) & 0xff] ^ (c >>> 8);
+        return ((c ^ 0xffffffff) >>> 0).toString(16).padStart(8, "0");
+    };
+    const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+    const probe = async (id) => {
+        const response = await fetch(`${base}/${id}`, { method: "HEAD" });
+        return response.ok ? Number(response.headers.get("Upload-Offset")) : null;
+    };
+    const send = async (file) => {
+        const key = `resumable-upload:${file.name}:${file.size}:${file.lastModified}`;
+        let id = localStorage.getItem(key);
+        let offset = id ? await probe(id).catch(() => null) : null;
+        let chunkSize = %(chunk_size)d;
+        if (offset === null) {
+            const response = await fetch(base, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ filename: file.name, size: file.size }),
+            });
+            if (!response.ok) throw new Error((await response.json()).detail || response.statusText);
+            const session = await response.json();
+            [id, offset, chunkSize] = [session.id, session.offset, session.chunk_size];
+            localStorage.setItem(key, id);
+        }
+        let failures = 0;
+        while (offset < file.size) {
+            const bytes = new Uint8Array(await file.slice(offset, offset + chunkSize).arrayBuffer());
+            try {
+                const response = await fetch(`${base}/${id}`, {
+                    method: "PATCH",
+                    headers: { "Upload-Offset": String(offset), "Upload-Checksum": `crc32 ${crc32(bytes)}` },
+                    body: bytes,
+                });
+                if (response.status === 204 || response.status === 409) {
+                    offset = Number(response.headers.get("Upload-Offset"));
+                    failures = 0;
+                    continue;
+                }
+                if (response.status !== 460) throw new Error(`Upload failed with status ${response.status}`);
+            } catch (error) {
+                if (error.message.startsWith("Upload failed")) throw error;
+            }
+            if (++failures > %(max_retries)d) throw new Error("Upload interrupted, please try again");
+            await sleep(Math.min(30000, 500 * 2 ** failures));
+            offset = (await probe(id).catch(() => null)) ?? offset;
+        }
+        localStorage.removeItem(key);
+        return id;
+    };
+    const ids = [];
+    const errors = [];
+    for (const file of files) {
+        if (%(wait_for_resize)s && !file.__preResized) continue;
+        uploader.removeFile(file);
+        try {
+            ids.push(await send(file));
+        } catch (error) {
+            errors.push(`${file.name}: ${error.message || error}`);
+        }
+    }
+    if (ids.length || errors.length) emitEvent("%(event)s", { ids, errors });
+}"""
+
+# Chunk retries in a row before a resumable upload gives up
+RESUMABLE_MAX_RETRIES = 8
+
+
+class PreviewMode(str, Enum):
+    # The browser renders the picked file from a local object URL
+    OBJECT_URL = "object_url"
+    # The server sends the upload back as a base64 data URL (for clients without object URL support)
+    DATA_URL = "data_url"
+
 
 class ImageUploadComponent:
     """Modern image upload component with drag-and-drop and preview."""
 
-    def __init__(self, on_upload: Callable[[bytes, str], None], on_error: Optional[Callable[[str], None]] = None):
+    def __init__(
+        self,
+        on_upload: Callable[[SpooledUpload], None],
+        on_error: Optional[Callable[[str], None]] = None,
+        preview_mode: PreviewMode = PreviewMode.OBJECT_URL,
+        pre_resize: bool = False,
+        resumable: bool = False,
+        on_bulk_upload: Optional[Callable[[List[SpooledUpload]], None]] = None,
+    ):
+        """
+        With pre_resize, the browser downsizes images to FileService.MAX_IMAGE_SIZE before
+        sending them, which saves bandwidth and server decode time for large camera photos.
+        With resumable, files are sent through the chunked /uploads protocol instead of a
+        single request, so retries on flaky connections only resend the missing bytes.
+        With on_bulk_upload, many images (or ZIP archives of images) can be picked at once;
+        a selection that yields more than one image is passed to it as a single batch.
+        """
         self.on_upload = on_upload
+        self.on_bulk_upload = on_bulk_upload
         self.on_error = on_error or (lambda msg: ui.notify(msg, type="negative"))
+        self.preview_mode = preview_mode
+        self.pre_resize = pre_resize
+        self.resumable = resumable
+        self._resumable_event: Optional[str] = None
         self.preview_container = None
+        self.preview_image = None
+        self.preview_info = None
+        self.upload = None
         self.upload_area = None
 
     def create(self):
@@ -31,23 +207,7 @@ class ImageUploadComponent:
                     ui.label("Drag and drop an image here").classes("text-lg text-gray-600 mb-2")
                     ui.label("or").classes("text-gray-400 mb-4")
 
-                    with ui.row().classes("gap-4"):
-                        # File upload button
-                        ui.upload(
-                            on_upload=self._handle_upload,
-                            auto_upload=True,
-                            multiple=False,
-                            max_file_size=10 * 1024 * 1024,  # 10MB
-                        ).classes("hidden").props("accept=image/*").mark("file_upload")
-
-                        ui.button("Choose File", icon="folder_open", on_click=lambda: self._trigger_upload()).classes(
-                            "bg-blue-500 hover:bg-blue-600 text-white px-6 py-2"
-                        )
-
-                        # Camera capture (if supported)
-                        ui.button("Take Photo", icon="camera_alt", on_click=self._show_camera_capture).classes(
-                            "bg-green-500 hover:bg-green-600 text-white px-6 py-2"
-                        )
+                    self._create_upload_controls()
 
             # File requirements
             with ui.expansion("Supported Formats", icon="info").classes("w-full mt-4"):
@@ -59,38 +219,124 @@ class ImageUploadComponent:
 
             # Preview area (initially hidden)
             self.preview_container = ui.column().classes("w-full mt-6 hidden")
+            with self.preview_container:
+                ui.separator().classes("my-4")
+                ui.label("Image Preview").classes("text-lg font-semibold text-gray-800 mb-2")
+                self.preview_image = (
+                    ui.element("img")
+                    .classes("w-full max-w-sm mx-auto rounded-lg shadow-md")
+                    .style("max-height: 300px; object-fit: contain;")
+                )
+                self.preview_info = ui.row().classes("justify-center mt-4 gap-2")
+
+        self._attach_preview_handler()
+        self._attach_pre_resize_handler()
+        self._attach_resumable_handler()
+
+    def _create_upload_controls(self):
+        """Create the hidden upload widget and its buttons in the current context."""
+        with ui.row().classes("gap-4"):
+            # File upload button. When pre-resizing, the browser starts the upload once the
+            # file has been shrunk, and the size limit applies to the shrunk file on the server.
+            # In resumable mode the uploader only picks files; the browser sends them itself.
+            # In bulk mode all picked files arrive in one request, and archives may be larger.
+            bulk = self.on_bulk_upload is not None
+            self.upload = (
+                ui.upload(
+                    on_upload=None if bulk else self._handle_upload,
+                    on_multi_upload=self._handle_multi_upload if bulk else None,
+                    auto_upload=not (self.pre_resize or self.resumable),
+                    multiple=bulk,
+                    max_file_size=None if self.pre_resize or bulk else FileService.MAX_FILE_SIZE,
+                    max_files=FileService.MAX_BULK_FILES if bulk else None,
+                )
+                .classes("hidden")
+                .props('accept="image/*,.zip"' if bulk else "accept=image/*")
+                .mark("file_upload")
+            )
+
+            ui.button("Choose File", icon="folder_open", on_click=lambda: self._trigger_upload()).classes(
+                "bg-blue-500 hover:bg-blue-600 text-white px-6 py-2"
+            )
+
+            # Camera capture (if supported)
+            ui.button("Take Photo", icon="camera_alt", on_click=self._show_camera_capture).classes(
+                "bg-green-500 hover:bg-green-600 text-white px-6 py-2"
+            )
+
+    def _attach_preview_handler(self):
+        """Let the browser preview picked files itself instead of waiting for the server."""
+        if self.preview_mode != PreviewMode.OBJECT_URL or self.upload is None:
+            return
+        if self.preview_image is None or self.preview_container is None:
+            return
+
+        self.upload.on("added", js_handler=OBJECT_URL_PREVIEW_JS % (self.preview_image.id, self.preview_container.id))
+
+    def _attach_pre_resize_handler(self):
+        """Shrink picked files in the browser before they are uploaded."""
+        if not self.pre_resize or self.upload is None:
+            return
+
+        max_width, max_height = FileService.MAX_IMAGE_SIZE
+        self.upload.on(
+            "added",
+            js_handler=PRE_RESIZE_JS
+            % {
+                "upload_id": self.upload.id,
+                "max_width": max_width,
+                "max_height": max_height,
+                "quality": PRE_RESIZE_QUALITY,
+                "start_upload": "false" if self.resumable else "true",
+            },
+        )
+
+    def _attach_resumable_handler(self):
+        """Send picked files through the resumable upload protocol."""
+        if not self.resumable or self.upload is None:
+            return
+
+        # Completion is reported through a page-level event, which survives reset() recreating the uploader
+        if self._resumable_event is None:
+            self._resumable_event = f"resumable_upload_{self.upload.id}"
+            ui.on(self._resumable_event, self._handle_resumable_upload)
+
+        self.upload.on(
+            "added",
+            js_handler=RESUMABLE_UPLOAD_JS
+            % {
+                "upload_id": self.upload.id,
+                "chunk_size": ResumableUploadStore.CHUNK_SIZE,
+                "max_retries": RESUMABLE_MAX_RETRIES,
+                "wait_for_resize": "true" if self.pre_resize else "false",
+                "event": self._resumable_event,
+            },
+        )
 
     def _trigger_upload(self):
         """Trigger the hidden file upload."""
-        upload_element = None
-        # Find upload element
-        for element in ui.context.client.elements.values():
-            if hasattr(element, "_props") and element._props.get("accept") == "image/*":
-                upload_element = element
-                break
-
-        if upload_element:
-            ui.run_javascript("document.querySelector('input[type=file]').click()")
+        if self.upload is not None:
+            ui.run_javascript(f"getHtmlElement({self.upload.id}).querySelector('input[type=file]').click()")
 
     def _handle_upload(self, e: events.UploadEventArguments):
-        """Handle file upload."""
+        """
+        Handle file upload. The file is spooled to disk in chunks rather than read into memory;
+        the upload handler takes ownership of the spooled file and must close it.
+        """
         try:
             # Validate file type
             if not e.name.lower().endswith((".jpg", ".jpeg", ".png", ".webp", ".bmp")):
                 self.on_error("Please upload a valid image file (JPEG, PNG, WebP, or BMP)")
                 return
 
-            # Validate file size
-            content = e.content.read()
-            if len(content) > 10 * 1024 * 1024:  # 10MB
+            # Validate file size while copying, stopping as soon as the limit is passed
+            try:
+                upload = spool_upload(e.content, e.name, FileService.MAX_FILE_SIZE)
+            except UploadTooLargeError:
                 self.on_error("File size must be less than 10MB")
                 return
 
-            # Show preview
-            self._show_preview(content, e.name)
-
-            # Call upload handler
-            self.on_upload(content, e.name)
+            self._accept_uploads([upload])
 
         except Exception as ex:
             import logging
@@ -98,30 +344,145 @@ class ImageUploadComponent:
             logging.info(f"Error uploading file: {str(ex)}")
             self.on_error(f"Error uploading file: {str(ex)}")
 
-    def _show_preview(self, content: bytes, filename: str):
+    def _handle_multi_upload(self, e: events.MultiUploadEventArguments):
+        """Handle a bulk selection, spooling each file to disk like a single upload."""
+        uploads: List[SpooledUpload] = []
+        try:
+            for content, name in zip(e.contents, e.names):
+                if not self._is_accepted_filename(name):
+                    self.on_error(f"Skipping {name}: not a JPEG, PNG, WebP, BMP or ZIP file")
+                    continue
+                try:
+                    uploads.append(spool_upload(content, name, FileService.max_upload_size(name)))
+                except UploadTooLargeError:
+                    self.on_error(f"Skipping {name}: file is too large")
+
+        except Exception as ex:
+            import logging
+
+            logging.info(f"Error uploading files: {str(ex)}")
+            self._close_all(uploads)
+            self.on_error(f"Error uploading files: {str(ex)}")
+            return
+
+        self._accept_uploads(uploads)
+
+    def _handle_resumable_upload(self, e: events.GenericEventArguments):
+        """Claim completed resumable uploads and hand them on like regular ones."""
+        for error in e.args.get("errors", []):
+            self.on_error(f"Error uploading file: {error}")
+
+        uploads: List[SpooledUpload] = []
+        for session_id in e.args.get("ids", []):
+            try:
+                upload = get_resumable_store().finish(str(session_id))
+            except UploadSessionError as ex:
+                import logging
+
+                logging.info(f"Error completing resumable upload: {ex}")
+                self.on_error("Upload could not be completed, please try again")
+                continue
+
+            if not self._is_accepted_filename(upload.filename):
+                upload.close()
+                self.on_error("Please upload a valid image file (JPEG, PNG, WebP, or BMP)")
+                continue
+            uploads.append(upload)
+
+        self._accept_uploads(uploads)
+
+    def _accept_uploads(self, uploads: List[SpooledUpload]):
+        """Expand archives, then pass a single image to on_upload and several to on_bulk_upload."""
+        images: List[SpooledUpload] = []
+        try:
+            for upload in uploads:
+                if not FileService.is_archive(upload.filename):
+                    images.append(upload)
+                    continue
+                with upload:
+                    remaining = FileService.MAX_BULK_FILES - len(images)
+                    images.extend(
+                        expand_archive(upload, FileService.MAX_FILE_SIZE, remaining, FileService.is_allowed_filename)
+                    )
+            if len(images) > FileService.MAX_BULK_FILES:
+                raise UploadTooLargeError(f"Please upload at most {FileService.MAX_BULK_FILES} images at once")
+        except (UploadTooLargeError, zipfile.BadZipFile) as ex:
+            self._close_all(uploads + images)
+            self.on_error(str(ex) if isinstance(ex, UploadTooLargeError) else "Could not read the ZIP archive")
+            return
+
+        if len(images) == 1:
+            self._accept_upload(images[0])
+        elif images and self.on_bulk_upload is not None:
+            self._show_bulk_preview(images)
+            self.on_bulk_upload(images)
+        elif images:
+            self._close_all(images)
+            self.on_error("Please upload one image at a time")
+        elif uploads:
+            self.on_error("No images found in the upload")
+
+    def _is_accepted_filename(self, filename: str) -> bool:
+        if self.on_bulk_upload is not None and FileService.is_archive(filename):
+            return True
+        return FileService.is_allowed_filename(filename)
+
+    @staticmethod
+    def _close_all(uploads: List[SpooledUpload]):
+        for upload in uploads:
+            upload.close()
+
+    def _accept_upload(self, upload: SpooledUpload):
+        # Show preview
+        self._show_preview(upload)
+
+        # Call upload handler
+        self.on_upload(upload)
+
+    def _show_preview(self, upload: SpooledUpload):
         """Show image preview."""
-        if self.preview_container:
-            self.preview_container.classes(remove="hidden")
+        if self.preview_container is None or self.preview_image is None or self.preview_info is None:
+            return
 
-            with self.preview_container:
-                self.preview_container.clear()
+        self.preview_container.classes(remove="hidden")
 
-                ui.separator().classes("my-4")
-                ui.label("Image Preview").classes("text-lg font-semibold text-gray-800 mb-2")
+        # In object URL mode the browser has already rendered the file it picked
+        if self.preview_mode == PreviewMode.DATA_URL:
+            import base64
+
+            image_b64 = base64.b64encode(upload.read()).decode()
+            self._set_preview_src(f"data:{self._get_mime_type(upload.filename)};base64,{image_b64}")
 
-                # Convert bytes to base64 for display
-                import base64
+        self.preview_info.clear()
+        with self.preview_info:
+            ui.chip(f"File: {upload.filename}", icon="image").classes("bg-blue-100 text-blue-800")
+            ui.chip(f"Size: {upload.size // 1024}KB", icon="storage").classes("bg-green-100 text-green-800")
 
-                image_b64 = base64.b64encode(content).decode()
-                mime_type = self._get_mime_type(filename)
+    def _show_bulk_preview(self, uploads: List[SpooledUpload]):
+        """Summarize a bulk upload; per-image progress is up to the bulk upload handler."""
+        if self.preview_container is None or self.preview_info is None:
+            return
 
-                ui.image(f"data:{mime_type};base64,{image_b64}").classes(
-                    "w-full max-w-sm mx-auto rounded-lg shadow-md"
-                ).style("max-height: 300px; object-fit: contain;")
+        self.preview_container.classes(remove="hidden")
+        self.preview_info.clear()
+        with self.preview_info:
+            ui.chip(f"Files: {len(uploads)}", icon="collections").classes("bg-blue-100 text-blue-800")
+            total_size = sum(upload.size for upload in uploads)
+            ui.chip(f"Size: {total_size // 1024}KB", icon="storage").classes("bg-green-100 text-green-800")
 
-                with ui.row().classes("justify-center mt-4 gap-2"):
-                    ui.chip(f"File: {filename}", icon="image").classes("bg-blue-100 text-blue-800")
-                    ui.chip(f"Size: {len(content) // 1024}KB", icon="storage").classes("bg-green-100 text-green-800")
+    def show_saved_preview(self, renditions: Dict[str, str]):
+        """Point the preview at the stored rendition once the upload has been saved."""
+        if self.preview_image is None:
+            return
+
+        url = rendition_url(renditions, PREVIEW_SIZE)
+        if url is not None:
+            self._set_preview_src(url)
+
+    def _set_preview_src(self, src: str):
+        if self.preview_image is not None:
+            self.preview_image._props["src"] = src
+            self.preview_image.update()
 
     def _show_camera_capture(self):
         """Show camera capture interface (placeholder for now)."""
@@ -153,7 +514,11 @@ class ImageUploadComponent:
         """Reset the upload component."""
         if self.preview_container:
             self.preview_container.classes(add="hidden")
-            self.preview_container.clear()
+        if self.preview_image is not None:
+            self.preview_image._props.pop("src", None)
+            self.preview_image.update()
+        if self.preview_info is not None:
+            self.preview_info.clear()
 
         if self.upload_area:
             self.upload_area.clear()
@@ -162,15 +527,8 @@ class ImageUploadComponent:
                 ui.label("Drag and drop an image here").classes("text-lg text-gray-600 mb-2")
                 ui.label("or").classes("text-gray-400 mb-4")
 
-                with ui.row().classes("gap-4"):
-                    ui.upload(
-                        on_upload=self._handle_upload, auto_upload=True, multiple=False, max_file_size=10 * 1024 * 1024
-                    ).classes("hidden").props("accept=image/*")
+                self._create_upload_controls()
 
-                    ui.button("Choose File", icon="folder_open", on_click=lambda: self._trigger_upload()).classes(
-                        "bg-blue-500 hover:bg-blue-600 text-white px-6 py-2"
-                    )
-
-                    ui.button("Take Photo", icon="camera_alt", on_click=self._show_camera_capture).classes(
-                        "bg-green-500 hover:bg-green-600 text-white px-6 py-2"
-                    )
+        self._attach_preview_handler()
+        self._attach_pre_resize_handler()
+        self._attach_resumable_handler()
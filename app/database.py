@@ -1,5 +1,7 @@
 import os
-from sqlmodel import SQLModel, create_engine, Session
+from typing import List, NamedTuple, Optional
+from sqlalchemy import inspect
+from sqlmodel import SQLModel, create_engine, Session, text
 
 # Import all models to ensure they're registered. ToDo: replace with specific imports when possible.
 from app.models import *  # noqa: F401, F403
@@ -8,8 +10,70 @@ DATABASE_URL = os.environ.get("APP_DATABASE_URL", "postgresql://postgres:postgre
 ENGINE = create_engine(DATABASE_URL, connect_args={"connect_timeout": 15, "options": "-c statement_timeout=1000"})
 
 
+class ColumnMigration(NamedTuple):
+    """A column added to a table after it first shipped, with an optional statement filling it in on old rows."""
+
+    table: str
+    column: str
+    definition: str
+    backfill: Optional[str] = None
+
+
+# create_all only creates missing tables, so columns added to existing tables are listed here, oldest first.
+# Append new ones at the end; never edit or reorder shipped entries.
+COLUMN_MIGRATIONS: List[ColumnMigration] = [
+    # Content-addressed storage. Older rows keep a NULL hash and are treated as unshared files.
+    ColumnMigration("food_images", "content_hash", "VARCHAR(64)"),
+    # Downscaled renditions. Older images have none, and are served from the original.
+    ColumnMigration(
+        "food_images", "renditions", "JSON", "UPDATE food_images SET renditions = '{}' WHERE renditions IS NULL"
+    ),
+    # Near-duplicate detection. Older images have no hash and are never matched.
+    ColumnMigration("food_images", "perceptual_hash", "VARCHAR(16)"),
+    # Job queue. Analyses left processing by an older release have no lease, so the reaper hands them back.
+    ColumnMigration("nutritional_analyses", "priority", "INTEGER NOT NULL DEFAULT 0"),
+    ColumnMigration("nutritional_analyses", "attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ColumnMigration("nutritional_analyses", "lease_expires_at", "TIMESTAMP"),
+    # Worker heartbeats. None until a worker claims the analysis.
+    ColumnMigration("nutritional_analyses", "heartbeat_at", "TIMESTAMP"),
+    # Renditions sized for the AI model. Older images have none and are sent as stored.
+    ColumnMigration("food_images", "inference_rendition", "VARCHAR(255)"),
+]
+
+# Indexes added since a table first shipped. create_all builds them for new tables only.
+INDEX_MIGRATIONS: List[str] = [
+    "CREATE INDEX IF NOT EXISTS ix_food_images_content_hash ON food_images (content_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_food_images_filename_id ON food_images (filename, id)",
+    # Superseded by the partial index below, which also serves the claim's ORDER BY priority DESC, id
+    "DROP INDEX IF EXISTS ix_nutritional_analyses_queue",
+    "CREATE INDEX IF NOT EXISTS ix_nutritional_analyses_pending ON nutritional_analyses (priority DESC, id) "
+    "WHERE status = 'PENDING'",
+]
+
+
 def create_tables():
     SQLModel.metadata.create_all(ENGINE)
+    migrate()
+
+
+def migrate():
+    """Bring tables created by an older release up to the current models. Safe to run on every startup."""
+    with ENGINE.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Backfills touch every row, which can outlast the per-statement limit meant for requests
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+        existing = {
+            table: {column["name"] for column in inspect(conn).get_columns(table)}
+            for table in {migration.table for migration in COLUMN_MIGRATIONS}
+        }
+        for migration in COLUMN_MIGRATIONS:
+            if migration.column in existing[migration.table]:
+                continue
+            conn.execute(text(f"ALTER TABLE {migration.table} ADD COLUMN {migration.column} {migration.definition}"))
+            if migration.backfill:
+                conn.execute(text(migration.backfill))
+        for statement in INDEX_MIGRATIONS:
+            conn.execute(text(statement))
 
 
 def get_session():
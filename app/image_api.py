@@ -0,0 +1,87 @@
+"""HTTP routes serving stored images and their renditions straight from disk."""
+
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from nicegui import app
+
+from app.services.file_service import FileService
+from app.services.image_processing import RENDITION_FORMAT
+
+router = APIRouter()
+
+# Stored names are 32 hex characters (content hash, or uuid for older uploads), optionally a rendition size
+STORED_NAME = re.compile(r"^[0-9a-f]{32}(_\d+)?\.(jpg|jpeg|png|webp|bmp)$")
+
+# Stored files never change under a given name, so clients may cache them forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".bmp": "image/bmp",
+}
+
+
+def image_url(filename: str) -> str:
+    """URL of a stored image or rendition."""
+    return f"/images/{filename}"
+
+
+def rendition_url(renditions: Dict[str, str], min_size: int) -> Optional[str]:
+    """URL of the smallest rendition at least min_size pixels across, or the largest available."""
+    filename = FileService.select_rendition(renditions, min_size)
+    if filename is None:
+        return None
+    return image_url(filename)
+
+
+@router.api_route("/images/{filename}", methods=["GET", "HEAD"])
+async def get_image(filename: str, request: Request) -> Response:
+    """Serve a stored image with a strong ETag, immutable caching and Range support."""
+    return _serve(filename, request)
+
+
+@router.api_route("/images/{filename}/{size}", methods=["GET", "HEAD"])
+async def get_image_rendition(filename: str, size: int, request: Request) -> Response:
+    """Serve the WebP rendition of a stored image at the given size."""
+    stem = Path(filename).stem
+    return _serve(f"{stem}_{size}.{RENDITION_FORMAT.lower()}", request)
+
+
+def _serve(filename: str, request: Request) -> Response:
+    if not STORED_NAME.match(filename):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    file_path = FileService().get_image_path(filename)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    # The name is derived from the content, so it is a strong validator on its own
+    etag = f'"{Path(filename).stem}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse streams from disk in chunks and answers Range / If-Range requests itself
+    return FileResponse(file_path, media_type=MEDIA_TYPES[Path(filename).suffix], headers=headers)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110, section 13.1.2)."""
+    if if_none_match is None:
+        return False
+
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def create():
+    """Register the image routes on the app."""
+    app.include_router(router)
@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel, Field, Relationship, JSON, Column
+from sqlmodel import SQLModel, Field, Relationship, JSON, Column, Index, UniqueConstraint, text
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from decimal import Decimal
@@ -34,6 +34,8 @@ class User(SQLModel, table=True):
 
 class FoodImage(SQLModel, table=True):
     __tablename__ = "food_images"  # type: ignore[assignment]
+    # Storage GC pages through images in (filename, id) order
+    __table_args__ = (Index("ix_food_images_filename_id", "filename", "id"),)
 
     id: Optional[int] = Field(default=None, primary_key=True)
     filename: str = Field(max_length=255)
@@ -44,6 +46,14 @@ class FoodImage(SQLModel, table=True):
     source_type: ImageSourceType = Field(default=ImageSourceType.UPLOAD)
     width: Optional[int] = Field(default=None, gt=0)
     height: Optional[int] = Field(default=None, gt=0)
+    # Hash of the normalized image bytes; rows sharing a hash share one stored file
+    content_hash: Optional[str] = Field(default=None, max_length=64, index=True)
+    # Difference hash of the normalized image (16 hex characters); close hashes mean near-identical photos
+    perceptual_hash: Optional[str] = Field(default=None, max_length=16)
+    # Downscaled WebP renditions: size in pixels -> stored filename
+    renditions: Dict[str, str] = Field(default={}, sa_column=Column(JSON))
+    # Stored filename of the smaller rendition analyzed instead of the full image, if any
+    inference_rendition: Optional[str] = Field(default=None, max_length=255)
     user_id: int = Field(foreign_key="users.id")
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -54,11 +64,29 @@ class FoodImage(SQLModel, table=True):
 
 class NutritionalAnalysis(SQLModel, table=True):
     __tablename__ = "nutritional_analyses"  # type: ignore[assignment]
+    # Workers claim the highest-priority, oldest pending analysis: the first entry of this index.
+    # Enum columns store member names, hence 'PENDING'.
+    __table_args__ = (
+        Index(
+            "ix_nutritional_analyses_pending",
+            text("priority DESC"),
+            "id",
+            postgresql_where=text("status = 'PENDING'"),
+            sqlite_where=text("status = 'PENDING'"),
+        ),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     food_image_id: int = Field(foreign_key="food_images.id", unique=True)
     status: AnalysisStatus = Field(default=AnalysisStatus.PENDING)
 
+    # Job queue state: higher priority runs first; a worker holds the job until lease_expires_at
+    priority: int = Field(default=0)
+    attempts: int = Field(default=0, ge=0)
+    lease_expires_at: Optional[datetime] = Field(default=None)
+    # Last time the worker holding the lease reported progress
+    heartbeat_at: Optional[datetime] = Field(default=None)
+
     # Food identification
     food_items: List[str] = Field(default=[], sa_column=Column(JSON))
     confidence_score: Optional[Decimal] = Field(default=None, decimal_places=2, ge=0.0, le=1.0)
@@ -94,6 +122,19 @@ class NutritionalAnalysis(SQLModel, table=True):
     allergens: List["AllergenDetection"] = Relationship(back_populates="nutritional_analysis")
 
 
+class AnalysisResultCache(SQLModel, table=True):
+    """Raw AI results by normalized image hash, shared by every image with the same content."""
+
+    __tablename__ = "analysis_result_cache"  # type: ignore[assignment]
+    __table_args__ = (UniqueConstraint("content_hash", "model_version"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    content_hash: str = Field(max_length=64)
+    model_version: str = Field(max_length=100)
+    result: Dict[str, Any] = Field(default={}, sa_column=Column(JSON))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Allergen(SQLModel, table=True):
     __tablename__ = "allergens"  # type: ignore[assignment]
 
@@ -144,6 +185,10 @@ class FoodImageCreate(SQLModel, table=False):
     source_type: ImageSourceType = Field(default=ImageSourceType.UPLOAD)
     width: Optional[int] = Field(default=None, gt=0)
     height: Optional[int] = Field(default=None, gt=0)
+    content_hash: Optional[str] = Field(default=None, max_length=64)
+    perceptual_hash: Optional[str] = Field(default=None, max_length=16)
+    renditions: Dict[str, str] = Field(default={})
+    inference_rendition: Optional[str] = Field(default=None, max_length=255)
     user_id: int
 
 
@@ -217,6 +262,7 @@ class FoodImageResponse(SQLModel, table=False):
     source_type: ImageSourceType
     width: Optional[int]
     height: Optional[int]
+    renditions: Dict[str, str]
     created_at: str
 
 
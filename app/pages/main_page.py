@@ -1,12 +1,27 @@
 from nicegui import ui, app
 import asyncio
-from app.services.user_service import UserService
+from typing import Dict, List, Tuple
+from app.services.analysis_queue import AnalysisQueue, get_analysis_queue
+from app.services.user_service import BulkItemStatus, UserService
 from app.services.nutrition_service import NutritionAnalysisService
+from app.services.upload_spool import SpooledUpload
 from app.components.upload_component import ImageUploadComponent
 from app.components.nutrition_display import NutritionDisplayComponent
 from app.components.history_component import HistoryComponent
 
 
+# Icon, text and color shown for each stage of a bulk upload
+BULK_PROGRESS = {
+    BulkItemStatus.QUEUED.value: ("schedule", "Queued", "text-gray-400"),
+    BulkItemStatus.PROCESSING.value: ("autorenew", "Processing", "text-blue-500"),
+    BulkItemStatus.STORED.value: ("cloud_done", "Saved", "text-blue-600"),
+    BulkItemStatus.FAILED.value: ("error", "Failed", "text-red-500"),
+    "analyzing": ("hourglass_top", "Analyzing", "text-blue-500"),
+    "analyzed": ("check_circle", "Analyzed", "text-green-600"),
+    "analysis_failed": ("error_outline", "Analysis failed", "text-orange-500"),
+}
+
+
 def create():
     """Create the main food analysis page."""
 
@@ -57,16 +72,28 @@ def create():
                 # Create upload component
                 analysis_container = ui.column().classes("w-full")
 
-                def handle_upload(content: bytes, filename: str):
+                def handle_upload(upload: SpooledUpload):
                     """Handle image upload and analysis."""
-                    if current_user.id is not None:
-                        asyncio.create_task(_process_upload(content, filename, current_user.id, analysis_container))
+                    if current_user.id is None:
+                        upload.close()
+                        return
+                    asyncio.create_task(_process_upload(upload, current_user.id, analysis_container, upload_component))
+
+                def handle_bulk_upload(uploads: List[SpooledUpload]):
+                    """Handle a batch of images, e.g. a whole day of meals."""
+                    if current_user.id is None:
+                        for upload in uploads:
+                            upload.close()
+                        return
+                    asyncio.create_task(_process_bulk_upload(uploads, current_user.id, analysis_container))
 
                 def handle_error(message: str):
                     """Handle upload errors."""
                     ui.notify(message, type="negative")
 
-                upload_component = ImageUploadComponent(handle_upload, handle_error)
+                upload_component = ImageUploadComponent(
+                    handle_upload, handle_error, pre_resize=True, resumable=True, on_bulk_upload=handle_bulk_upload
+                )
                 upload_component.create()
 
                 # Analysis results container
@@ -81,8 +108,9 @@ def create():
                 recent_analyses = nutrition_service.get_recent_analyses(5)
                 history_component.create_compact_history(recent_analyses)
 
-    async def _process_upload(content: bytes, filename: str, user_id: int, container):
-        """Process uploaded image asynchronously."""
+    async def _process_upload(upload: SpooledUpload, user_id: int, container, upload_component: ImageUploadComponent):
+        """Process uploaded image asynchronously. Closes (and so deletes) the spooled upload."""
+        filename = upload.filename
         user_service = UserService()
         nutrition_service = NutritionAnalysisService()
         nutrition_display = NutritionDisplayComponent()
@@ -93,8 +121,9 @@ def create():
                 container.clear()
                 nutrition_display.create_loading_display()
 
-            # Create food image record
-            food_image = user_service.create_food_image(user_id, content, filename, "upload")
+            # Create food image record; the spooled file is decoded from disk by path
+            food_image = await user_service.create_food_image_async(user_id, upload.path, filename, "upload")
+            upload.close()
 
             if not food_image:
                 with container:
@@ -102,11 +131,15 @@ def create():
                     nutrition_display.create_error_display("Failed to save image. Please try again.")
                 return
 
+            # The browser can drop its local copy and show the cacheable stored rendition
+            upload_component.show_saved_preview(food_image.renditions)
             ui.notify(f"Image uploaded successfully! Analyzing {filename}...", type="positive")
 
-            # Analyze the image
+            # Queue the analysis; workers run it off the event loop and the page waits for the result
             if food_image.id:
-                analysis = nutrition_service.analyze_food_image(food_image.id)
+                analysis_queue = get_analysis_queue()
+                pending = await analysis_queue.enqueue(food_image.id, AnalysisQueue.INTERACTIVE_PRIORITY)
+                analysis = await analysis_queue.wait(pending.id) if pending and pending.id is not None else None
 
                 if analysis and analysis.id is not None:
                     # Get allergen detections
@@ -141,6 +174,76 @@ def create():
                 container.clear()
                 nutrition_display.create_error_display(f"Unexpected error: {str(e)}")
             ui.notify(f"Error processing image: {str(e)}", type="negative")
+        finally:
+            upload.close()
+
+    async def _process_bulk_upload(uploads: List[SpooledUpload], user_id: int, container):
+        """Store a batch of images in one go, then queue them all for analysis. Closes the spooled uploads."""
+        user_service = UserService()
+        analysis_queue = get_analysis_queue()
+        rows: Dict[int, Tuple[ui.icon, ui.label]] = {}
+
+        def show(index: int, status: str):
+            icon_name, text, color = BULK_PROGRESS[status]
+            icon, label = rows[index]
+            icon.set_name(icon_name)
+            icon.classes(replace=color)
+            label.set_text(text)
+
+        async def show_result(index: int, analysis_id: int) -> bool:
+            analysis = await analysis_queue.wait(analysis_id)
+            completed = analysis is not None and analysis.status.value == "completed"
+            show(index, "analyzed" if completed else "analysis_failed")
+            return completed
+
+        try:
+            with container:
+                container.clear()
+                with ui.card().classes("w-full p-4 bg-white shadow-lg rounded-xl"):
+                    ui.label(f"Processing {len(uploads)} images").classes("text-lg font-semibold text-gray-800 mb-2")
+                    for index, upload in enumerate(uploads):
+                        with ui.row().classes("w-full items-center gap-2"):
+                            icon = ui.icon("schedule")
+                            ui.label(upload.filename).classes("flex-1 text-gray-700 truncate")
+                            rows[index] = (icon, ui.label().classes("text-sm text-gray-500"))
+                        show(index, BulkItemStatus.QUEUED.value)
+
+            # Spooled files are decoded from disk by path, several at a time
+            food_images = await user_service.create_food_images_bulk(
+                user_id,
+                [(upload.path, upload.filename) for upload in uploads],
+                "upload",
+                on_progress=lambda index, status: show(index, status.value),
+            )
+            for upload in uploads:
+                upload.close()
+
+            stored = sum(1 for food_image in food_images if food_image is not None)
+            ui.notify(f"{stored} of {len(uploads)} images uploaded. Analyzing...", type="positive")
+
+            # All images are queued at once; the worker pool decides how many run concurrently
+            results = []
+            for index, food_image in enumerate(food_images):
+                if food_image is None or food_image.id is None:
+                    continue
+                pending = await analysis_queue.enqueue(food_image.id)
+                if pending is None or pending.id is None:
+                    show(index, "analysis_failed")
+                    continue
+                show(index, "analyzing")
+                results.append(show_result(index, pending.id))
+            analyzed = sum(await asyncio.gather(*results))
+
+            ui.notify(f"Analysis complete for {analyzed} of {len(uploads)} images", type="positive")
+
+        except Exception as e:
+            import logging
+
+            logging.info(f"Error processing images: {str(e)}")
+            ui.notify(f"Error processing images: {str(e)}", type="negative")
+        finally:
+            for upload in uploads:
+                upload.close()
 
     # History page
     @ui.page("/history")
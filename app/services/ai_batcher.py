@@ -0,0 +1,152 @@
+"""
+Micro-batching of AI analysis requests.
+
+Analyses call AIBatcher.analyze() one image at a time, from their worker threads. Requests
+are collected until MAX_BATCH_SIZE are waiting or the oldest has waited MAX_WAIT_MS, then sent
+together through AIClient.analyze_food_images(), so backends with batched vision inference
+serve many images per call. At most MAX_CONCURRENT_BATCHES batches are in flight at once; while
+they all are, the dispatcher waits and requests keep collecting, so a slow backend gets fuller
+batches rather than a growing backlog of small ones.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.ai_client import AIClient, ImageData, get_ai_client
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+AnalysisResult = Optional[Dict[str, Any]]
+
+
+class AIBatcher:
+    """Collects single-image requests into batches for an AIClient."""
+
+    MAX_BATCH_SIZE = int(os.environ.get("APP_AI_BATCH_SIZE", 8))
+    MAX_WAIT_MS = float(os.environ.get("APP_AI_BATCH_WAIT_MS", 20))
+    MAX_CONCURRENT_BATCHES = int(os.environ.get("APP_AI_BATCH_CONCURRENCY", 2))
+
+    def __init__(
+        self,
+        client: AIClient,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        max_concurrent_batches: int = MAX_CONCURRENT_BATCHES,
+    ):
+        self.client = client
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self._condition = threading.Condition()
+        # (image data, result, time queued), oldest first
+        self._pending: List[Tuple[ImageData, Future, float]] = []
+        self._dispatcher: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # One per batch in flight, taken by the dispatcher before it forms a batch
+        self._slots = threading.BoundedSemaphore(self.max_concurrent_batches)
+        self._closed = False
+
+    def analyze(self, image_data: ImageData) -> AnalysisResult:
+        """Analyze one image as part of the next batch. Blocks until its result is in."""
+        if self.max_batch_size == 1:
+            return self.client.analyze_food_image(image_data)
+
+        result: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("AI batcher is closed")
+            self._pending.append((image_data, result, time.monotonic()))
+            self._start()
+            self._condition.notify()
+        return result.result()
+
+    def close(self) -> None:
+        """Send what is queued, then stop the dispatcher."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+            self._dispatcher = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _start(self) -> None:
+        if self._dispatcher is None:
+            self._executor = ThreadPoolExecutor(self.max_concurrent_batches, thread_name_prefix="ai-batch")
+            self._dispatcher = threading.Thread(target=self._dispatch, name="ai-batcher", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self) -> None:
+        while True:
+            self._slots.acquire()
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    self._slots.release()
+                    return
+
+                # Wait for a full batch, but no longer than the oldest request may wait
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = self._pending[0][2] + self.max_wait - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending[: self.max_batch_size]
+                del self._pending[: self.max_batch_size]
+
+            assert self._executor is not None
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: List[Tuple[ImageData, Future, float]]) -> None:
+        try:
+            self._analyze_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _analyze_batch(self, batch: List[Tuple[ImageData, Future, float]]) -> None:
+        metrics.increment("ai.batches")
+        metrics.increment("ai.batched_images", len(batch))
+        metrics.set_gauge("ai.last_batch_size", len(batch))
+        try:
+            results = self.client.analyze_food_images([image_data for image_data, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results from the AI backend, got {len(results)}")
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} analyses failed: {e}")
+            for _, result, _ in batch:
+                result.set_exception(e)
+            return
+
+        for (_, result, _), analysis in zip(batch, results):
+            result.set_result(analysis)
+
+
+_batcher: Optional[AIBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_ai_batcher() -> AIBatcher:
+    """Get the process-wide batcher in front of the AI client, created on first use."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = AIBatcher(get_ai_client())
+        return _batcher
+
+
+def shutdown_ai_batcher() -> None:
+    """Flush and stop the process-wide batcher if it was started."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is not None:
+            _batcher.close()
+            _batcher = None
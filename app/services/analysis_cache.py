@@ -0,0 +1,143 @@
+"""
+Cache of raw AI analysis results, keyed by normalized image hash and result version.
+
+Two tiers: a per-process LRU with a TTL in front of the analysis_result_cache table, which
+every process shares and which outlives restarts. Identical images (same content hash, as
+deduplicated by the image store) are only sent to the model once per result version: the model
+version plus the settings of the inference rendition it is shown (see result_version). Results
+of other versions are never returned, and invalidate_other_versions() removes them.
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import col, delete, select
+
+from app.ai_client import AIClient
+from app.database import get_session
+from app.models import AnalysisResultCache
+from app.services.file_service import FileService
+from app.services.image_processing import InferenceSettings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str]
+
+
+def result_version(model_version: str, inference: InferenceSettings) -> str:
+    """
+    Version of the results the model gives for the inference rendition. The same content shown at another
+    size or quality can be analyzed differently, so results are cached per rendition settings too.
+    """
+    return f"{model_version}@{inference.size}px-{inference.format.lower()}-q{inference.quality}"
+
+
+class AnalysisCache:
+    """Two-tier cache of AI results. Counts hits per tier, misses and evictions in metrics."""
+
+    MAX_ENTRIES = int(os.environ.get("APP_ANALYSIS_CACHE_SIZE", 1024))
+    TTL_SECONDS = int(os.environ.get("APP_ANALYSIS_CACHE_TTL_SECONDS", 60 * 60))
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_seconds: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Key -> (expiry time, result), least recently used first
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, content_hash: str, model_version: str) -> Optional[Dict[str, Any]]:
+        """The cached result for an image, or None."""
+        key = (content_hash, model_version)
+        result = self._get_memory(key)
+        if result is not None:
+            metrics.increment("analysis_cache.memory_hits")
+            return result
+
+        with get_session() as session:
+            stmt = select(AnalysisResultCache).where(
+                AnalysisResultCache.content_hash == content_hash, AnalysisResultCache.model_version == model_version
+            )
+            row = session.exec(stmt).first()
+        if row is None:
+            metrics.increment("analysis_cache.misses")
+            return None
+
+        metrics.increment("analysis_cache.db_hits")
+        self._put_memory(key, row.result)
+        return copy.deepcopy(row.result)
+
+    def put(self, content_hash: str, model_version: str, result: Dict[str, Any]) -> None:
+        """Store a result in both tiers."""
+        self._put_memory((content_hash, model_version), result)
+        try:
+            with get_session() as session:
+                session.add(AnalysisResultCache(content_hash=content_hash, model_version=model_version, result=result))
+                session.commit()
+        except IntegrityError:
+            # Another process stored the same image first; either result will do
+            pass
+
+    def invalidate_other_versions(self, model_version: str) -> int:
+        """Drop results of every model version but model_version. Returns the number of stored results removed."""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] != model_version]:
+                del self._entries[key]
+
+        with get_session() as session:
+            stmt = delete(AnalysisResultCache).where(col(AnalysisResultCache.model_version) != model_version)
+            removed = session.exec(stmt).rowcount  # type: ignore[attr-defined]
+            session.commit()
+
+        if removed:
+            metrics.increment("analysis_cache.invalidations", removed)
+            logger.info(f"Removed {removed} cached analyses of other model versions than {model_version}")
+        return removed
+
+    def _get_memory(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires, result = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                metrics.increment("analysis_cache.expirations")
+                return None
+
+            self._entries.move_to_end(key)
+            # Callers own the result they get, so the cached copy cannot be changed through it
+            return copy.deepcopy(result)
+
+    def _put_memory(self, key: CacheKey, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("analysis_cache.evictions")
+
+
+_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Get the process-wide analysis cache, created on first use."""
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
+
+
+def invalidate_stale_results() -> None:
+    """Startup task dropping cached results of other models or inference rendition settings than the configured."""
+    get_analysis_cache().invalidate_other_versions(
+        result_version(AIClient.model_version, FileService.INFERENCE_RENDITION)
+    )
@@ -0,0 +1,232 @@
+"""
+Background analysis of food images.
+
+The queue is the nutritional_analyses table itself: enqueue() records a PENDING analysis and
+returns right away, and workers claim pending rows with SELECT ... FOR UPDATE SKIP LOCKED (see
+NutritionAnalysisService.claim_next_analysis). Queued work therefore survives restarts, and
+every app process can run workers against the same table without two of them taking one job.
+
+Each process runs a fixed pool of worker tasks, so at most WORKERS analyses run at once per
+process, each in a thread so a slow AI backend never blocks the event loop. Idle workers are
+woken by local enqueues and otherwise poll every POLL_INTERVAL_SECONDS for work queued elsewhere.
+Pages await wait() to learn when their analysis is done, whichever process ran it.
+
+While an analysis runs, its worker renews the lease every HEARTBEAT_INTERVAL_SECONDS. If the
+process dies, the lease runs out and reap_expired_analyses() hands the job back to the queue,
+or fails it once it has used up its attempts. A lease carries the attempt it was claimed for as a
+fencing token, so a worker that outlived its lease can no longer renew it or write results once the
+job was claimed again. Jobs shed by the AI client's circuit breaker are handed back without using up
+an attempt, and all workers pause until the breaker allows a probe.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set
+
+from app.models import AnalysisStatus, NutritionalAnalysis
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.metrics import metrics
+from app.services.nutrition_service import AnalysisLease, NutritionAnalysisService
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisQueue:
+    """
+    Worker pool draining the PENDING analyses in the database.
+    Blocking calls run through asyncio.to_thread: nicegui's run.io_bound swallows cancellation,
+    which would keep stopped workers looping.
+    """
+
+    WORKERS = int(os.environ.get("APP_ANALYSIS_WORKERS", 2))
+    POLL_INTERVAL_SECONDS = float(os.environ.get("APP_ANALYSIS_POLL_SECONDS", 2.0))
+    # Single uploads have someone waiting on the page; bulk uploads can queue behind them
+    INTERACTIVE_PRIORITY = 10
+    BULK_PRIORITY = 0
+    # Several beats per lease, so one slow database round trip does not lose it
+    HEARTBEAT_INTERVAL_SECONDS = NutritionAnalysisService.LEASE_SECONDS / 3
+    REAP_INTERVAL_SECONDS = 60
+
+    def __init__(self, nutrition_service: Optional[NutritionAnalysisService] = None, workers: int = WORKERS):
+        self.nutrition_service = nutrition_service or NutritionAnalysisService()
+        self.workers = max(1, workers)
+        self._tasks: List[asyncio.Task] = []
+        # Analyses running in threads, which stop() lets finish
+        self._running: Set[asyncio.Future] = set()
+        self._work_available: Optional[asyncio.Event] = None
+        # Wakes pages waiting on an analysis this process finished
+        self._done: Dict[int, asyncio.Future] = {}
+        # Event loop time before which no worker claims work, while the AI backend's circuit is open
+        self._paused_until = 0.0
+
+    def start(self) -> None:
+        """Start the workers on the running event loop, replacing any that died. Does nothing if all are running."""
+        for task in self._tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                logger.error(f"Analysis worker {task.get_name()} died: {task.exception()}")
+        running = [task for task in self._tasks if not task.done()]
+        if len(running) >= self.workers:
+            return
+
+        if self._work_available is None:
+            self._work_available = asyncio.Event()
+        names = {task.get_name() for task in running}
+        self._tasks = running + [
+            asyncio.create_task(self._work(), name=name)
+            for name in (f"analysis-worker-{i}" for i in range(self.workers))
+            if name not in names
+        ]
+        logger.info(f"Analysis queue started {self.workers - len(running)} of {self.workers} workers")
+
+    async def stop(self) -> None:
+        """
+        Stop the workers once the analyses they are running are done. Their threads cannot be
+        cancelled, and would otherwise carry on using the AI client after it is shut down.
+        Unclaimed jobs stay PENDING in the database for the next start.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*self._running, return_exceptions=True)
+        self._tasks = []
+        self._work_available = None
+        for done in self._done.values():
+            done.cancel()
+        self._done.clear()
+
+    async def enqueue(self, food_image_id: int, priority: int = BULK_PRIORITY) -> Optional[NutritionalAnalysis]:
+        """Queue a food image for analysis. Returns its PENDING analysis, or None if the image does not exist."""
+        analysis = await asyncio.to_thread(self.nutrition_service.create_pending_analysis, food_image_id, priority)
+        if analysis is None or analysis.id is None:
+            return None
+
+        self.start()
+        self.wake()
+        metrics.increment("analysis.jobs_enqueued")
+        return analysis
+
+    def wake(self) -> None:
+        """Have idle workers look for pending analyses now instead of at their next poll."""
+        if self._work_available is not None:
+            self._work_available.set()
+
+    async def wait(self, analysis_id: int) -> Optional[NutritionalAnalysis]:
+        """Wait for an analysis to finish and return the finished record."""
+        while True:
+            analysis = await asyncio.to_thread(self.nutrition_service.get_analysis, analysis_id)
+            if analysis is None or analysis.status in (AnalysisStatus.COMPLETED, AnalysisStatus.FAILED):
+                self._done.pop(analysis_id, None)
+                return analysis
+
+            done = self._done.setdefault(analysis_id, asyncio.get_running_loop().create_future())
+            try:
+                # Shielded so a timed out or cancelled waiter does not cancel the wakeup for others
+                await asyncio.wait_for(asyncio.shield(done), self.POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            while loop.time() < self._paused_until:
+                await asyncio.sleep(self._paused_until - loop.time())
+
+            try:
+                lease = await asyncio.to_thread(self.nutrition_service.claim_next_analysis)
+            except Exception as e:
+                # E.g. a dropped connection or a failover; the worker must outlive it
+                logger.error(f"Failed to claim an analysis, retrying in {self.POLL_INTERVAL_SECONDS}s: {e}")
+                await asyncio.sleep(self.POLL_INTERVAL_SECONDS)
+                continue
+            if lease is None:
+                await self._wait_for_work()
+                continue
+
+            analysis_id = lease.analysis_id
+            metrics.increment("analysis.jobs_claimed")
+            heartbeat = asyncio.create_task(self._heartbeat(lease))
+            run = asyncio.ensure_future(
+                asyncio.to_thread(self.nutrition_service.run_analysis, analysis_id, lease.token)
+            )
+            self._running.add(run)
+            run.add_done_callback(self._running.discard)
+            try:
+                await asyncio.shield(run)
+                metrics.increment("analysis.jobs_completed")
+            except CircuitOpenError as e:
+                # Requeued; claiming more work before the breaker lets a probe through would only shed it too,
+                # so the whole pool pauses
+                metrics.increment("analysis.jobs_shed")
+                logger.warning(f"Analysis {analysis_id} handed back: {e}")
+                self._paused_until = max(self._paused_until, loop.time() + e.retry_after)
+            except Exception as e:
+                logger.error(f"Analysis {analysis_id} failed: {e}")
+            finally:
+                heartbeat.cancel()
+
+            # Waiters check the status themselves, so a requeued analysis keeps them waiting
+            done = self._done.pop(analysis_id, None)
+            if done is not None and not done.done():
+                done.set_result(None)
+
+    async def _heartbeat(self, lease: AnalysisLease) -> None:
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL_SECONDS)
+            try:
+                if not await asyncio.to_thread(self.nutrition_service.renew_lease, lease):
+                    return
+                metrics.increment("analysis.heartbeats")
+            except Exception as e:
+                # The next beat may get through before the lease runs out
+                logger.warning(f"Failed to renew the lease of analysis {lease.analysis_id}: {e}")
+
+    async def _wait_for_work(self) -> None:
+        assert self._work_available is not None
+        # A wakeup that came while the worker was busy needs no wait. Waiting on an event that is already set
+        # could also have wait_for return its result instead of raising a stop()'s cancellation
+        if not self._work_available.is_set():
+            try:
+                await asyncio.wait_for(self._work_available.wait(), self.POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        self._work_available.clear()
+
+
+_queue: Optional[AnalysisQueue] = None
+
+
+def get_analysis_queue() -> AnalysisQueue:
+    """Get the process-wide analysis queue, created on first use."""
+    global _queue
+    if _queue is None:
+        _queue = AnalysisQueue()
+    return _queue
+
+
+def start_analysis_queue() -> None:
+    """Start the process-wide workers, picking up analyses left pending by earlier runs."""
+    get_analysis_queue().start()
+
+
+async def reap_expired_analyses() -> None:
+    """Periodic task returning analyses of dead workers to the queue."""
+    try:
+        requeued, failed = await asyncio.to_thread(NutritionAnalysisService().reap_expired_analyses)
+    except Exception as e:
+        logger.error(f"Failed to reap expired analyses: {e}")
+        return
+
+    metrics.increment("analysis.reaper.requeued", requeued)
+    metrics.increment("analysis.reaper.failed", failed)
+    if requeued or failed:
+        logger.warning(f"Reaped expired analyses: {requeued} requeued, {failed} failed")
+        get_analysis_queue().wake()
+
+
+async def shutdown_analysis_queue() -> None:
+    """Stop the process-wide analysis queue if it was started."""
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue = None
@@ -0,0 +1,108 @@
+"""Circuit breaker that fails calls to a struggling dependency fast instead of letting them wait."""
+
+import logging
+import threading
+import time
+from enum import Enum
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+
+# Gauge values, so dashboards can plot the state
+STATE_GAUGES = {CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """A call was rejected by an open circuit. retry_after is the wait in seconds until a probe may go through."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    CLOSED: calls go through; failure_threshold consecutive failures open the circuit.
+    OPEN: calls are rejected with CircuitOpenError for reset_seconds.
+    HALF_OPEN: up to probe_limit calls at a time go through as probes. A successful probe
+    closes the circuit, a failed one opens it again.
+    Callers acquire() before each call and report its outcome, or release() it if there is none.
+    Safe to use from any thread.
+    Metrics are named after the breaker: <name>.breaker.state, .opened and .rejected.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0, probe_limit: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.probe_limit = max(1, probe_limit)
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._check_reset()
+            return self._state
+
+    def acquire(self) -> bool:
+        """Admit a call, or raise CircuitOpenError. Returns whether the call is a half-open probe."""
+        with self._lock:
+            self._check_reset()
+            if self._state == CircuitState.CLOSED:
+                return False
+            if self._state == CircuitState.HALF_OPEN and self._probes < self.probe_limit:
+                self._probes += 1
+                return True
+
+            metrics.increment(f"{self.name}.breaker.rejected")
+            # Half-open with all probes out: the next chance comes when one of them finishes
+            retry_after = max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+            raise CircuitOpenError(self.name, retry_after or self.reset_seconds)
+
+    def record_success(self, probe: bool = False) -> None:
+        with self._lock:
+            self._failures = 0
+            if probe:
+                self._probes -= 1
+                if self._state == CircuitState.HALF_OPEN:
+                    self._set_state(CircuitState.CLOSED)
+                    logger.info(f"Circuit {self.name} closed")
+
+    def record_failure(self, probe: bool = False) -> None:
+        with self._lock:
+            if probe:
+                self._probes -= 1
+            self._failures += 1
+            if self._state == CircuitState.HALF_OPEN or (
+                self._state == CircuitState.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._set_state(CircuitState.OPEN)
+                metrics.increment(f"{self.name}.breaker.opened")
+                logger.warning(f"Circuit {self.name} opened after {self._failures} consecutive failures")
+
+    def release(self, probe: bool) -> None:
+        """Give back the slot of a call that ended without an outcome, e.g. because it was cancelled."""
+        if probe:
+            with self._lock:
+                self._probes -= 1
+
+    def _check_reset(self) -> None:
+        if self._state == CircuitState.OPEN and time.monotonic() >= self._opened_at + self.reset_seconds:
+            self._set_state(CircuitState.HALF_OPEN)
+
+    def _set_state(self, state: CircuitState) -> None:
+        self._state = state
+        metrics.set_gauge(f"{self.name}.breaker.state", STATE_GAUGES[state])
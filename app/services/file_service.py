@@ -1,69 +1,149 @@
-import uuid
+import logging
+import os
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple, Union
 from PIL import Image
-from io import BytesIO
+from app.services.image_processing import (
+    RENDITION_FORMAT,
+    ImageSource,
+    InferenceSettings,
+    ResampleQuality,
+    TranscodedImage,
+    get_image_pool,
+    open_image,
+    source_size,
+    transcode_image,
+)
+from app.services.image_store import ContentAddressedStore, get_layout
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class IngestedImage:
+    """Result of a single-pass image ingestion."""
+
+    filename: str
+    file_path: str
+    file_size: int
+    width: int
+    height: int
+    format: str
+    content_hash: str
+    # False when an identical image was already stored
+    created: bool
+    # Rendition filenames keyed by their size in pixels (as a string, for JSON storage)
+    renditions: Dict[str, str]
+    perceptual_hash: Optional[str] = None
+    # Filename of the smaller rendition sent to the AI model, if the image needs one
+    inference_rendition: Optional[str] = None
 
 
 class FileService:
     UPLOAD_DIR = Path("uploads")
+    # Directory layout under UPLOAD_DIR: flat or sharded (two-level hash prefix fan-out)
+    UPLOAD_LAYOUT = os.environ.get("APP_UPLOAD_LAYOUT", "sharded")
     ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
     MAX_IMAGE_SIZE = (2048, 2048)  # Max width/height
-
-    def __init__(self):
-        self.UPLOAD_DIR.mkdir(exist_ok=True)
-
-    def validate_image_file(self, content: bytes, filename: str) -> bool:
+    RENDITION_SIZES = (128, 512, 2048)  # WebP renditions generated at ingest
+    # Input for the AI model: vision models downsample to roughly 512-1024 px internally anyway
+    INFERENCE_RENDITION = InferenceSettings(
+        size=int(os.environ.get("APP_INFERENCE_SIZE", 768)),
+        format=os.environ.get("APP_INFERENCE_FORMAT", "JPEG").upper(),
+        quality=int(os.environ.get("APP_INFERENCE_QUALITY", 85)),
+    )
+    # Bulk uploads: most images per batch (archives included) and images transcoded at once
+    ARCHIVE_EXTENSIONS = {".zip"}
+    MAX_ARCHIVE_SIZE = 100 * 1024 * 1024  # 100MB
+    MAX_BULK_FILES = 50
+    BULK_CONCURRENCY = int(os.environ.get("APP_BULK_CONCURRENCY", 4))
+    # Resampling tier for downscaling: fast, balanced or best
+    RESAMPLE_QUALITY = ResampleQuality(os.environ.get("APP_IMAGE_RESAMPLE", ResampleQuality.BALANCED.value))
+
+    def __init__(self, upload_dir: Optional[Path] = None):
+        self.store = ContentAddressedStore(upload_dir or self.UPLOAD_DIR, get_layout(self.UPLOAD_LAYOUT))
+
+    def validate_image_file(self, content: ImageSource, filename: str) -> bool:
         """Validate that the uploaded file is a valid image."""
-        # Check file size
-        if len(content) > self.MAX_FILE_SIZE:
-            return False
-
-        # Check file extension
-        file_ext = Path(filename).suffix.lower()
-        if file_ext not in self.ALLOWED_EXTENSIONS:
+        if not self._check_upload(content, filename):
             return False
 
         # Try to open as image
         try:
-            with Image.open(BytesIO(content)) as img:
+            with open_image(content) as img:
                 img.verify()
             return True
         except Exception as e:
-            import logging
-
-            logging.info(f"Failed to validate image: {e}")
+            logger.info(f"Failed to validate image: {e}")
             return False
 
-    def save_image(self, content: bytes, original_filename: str) -> Tuple[str, str, int, int, int]:
+    def ingest_image(
+        self, content: ImageSource, original_filename: str, quality: Optional[ResampleQuality] = None
+    ) -> Optional[IngestedImage]:
         """
-        Save image file and return (filename, file_path, file_size, width, height).
-        Automatically resizes large images.
+        Validate, normalize and store an uploaded image in a single pass.
+        The header is sniffed, the pixels are decoded exactly once, and the resized
+        image is encoded in memory before being written. Returns None for invalid images.
+        Content may be bytes, or a path or file handle of a spooled upload, which is decoded
+        without reading it into memory first. The quality tier defaults to RESAMPLE_QUALITY.
         """
-        # Generate unique filename
+        if not self._check_upload(content, original_filename):
+            return None
+
         file_ext = Path(original_filename).suffix.lower()
-        unique_filename = f"{uuid.uuid4().hex}{file_ext}"
-        file_path = self.UPLOAD_DIR / unique_filename
+        try:
+            transcoded = transcode_image(
+                content,
+                self._output_format(file_ext),
+                self.MAX_IMAGE_SIZE,
+                quality or self.RESAMPLE_QUALITY,
+                self.RENDITION_SIZES,
+                self.INFERENCE_RENDITION,
+            )
+        except Exception as e:
+            logger.info(f"Failed to decode image {original_filename}: {e}")
+            return None
 
-        # Open and potentially resize image
-        with Image.open(BytesIO(content)) as img:
-            # Convert to RGB if needed (for PNG with transparency, etc.)
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
+        return self._store(transcoded, file_ext)
 
-            # Resize if too large
-            if img.size[0] > self.MAX_IMAGE_SIZE[0] or img.size[1] > self.MAX_IMAGE_SIZE[1]:
-                img.thumbnail(self.MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
+    async def ingest_image_async(
+        self, content: Union[bytes, Path], original_filename: str, quality: Optional[ResampleQuality] = None
+    ) -> Optional[IngestedImage]:
+        """
+        Same as ingest_image, but decoding, resizing and encoding run in the image process pool.
+        Pass spooled uploads by path so workers read them from disk instead of receiving a pickled copy.
+        """
+        if not self._check_upload(content, original_filename):
+            return None
 
-            # Save optimized image
-            img.save(file_path, optimize=True, quality=85)
+        file_ext = Path(original_filename).suffix.lower()
+        try:
+            transcoded = await get_image_pool().run(
+                transcode_image,
+                content,
+                self._output_format(file_ext),
+                self.MAX_IMAGE_SIZE,
+                quality or self.RESAMPLE_QUALITY,
+                self.RENDITION_SIZES,
+                self.INFERENCE_RENDITION,
+            )
+        except Exception as e:
+            logger.info(f"Failed to decode image {original_filename}: {e}")
+            return None
 
-        # Get final file size and dimensions
-        file_size = file_path.stat().st_size
-        width, height = img.size
+        return self._store(transcoded, file_ext)
 
-        return unique_filename, str(file_path), file_size, width, height
+    def save_image(self, content: bytes, original_filename: str) -> Tuple[str, str, int, int, int]:
+        """
+        Save image file and return (filename, file_path, file_size, width, height).
+        Automatically resizes large images.
+        """
+        file_ext = Path(original_filename).suffix.lower()
+        transcoded = transcode_image(content, self._output_format(file_ext), self.MAX_IMAGE_SIZE, self.RESAMPLE_QUALITY)
+        ingested = self._store(transcoded, file_ext)
+        return ingested.filename, ingested.file_path, ingested.file_size, ingested.width, ingested.height
 
     def delete_image(self, file_path: str) -> bool:
         """Delete an image file. Returns True if successful."""
@@ -71,14 +151,89 @@ class FileService:
             Path(file_path).unlink(missing_ok=True)
             return True
         except Exception as e:
-            import logging
-
-            logging.info(f"Failed to delete image {file_path}: {e}")
+            logger.info(f"Failed to delete image {file_path}: {e}")
             return False
 
+    def get_rendition_path(self, renditions: Dict[str, str], min_size: int) -> Optional[str]:
+        """
+        Get the smallest rendition at least min_size pixels across, or the largest one
+        available for smaller images. Returns None if the image has no renditions on disk.
+        """
+        filename = self.select_rendition(renditions, min_size)
+        if filename is None:
+            return None
+        return self.get_image_path(filename)
+
+    @staticmethod
+    def select_rendition(renditions: Dict[str, str], min_size: int) -> Optional[str]:
+        """Filename of the smallest rendition at least min_size pixels across, or the largest available."""
+        sizes = sorted(int(size) for size in renditions)
+        if not sizes:
+            return None
+
+        size = next((s for s in sizes if s >= min_size), sizes[-1])
+        return renditions[str(size)]
+
     def get_image_path(self, filename: str) -> Optional[str]:
         """Get the full path to an uploaded image."""
-        file_path = self.UPLOAD_DIR / filename
+        file_path = self.store.path_for(filename)
         if file_path.exists():
             return str(file_path)
         return None
+
+    def _check_upload(self, content: ImageSource, filename: str) -> bool:
+        """Cheap checks on size and extension that need no decoding."""
+        if source_size(content) > self.MAX_FILE_SIZE:
+            return False
+
+        return self.is_allowed_filename(filename)
+
+    @classmethod
+    def is_allowed_filename(cls, filename: str) -> bool:
+        """Whether the file extension is one of the accepted image types."""
+        return Path(filename).suffix.lower() in cls.ALLOWED_EXTENSIONS
+
+    @classmethod
+    def is_archive(cls, filename: str) -> bool:
+        """Whether the file is an archive of images for bulk upload."""
+        return Path(filename).suffix.lower() in cls.ARCHIVE_EXTENSIONS
+
+    @classmethod
+    def max_upload_size(cls, filename: str) -> int:
+        """Size limit for an upload of the given name, before extraction or transcoding."""
+        return cls.MAX_ARCHIVE_SIZE if cls.is_archive(filename) else cls.MAX_FILE_SIZE
+
+    def _output_format(self, file_ext: str) -> str:
+        """Pillow format name used to encode files with the given extension."""
+        return Image.registered_extensions()[file_ext]
+
+    def _store(self, transcoded: TranscodedImage, file_ext: str) -> IngestedImage:
+        """Write transcoded image data to the content-addressed store."""
+        stored = self.store.put(transcoded.data, file_ext)
+
+        # Renditions derive from the stored bytes, so they share its content hash
+        renditions: Dict[str, str] = {}
+        for size, data in transcoded.renditions.items():
+            rendition_filename = f"{stored.content_hash}_{size}.{RENDITION_FORMAT.lower()}"
+            self.store.put_named(rendition_filename, data)
+            renditions[str(size)] = rendition_filename
+
+        inference_rendition = None
+        if transcoded.inference_rendition is not None:
+            inference = self.INFERENCE_RENDITION
+            inference_rendition = f"{stored.content_hash}_ai{inference.size}.{inference.format.lower()}"
+            self.store.put_named(inference_rendition, transcoded.inference_rendition)
+
+        return IngestedImage(
+            filename=stored.filename,
+            file_path=stored.file_path,
+            file_size=len(transcoded.data),
+            width=transcoded.width,
+            height=transcoded.height,
+            format=transcoded.format,
+            content_hash=stored.content_hash,
+            created=stored.created,
+            renditions=renditions,
+            perceptual_hash=transcoded.perceptual_hash,
+            inference_rendition=inference_rendition,
+        )
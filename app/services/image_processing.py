@@ -0,0 +1,313 @@
+"""CPU-bound image transcoding and the process pool that runs it off the event loop."""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from enum import Enum
+from io import BytesIO
+from pathlib import Path
+from typing import IO, Callable, Dict, Optional, Tuple, TypeVar, Union
+
+from PIL import Image
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "BMP"}
+RENDITION_FORMAT = "WEBP"
+RENDITION_QUALITY = 80
+# dHash grid: HASH_SIZE x HASH_SIZE comparisons give a 64-bit hash
+HASH_SIZE = 8
+
+# Raw upload data: bytes in memory, a path to a spooled file, or an open binary file.
+# Paths and files are decoded straight from disk, so the upload is never held in memory whole.
+ImageSource = Union[bytes, Path, IO[bytes]]
+
+
+def open_image(source: ImageSource) -> Image.Image:
+    """Open an image lazily; only the header is read until pixels are accessed."""
+    if isinstance(source, bytes):
+        return Image.open(BytesIO(source))
+    return Image.open(source)
+
+
+def source_size(source: ImageSource) -> int:
+    """Size of the raw upload in bytes."""
+    if isinstance(source, bytes):
+        return len(source)
+    if isinstance(source, Path):
+        return source.stat().st_size
+    return os.fstat(source.fileno()).st_size
+
+
+class ResampleQuality(str, Enum):
+    FAST = "fast"
+    BALANCED = "balanced"
+    BEST = "best"
+
+
+@dataclass(frozen=True)
+class ResampleSettings:
+    """How hard the transcoder works when shrinking an image."""
+
+    resample: Image.Resampling
+    # Decode/reduce to at least this multiple of the final size before the filtered resize
+    reducing_gap: float
+    optimize: bool
+
+
+RESAMPLE_SETTINGS: Dict[ResampleQuality, ResampleSettings] = {
+    ResampleQuality.FAST: ResampleSettings(Image.Resampling.BILINEAR, reducing_gap=1.0, optimize=False),
+    ResampleQuality.BALANCED: ResampleSettings(Image.Resampling.BICUBIC, reducing_gap=1.5, optimize=True),
+    ResampleQuality.BEST: ResampleSettings(Image.Resampling.LANCZOS, reducing_gap=3.0, optimize=True),
+}
+
+
+@dataclass(frozen=True)
+class InferenceSettings:
+    """Encoding of the rendition sent to the AI model in place of the stored image."""
+
+    # Longest side in pixels; 0 turns the rendition off
+    size: int
+    # Pillow format name
+    format: str
+    quality: int
+
+
+@dataclass(frozen=True)
+class TranscodedImage:
+    """Normalized image data produced by transcode_image."""
+
+    data: bytes
+    width: int
+    height: int
+    format: str
+    # Encoded WebP renditions keyed by their bounding-box size in pixels
+    renditions: Dict[int, bytes] = field(default_factory=dict)
+    # Difference hash of the normalized image, see perceptual_hash
+    perceptual_hash: Optional[str] = None
+    # Encoded inference rendition, if one was requested and differs from the normalized image
+    inference_rendition: Optional[bytes] = None
+
+
+def transcode_image(
+    content: ImageSource,
+    output_format: str,
+    max_size: Tuple[int, int],
+    quality: ResampleQuality = ResampleQuality.BALANCED,
+    rendition_sizes: Tuple[int, ...] = (),
+    inference: Optional[InferenceSettings] = None,
+) -> TranscodedImage:
+    """
+    Sniff, decode, resize and encode an image in one pass, plus any requested renditions
+    and the rendition for AI inference.
+    Kept free of service state so it can run in a worker process.
+    Raises ValueError for unsupported formats and PIL errors for corrupt data.
+    """
+    settings = RESAMPLE_SETTINGS[quality]
+
+    # Image.open only parses the header, so unknown formats are rejected before decoding
+    with open_image(content) as img:
+        if img.format not in ALLOWED_FORMATS:
+            raise ValueError(f"Unsupported image format: {img.format}")
+
+        # Must run before any pixel access so the JPEG decoder can scale in the DCT domain
+        _draft_for_target(img, max_size, settings.reducing_gap)
+
+        # Pixels are decoded once from here on; corrupt data fails during convert/resize/save.
+        # Convert to RGB if needed (for PNG with transparency, etc.)
+        normalized: Image.Image = img
+        if normalized.mode in ("RGBA", "P"):
+            normalized = normalized.convert("RGB")
+
+        # Resize if too large
+        if normalized.size[0] > max_size[0] or normalized.size[1] > max_size[1]:
+            reducing_gap = settings.reducing_gap if settings.reducing_gap > 1.0 else None
+            normalized.thumbnail(max_size, settings.resample, reducing_gap=reducing_gap)
+
+        # Encode image in memory
+        buffer = BytesIO()
+        normalized.save(buffer, format=output_format, optimize=settings.optimize, quality=85)
+        width, height = normalized.size
+
+        renditions = _encode_renditions(normalized, rendition_sizes, settings)
+        inference_rendition = _encode_inference_rendition(normalized, output_format, inference, settings)
+        phash = perceptual_hash(normalized)
+
+    return TranscodedImage(
+        data=buffer.getvalue(),
+        width=width,
+        height=height,
+        format=output_format,
+        renditions=renditions,
+        perceptual_hash=phash,
+        inference_rendition=inference_rendition,
+    )
+
+
+def perceptual_hash(img: Image.Image) -> str:
+    """
+    64-bit difference hash (dHash) as 16 hex characters. Each bit tells whether a pixel of a tiny
+    grayscale copy is brighter than its right-hand neighbour, so re-encoding, rescaling and small
+    shifts flip few bits and near-identical photos end up a short Hamming distance apart.
+    """
+    small = img.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX).convert("L")
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return f"{bits:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def _encode_renditions(img: Image.Image, sizes: Tuple[int, ...], settings: ResampleSettings) -> Dict[int, bytes]:
+    """
+    Build a WebP pyramid, each level downscaled from the one above it.
+    Levels larger than the image are skipped, except the smallest, so every image gets a thumbnail.
+    """
+    renditions: Dict[int, bytes] = {}
+    smallest = min(sizes, default=0)
+    current = img
+    for size in sorted(sizes, reverse=True):
+        if max(img.size) < size and size != smallest:
+            continue
+
+        level = current.copy()
+        level.thumbnail((size, size), settings.resample)
+        buffer = BytesIO()
+        level.save(buffer, format=RENDITION_FORMAT, quality=RENDITION_QUALITY)
+        renditions[size] = buffer.getvalue()
+        current = level
+
+    return renditions
+
+
+def _encode_inference_rendition(
+    img: Image.Image, output_format: str, inference: Optional[InferenceSettings], settings: ResampleSettings
+) -> Optional[bytes]:
+    """
+    Downscale and re-encode the normalized image for the AI model, which would shrink it to
+    about this size itself. None when the normalized image already fits in the same format.
+    """
+    if inference is None or inference.size <= 0:
+        return None
+    if max(img.size) <= inference.size and inference.format == output_format:
+        return None
+
+    rendition = img.copy()
+    rendition.thumbnail((inference.size, inference.size), settings.resample)
+    if rendition.mode not in ("RGB", "L"):
+        rendition = rendition.convert("RGB")
+    buffer = BytesIO()
+    rendition.save(buffer, format=inference.format, quality=inference.quality)
+    return buffer.getvalue()
+
+
+def _draft_for_target(img: Image.Image, max_size: Tuple[int, int], reducing_gap: float) -> None:
+    """
+    Configure reduced (1/2, 1/4, 1/8) JPEG decoding when the final size is a fraction of the source.
+    The decoded image stays at least reducing_gap times larger than the final size.
+    """
+    if img.format != "JPEG":
+        return
+
+    scale = min(max_size[0] / img.size[0], max_size[1] / img.size[1])
+    if scale >= 1.0:
+        return
+
+    requested = (max(1, int(img.size[0] * scale * reducing_gap)), max(1, int(img.size[1] * scale * reducing_gap)))
+    img.draft(img.mode, requested)
+
+
+# Workers start from a clean single-threaded server process rather than a fork of the app, which
+# runs threads (event loop, AI client, batcher) whose locks a forked child could inherit held
+POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+class ImageProcessingPool:
+    """
+    Runs transcoding in a process pool with a bounded number of in-flight jobs.
+    With zero workers, jobs run in the calling thread, which keeps tests deterministic.
+    A worker that dies, e.g. killed for running out of memory on a huge image, breaks the whole
+    executor; it is then replaced, and the jobs it took down are retried once on the new one.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = self._create_executor() if workers > 0 else None
+        self._executor_lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Run func(*args) in the pool, waiting for a free slot when the queue is full."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        async with self._slots:
+            executor = self._executor
+            if executor is None:
+                return func(*args)
+
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                return await loop.run_in_executor(self._replace_broken(executor), func, *args)
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+
+    def _replace_broken(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """The executor to retry on: a new one, unless another job replaced the broken one already."""
+        with self._executor_lock:
+            if self._executor is None:
+                raise BrokenProcessPool("Image processing pool is shut down")
+            if self._executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+                metrics.increment("image_pool.restarts")
+                logger.warning("Image processing worker died; replaced the pool")
+            return self._executor
+
+
+_pool: Optional[ImageProcessingPool] = None
+
+
+def get_image_pool() -> ImageProcessingPool:
+    """
+    Get the process-wide image pool, created on first use.
+    APP_IMAGE_WORKERS sets the pool size (0 runs in-thread) and
+    APP_IMAGE_QUEUE_DEPTH the number of jobs allowed to wait for a worker.
+    """
+    global _pool
+    if _pool is None:
+        workers = int(os.environ.get("APP_IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+        queue_depth = int(os.environ.get("APP_IMAGE_QUEUE_DEPTH", 2 * max(1, workers)))
+        _pool = ImageProcessingPool(workers, workers + queue_depth)
+        logger.info(f"Image processing pool started with {workers} workers, queue depth {queue_depth}")
+    return _pool
+
+
+def shutdown_image_pool() -> None:
+    """Shut down the process-wide image pool if it was started."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
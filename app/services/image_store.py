@@ -0,0 +1,148 @@
+"""Content-addressed storage for normalized image files."""
+
+import hashlib
+import heapq
+import os
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    """Location of a stored blob and whether this call wrote it."""
+
+    filename: str
+    file_path: str
+    content_hash: str
+    created: bool
+
+
+class StorageLayout(ABC):
+    """Maps a stored filename to its location relative to the store root."""
+
+    name: str
+
+    @abstractmethod
+    def relative_path(self, filename: str) -> Path: ...
+
+
+class FlatLayout(StorageLayout):
+    """Every file directly under the root."""
+
+    name = "flat"
+
+    def relative_path(self, filename: str) -> Path:
+        return Path(filename)
+
+
+class HashPrefixLayout(StorageLayout):
+    """
+    Fan files out by the leading characters of their (hex) name, e.g. ab/cd/abcdef....jpg.
+    Two levels of two characters give 65536 directories.
+    """
+
+    name = "sharded"
+
+    def __init__(self, levels: int = 2, width: int = 2):
+        self.levels = levels
+        self.width = width
+
+    def relative_path(self, filename: str) -> Path:
+        shards = [filename[i * self.width : (i + 1) * self.width] for i in range(self.levels)]
+        return Path(*shards, filename)
+
+
+LAYOUTS = {FlatLayout.name: FlatLayout, HashPrefixLayout.name: HashPrefixLayout}
+
+
+def get_layout(name: str) -> StorageLayout:
+    """Build a storage layout by name."""
+    layout_cls = LAYOUTS.get(name)
+    if layout_cls is None:
+        raise ValueError(f"Unknown upload layout: {name}")
+    return layout_cls()
+
+
+class ContentAddressedStore:
+    """
+    Stores each distinct image once, named after the hash of its normalized bytes.
+    Identical uploads resolve to the same file; callers track references in the database.
+    """
+
+    def __init__(self, root: Path, layout: StorageLayout):
+        self.root = root
+        self.layout = layout
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        """128-bit BLAKE2b digest of the data as hex."""
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def put(self, data: bytes, file_ext: str) -> StoredFile:
+        """Store data unless an identical blob already exists."""
+        digest = self.content_hash(data)
+        filename = f"{digest}{file_ext}"
+        file_path = self.path_for(filename)
+        created = self.put_named(filename, data)
+        return StoredFile(filename=filename, file_path=str(file_path), content_hash=digest, created=created)
+
+    def put_named(self, filename: str, data: bytes) -> bool:
+        """
+        Store data derived from a content-addressed blob (e.g. a rendition) under a given name.
+        Returns False if the file already existed.
+        """
+        file_path = self.path_for(filename)
+        try:
+            # A new reference to an existing file: refresh its mtime so it is inside the garbage
+            # collector's grace period until the referencing row is committed
+            os.utime(file_path)
+            return False
+        except FileNotFoundError:
+            pass
+
+        # Write to a temporary name first so readers never see a partial file
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = file_path.with_name(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, file_path)
+        return True
+
+    def path_for(self, filename: str) -> Path:
+        """Path where a stored file lives under the current layout."""
+        return self.root / self.layout.relative_path(filename)
+
+    def move_into_layout(self, source: Path, filename: str) -> Path:
+        """Move a file to where the current layout expects it. Returns the new path."""
+        target = self.path_for(filename)
+        if source != target:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(source, target)
+        return target
+
+    def iter_files(self) -> Iterator[os.DirEntry]:
+        """
+        Stream stored files in filename order, reading one directory at a time.
+        Shard directories are prefixes of the names inside them, so a sorted depth-first walk is
+        already in name order; files still at the top level (flat layout) are merged in.
+        Hidden entries (temporary files, partial uploads) are skipped.
+        """
+        entries = self._sorted_entries(self.root)
+        top_level = [entry for entry in entries if entry.is_file()]
+        shards = (file for entry in entries if entry.is_dir() for file in self._walk(Path(entry.path)))
+        yield from heapq.merge(top_level, shards, key=lambda entry: entry.name)
+
+    def _walk(self, directory: Path) -> Iterator[os.DirEntry]:
+        for entry in self._sorted_entries(directory):
+            if entry.is_dir():
+                yield from self._walk(Path(entry.path))
+            elif entry.is_file():
+                yield entry
+
+    @staticmethod
+    def _sorted_entries(directory: Path) -> List[os.DirEntry]:
+        with os.scandir(directory) as scan:
+            return sorted((entry for entry in scan if not entry.name.startswith(".")), key=lambda entry: entry.name)
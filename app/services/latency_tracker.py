@@ -0,0 +1,31 @@
+"""Rolling window of recent call latencies, for timeouts and hedging that follow the backend's actual speed."""
+
+import math
+import threading
+from collections import deque
+from typing import Deque, Optional
+
+
+class LatencyTracker:
+    """The last `window` latencies in seconds, with percentile queries. Safe to use from any thread."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency below which `fraction` of the recorded calls finished (nearest rank), or None without samples."""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        rank = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+        return ordered[rank]
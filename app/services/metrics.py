@@ -0,0 +1,33 @@
+"""Process-wide counters and gauges, exposed as JSON on /metrics."""
+
+import threading
+from typing import Dict
+
+
+class Metrics:
+    """Named numeric metrics. Counters only go up; gauges hold the latest value."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+
+    def increment(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0.0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, self._gauges.get(name, 0.0))
+
+    def snapshot(self) -> Dict[str, float]:
+        """All metrics, sorted by name."""
+        with self._lock:
+            return dict(sorted({**self._counters, **self._gauges}.items()))
+
+
+metrics = Metrics()
@@ -0,0 +1,140 @@
+"""
+Near-duplicate lookup by perceptual hash.
+
+Each user's images are kept in a BK-tree over the Hamming distance between their difference
+hashes, so finding every image within a few bits of a new one only visits the branches that can
+hold a match instead of comparing against all of the user's images. Trees are loaded from the
+database the first time a user needs one and kept for the most recently active users.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlmodel import col, select
+
+from app.database import get_session
+from app.models import FoodImage
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+
+@dataclass
+class _Node:
+    key: int
+    # Images sharing this exact hash
+    values: List[int]
+    children: Dict[int, "_Node"] = field(default_factory=dict)
+
+
+class BKTree:
+    """Integer keys under the Hamming metric; each key can carry several values."""
+
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: int, value: int) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = _Node(key, [value])
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(key, node.key)
+            if distance == 0:
+                node.values.append(value)
+                return
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _Node(key, [value])
+                return
+            node = child
+
+    def search(self, key: int, max_distance: int) -> List[Tuple[int, int]]:
+        """(distance, value) for every value within max_distance of key, closest first."""
+        matches: List[Tuple[int, int]] = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = hamming_distance(key, node.key)
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in node.values)
+            # By the triangle inequality, matches below a child lie within max_distance of its edge
+            for edge, child in node.children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+
+        return sorted(matches)
+
+
+class NearDuplicateIndex:
+    """Per-user BK-trees of FoodImage perceptual hashes, mapping to FoodImage ids."""
+
+    # Hashes at most this many bits apart (of 64) count as the same photo
+    MAX_DISTANCE = int(os.environ.get("APP_NEAR_DUPLICATE_DISTANCE", 6))
+    MAX_USERS = 1024
+
+    def __init__(self, max_users: int = MAX_USERS):
+        self.max_users = max_users
+        self._trees: "OrderedDict[int, BKTree]" = OrderedDict()
+        # Analyses run in worker threads
+        self._lock = threading.Lock()
+
+    def add(self, user_id: int, image_id: int, perceptual_hash: str) -> None:
+        """Index a newly stored image. Users whose tree is not loaded pick it up when it is."""
+        with self._lock:
+            tree = self._trees.get(user_id)
+            if tree is not None:
+                tree.add(int(perceptual_hash, 16), image_id)
+
+    def find(self, user_id: int, perceptual_hash: str, max_distance: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(distance, image id) of the user's images close to perceptual_hash, closest first."""
+        limit = self.MAX_DISTANCE if max_distance is None else max_distance
+        with self._lock:
+            return self._tree(user_id).search(int(perceptual_hash, 16), limit)
+
+    def forget(self, user_id: int) -> None:
+        """Drop a user's tree, e.g. after their images were removed; it is reloaded on next use."""
+        with self._lock:
+            self._trees.pop(user_id, None)
+
+    def _tree(self, user_id: int) -> BKTree:
+        tree = self._trees.get(user_id)
+        if tree is not None:
+            self._trees.move_to_end(user_id)
+            return tree
+
+        # Loaded while holding the lock, so an image added meanwhile cannot be missed
+        tree = BKTree()
+        with get_session() as session:
+            stmt = select(FoodImage.id, FoodImage.perceptual_hash).where(
+                FoodImage.user_id == user_id, col(FoodImage.perceptual_hash).is_not(None)
+            )
+            for image_id, perceptual_hash in session.exec(stmt):
+                if image_id is not None and perceptual_hash is not None:
+                    tree.add(int(perceptual_hash, 16), image_id)
+
+        self._trees[user_id] = tree
+        while len(self._trees) > self.max_users:
+            self._trees.popitem(last=False)
+        return tree
+
+
+_index: Optional[NearDuplicateIndex] = None
+
+
+def get_near_duplicate_index() -> NearDuplicateIndex:
+    """Get the process-wide near-duplicate index, created on first use."""
+    global _index
+    if _index is None:
+        _index = NearDuplicateIndex()
+    return _index
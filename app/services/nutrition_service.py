@@ -1,45 +1,227 @@
+import copy
+import logging
+import mmap
+import os
 import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import Dict, List, Optional, Any, Tuple
-from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, asc, col, desc, or_, select
 from app.database import get_session
 from app.models import NutritionalAnalysis, AllergenDetection, Allergen, FoodImage, AnalysisStatus
 from app.ai_client import get_ai_client
+from app.services.ai_batcher import get_ai_batcher
+from app.services.analysis_cache import get_analysis_cache, result_version
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.file_service import FileService
+from app.services.metrics import metrics
+from app.services.near_duplicates import get_near_duplicate_index
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Result fields carried over when a near-duplicate image reuses an earlier analysis
+REUSED_ANALYSIS_FIELDS = (
+    "food_items",
+    "confidence_score",
+    "calories",
+    "protein_g",
+    "carbohydrates_g",
+    "total_fat_g",
+    "saturated_fat_g",
+    "fiber_g",
+    "sugar_g",
+    "sodium_mg",
+    "estimated_portion_g",
+    "total_calories",
+    "vitamins",
+    "minerals",
+    "ai_model_used",
+)
+
+
+@dataclass(frozen=True)
+class AnalysisLease:
+    """
+    A worker's claim on an analysis. token is the attempt the claim started, so once the lease runs
+    out and the analysis is claimed again, the earlier worker can no longer renew it or write results.
+    """
+
+    analysis_id: int
+    token: int
 
 
 class NutritionAnalysisService:
     """Service for analyzing food images and extracting nutritional information."""
 
+    # How long a claimed analysis belongs to its worker
+    LEASE_SECONDS = int(os.environ.get("APP_ANALYSIS_LEASE_SECONDS", 300))
+    # Claims per analysis before one whose worker keeps disappearing is given up on
+    MAX_ATTEMPTS = int(os.environ.get("APP_ANALYSIS_MAX_ATTEMPTS", 3))
+
+    # In-flight AI calls by (content hash, model version), shared by every service instance
+    _in_flight: SingleFlight[Optional[Dict[str, Any]]] = SingleFlight()
+
     def __init__(self):
         self.ai_client = get_ai_client()
+        self.ai_batcher = get_ai_batcher()
+        self.file_service = FileService()
 
     def analyze_food_image(self, food_image_id: int) -> Optional[NutritionalAnalysis]:
         """
         Analyze a food image using AI and create nutritional analysis.
-        Returns the analysis record or None if failed.
+        Returns the analysis record or None if failed. Raises CircuitOpenError while the AI backend is down.
+        Runs the whole analysis in the caller; pages queue it through AnalysisQueue instead.
+        """
+        analysis = self.create_pending_analysis(food_image_id)
+        if analysis is None or analysis.id is None:
+            return None
+        return self.run_analysis(analysis.id)
+
+    def create_pending_analysis(self, food_image_id: int, priority: int = 0) -> Optional[NutritionalAnalysis]:
+        """
+        Record a PENDING analysis for a food image, to be claimed by a worker in priority order.
+        Returns None if the image does not exist.
         """
         with get_session() as session:
-            # Get the food image
-            food_image = session.get(FoodImage, food_image_id)
-            if not food_image:
+            if session.get(FoodImage, food_image_id) is None:
                 return None
 
-            # Create initial analysis record
             analysis = NutritionalAnalysis(
-                food_image_id=food_image_id, status=AnalysisStatus.PROCESSING, ai_model_used="food-vision-ai"
+                food_image_id=food_image_id,
+                status=AnalysisStatus.PENDING,
+                priority=priority,
+                ai_model_used=self.ai_client.model_version,
             )
             session.add(analysis)
             session.commit()
             session.refresh(analysis)
+            return analysis
+
+    def claim_next_analysis(self) -> Optional[AnalysisLease]:
+        """
+        Claim the highest-priority pending analysis, oldest first, for LEASE_SECONDS.
+        Rows locked by another process are skipped rather than waited on, so any number of
+        workers across processes can claim concurrently without taking the same job.
+        Returns the lease on the claimed analysis, or None if nothing is pending.
+        """
+        with get_session() as session:
+            stmt = (
+                select(NutritionalAnalysis)
+                .where(NutritionalAnalysis.status == AnalysisStatus.PENDING)
+                .order_by(desc(NutritionalAnalysis.priority), asc(NutritionalAnalysis.id))
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            analysis = session.exec(stmt).first()
+            if analysis is None or analysis.id is None:
+                return None
+
+            self._claim(analysis)
+            session.commit()
+            return AnalysisLease(analysis.id, analysis.attempts)
+
+    def renew_lease(self, lease: AnalysisLease) -> bool:
+        """Heartbeat from the worker running an analysis. Returns False if the lease is no longer its own."""
+        with get_session() as session:
+            analysis = self._leased_analysis(session, lease.analysis_id, lease.token)
+            if analysis is None:
+                return False
+
+            now = datetime.utcnow()
+            analysis.heartbeat_at = now
+            analysis.lease_expires_at = now + timedelta(seconds=self.LEASE_SECONDS)
+            session.commit()
+            return True
+
+    def reap_expired_analyses(self, batch_size: int = 100) -> Tuple[int, int]:
+        """
+        Recover analyses whose worker stopped heartbeating, e.g. because its process died.
+        Those with attempts left go back to PENDING; the rest are marked FAILED.
+        Rows left PROCESSING without a lease (from before leases existed) count as expired.
+        Returns the number of (requeued, failed) analyses.
+        """
+        requeued = failed = 0
+        with get_session() as session:
+            stmt = (
+                select(NutritionalAnalysis)
+                .where(
+                    NutritionalAnalysis.status == AnalysisStatus.PROCESSING,
+                    or_(
+                        col(NutritionalAnalysis.lease_expires_at).is_(None),
+                        col(NutritionalAnalysis.lease_expires_at) < datetime.utcnow(),
+                    ),
+                )
+                .order_by(asc(NutritionalAnalysis.id))
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            for analysis in session.exec(stmt).all():
+                self._release(analysis, f"Analysis did not finish after {analysis.attempts} attempts")
+                if analysis.status == AnalysisStatus.PENDING:
+                    requeued += 1
+                else:
+                    failed += 1
+            session.commit()
+
+        return requeued, failed
+
+    def run_analysis(self, analysis_id: int, token: Optional[int] = None) -> Optional[NutritionalAnalysis]:
+        """
+        Analyze the image of a claimed (or still pending) analysis and store the results.
+        token is that of the caller's lease; without one, a pending analysis is claimed here and one in
+        progress is run under its current claim.
+        Returns the finished (COMPLETED or FAILED) record, or None if it does not exist or the lease was
+        lost to another worker, whose results are the ones kept.
+        While the AI backend's circuit is open, the analysis is requeued right away, without counting
+        the attempt, and CircuitOpenError is raised so the caller can back off.
+        """
+        with get_session() as session:
+            analysis = session.get(NutritionalAnalysis, analysis_id)
+            if analysis is None:
+                return None
+            if analysis.status in (AnalysisStatus.COMPLETED, AnalysisStatus.FAILED):
+                return analysis
+            food_image_id = analysis.food_image_id
+            food_image = session.get(FoodImage, food_image_id)
+            if food_image is None:
+                return None
+
+            if analysis.status == AnalysisStatus.PENDING:
+                self._claim(analysis)
+                session.commit()
+                session.refresh(analysis)
+            if token is None:
+                token = analysis.attempts
 
             try:
                 start_time = time.time()
 
+                # A near-identical photo the user already had analyzed needs no new AI call
+                previous = self._find_near_duplicate_analysis(session, food_image)
+                if previous is not None:
+                    if self._leased_analysis(session, analysis_id, token) is None:
+                        return self._lease_lost(session, analysis_id)
+                    self._copy_analysis(session, previous, analysis)
+                    analysis.status = AnalysisStatus.COMPLETED
+                    analysis.processing_time_ms = int((time.time() - start_time) * 1000)
+                    analysis.lease_expires_at = None
+                    session.commit()
+                    session.refresh(analysis)
+                    metrics.increment("analysis.near_duplicate_hits")
+                    return analysis
+
                 # Analyze the image using DBRX
-                analysis_result = self._analyze_with_ai(food_image.file_path)
+                analysis_result = self._analyze_with_cache(food_image)
 
                 processing_time = int((time.time() - start_time) * 1000)
 
+                if self._leased_analysis(session, analysis_id, token) is None:
+                    return self._lease_lost(session, analysis_id)
+
                 if analysis_result:
                     # Update analysis with results
                     self._update_analysis_with_results(session, analysis, analysis_result, processing_time)
@@ -53,41 +235,171 @@ class NutritionAnalysisService:
                     analysis.error_message = "Failed to analyze image with AI"
 
                 analysis.processing_time_ms = processing_time
+                analysis.lease_expires_at = None
                 session.commit()
                 session.refresh(analysis)
 
                 return analysis
 
-            except Exception as e:
-                import logging
+            except CircuitOpenError:
+                # The AI backend is down: give the job back, without using up an attempt, rather than hold it
+                session.rollback()
+                analysis = self._leased_analysis(session, analysis_id, token)
+                if analysis is not None:
+                    analysis.attempts -= 1
+                    analysis.status = AnalysisStatus.PENDING
+                    analysis.lease_expires_at = None
+                    session.commit()
+                raise
 
-                logging.info(f"Error analyzing food image {food_image_id}: {str(e)}")
+            except Exception as e:
+                logger.info(f"Error analyzing food image {food_image_id}: {str(e)}")
+                session.rollback()
+                analysis = self._leased_analysis(session, analysis_id, token)
+                if analysis is None:
+                    return self._lease_lost(session, analysis_id)
                 analysis.status = AnalysisStatus.FAILED
                 analysis.error_message = str(e)[:1000]
+                analysis.lease_expires_at = None
                 session.commit()
                 session.refresh(analysis)
                 return analysis
 
-    def _analyze_with_ai(self, image_path: str) -> Optional[Dict[str, Any]]:
-        """Use AI client to analyze the food image."""
-        # Read image as base64
-        import base64
+    def _leased_analysis(self, session: Session, analysis_id: int, token: int) -> Optional[NutritionalAnalysis]:
+        """
+        The analysis, locked until the session commits, if it is still in progress under the claim
+        with this token; None once it was requeued, claimed again or finished by someone else.
+        """
+        stmt = (
+            select(NutritionalAnalysis)
+            .where(
+                NutritionalAnalysis.id == analysis_id,
+                NutritionalAnalysis.attempts == token,
+                NutritionalAnalysis.status == AnalysisStatus.PROCESSING,
+            )
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        return session.exec(stmt).first()
+
+    def _lease_lost(self, session: Session, analysis_id: int) -> None:
+        session.rollback()
+        metrics.increment("analysis.leases_lost")
+        logger.warning(f"Lease on analysis {analysis_id} was lost to another worker, dropping its results")
+
+    def _claim(self, analysis: NutritionalAnalysis) -> None:
+        now = datetime.utcnow()
+        analysis.status = AnalysisStatus.PROCESSING
+        analysis.attempts += 1
+        analysis.heartbeat_at = now
+        analysis.lease_expires_at = now + timedelta(seconds=self.LEASE_SECONDS)
+
+    def _release(self, analysis: NutritionalAnalysis, error_message: str) -> None:
+        """Hand a claimed analysis back to the queue, or fail it once it has used up its attempts."""
+        analysis.lease_expires_at = None
+        if analysis.attempts < self.MAX_ATTEMPTS:
+            analysis.status = AnalysisStatus.PENDING
+        else:
+            analysis.status = AnalysisStatus.FAILED
+            analysis.error_message = error_message
+
+    def _find_near_duplicate_analysis(self, session: Session, food_image: FoodImage) -> Optional[NutritionalAnalysis]:
+        """The completed analysis by the current model of the user's closest near-duplicate of food_image, if any."""
+        if food_image.perceptual_hash is None:
+            return None
+
+        matches = get_near_duplicate_index().find(food_image.user_id, food_image.perceptual_hash)
+        candidates = [image_id for _, image_id in matches if image_id != food_image.id]
+        if not candidates:
+            return None
+
+        # Only results of the current model: an upgrade must not keep serving the old model's answers
+        stmt = select(NutritionalAnalysis).where(
+            col(NutritionalAnalysis.food_image_id).in_(candidates),
+            NutritionalAnalysis.status == AnalysisStatus.COMPLETED,
+            NutritionalAnalysis.ai_model_used == self.ai_client.model_version,
+        )
+        by_image = {analysis.food_image_id: analysis for analysis in session.exec(stmt)}
+        return next((by_image[image_id] for image_id in candidates if image_id in by_image), None)
+
+    def _copy_analysis(self, session: Session, source: NutritionalAnalysis, target: NutritionalAnalysis) -> None:
+        """Copy the results and allergen detections of source onto target."""
+        for name in REUSED_ANALYSIS_FIELDS:
+            setattr(target, name, getattr(source, name))
+
+        stmt = select(AllergenDetection).where(AllergenDetection.nutritional_analysis_id == source.id)
+        for detection in session.exec(stmt).all():
+            if target.id is not None:
+                session.add(
+                    AllergenDetection(
+                        nutritional_analysis_id=target.id,
+                        allergen_id=detection.allergen_id,
+                        confidence_score=detection.confidence_score,
+                        detected_in=detection.detected_in,
+                    )
+                )
+
+    def _analyze_with_cache(self, food_image: FoodImage) -> Optional[Dict[str, Any]]:
+        """
+        AI result for the image, from the cache when the same content was analyzed by this model, at the same
+        inference rendition settings, before.
+        Concurrent analyses of the same content (several tabs, retry storms) share one AI call.
+        """
+        if food_image.content_hash is None:
+            return self._analyze_with_ai(self._inference_image_path(food_image))
+
+        key = (
+            food_image.content_hash,
+            result_version(self.ai_client.model_version, self.file_service.INFERENCE_RENDITION),
+        )
+        result, shared = self._in_flight.do(key, lambda: self._analyze_uncached(food_image, *key))
+        if shared:
+            metrics.increment("analysis.coalesced")
+            # Each caller gets its own copy to update its analysis from
+            return copy.deepcopy(result)
+        return result
+
+    def _analyze_uncached(self, food_image: FoodImage, content_hash: str, version: str) -> Optional[Dict[str, Any]]:
+        cache = get_analysis_cache()
+        cached = cache.get(content_hash, version)
+        if cached is not None:
+            return cached
+
+        result = self._analyze_with_ai(self._inference_image_path(food_image))
+        if result is not None:
+            cache.put(content_hash, version, result)
+        return result
+
+    def _inference_image_path(self, food_image: FoodImage) -> str:
+        """The image to send to the AI model: its inference rendition, or the stored image if it has none."""
+        if food_image.inference_rendition is not None:
+            rendition_path = self.file_service.get_image_path(food_image.inference_rendition)
+            if rendition_path is not None:
+                return rendition_path
+        return food_image.file_path
 
+    def _analyze_with_ai(self, image_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Use AI client to analyze the food image.
+        The stored file is memory-mapped and handed over as a view, so it is not copied onto the
+        heap; only clients whose transport needs text base64-encode it, straight from the mapping.
+        """
         try:
+            # The mapping stays valid after the file is closed
             with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode()
+                mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
         except Exception as e:
-            import logging
-
-            logging.info(f"Error reading image file {image_path}: {e}")
+            logger.info(f"Error reading image file {image_path}: {e}")
             return None
 
         try:
-            return self.ai_client.analyze_food_image(image_data)
+            with mapped, memoryview(mapped) as image_data:
+                # Sent along with other analyses in flight, for backends that take batches
+                return self.ai_batcher.analyze(image_data)
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            import logging
-
-            logging.info(f"Error analyzing image with AI: {e}")
+            logger.info(f"Error analyzing image with AI: {e}")
             return None
 
     def _update_analysis_with_results(
@@ -123,23 +435,16 @@ class NutritionAnalysisService:
     def _create_allergen_detections(
         self, session: Session, analysis: NutritionalAnalysis, detected_allergens: List[Dict[str, Any]]
     ) -> None:
-        """Create allergen detection records."""
+        """
+        Create allergen detection records. Nothing is committed here: the caller commits them along with
+        the analysis, in the transaction that holds the analysis' lease.
+        """
         for allergen_data in detected_allergens:
             allergen_name = allergen_data.get("name", "").lower().strip()
             if not allergen_name:
                 continue
 
-            # Get or create allergen
-            stmt = select(Allergen).where(Allergen.name == allergen_name)
-            allergen = session.exec(stmt).first()
-
-            if not allergen:
-                allergen = Allergen(
-                    name=allergen_name, description=f"Common allergen: {allergen_name}", severity_level="moderate"
-                )
-                session.add(allergen)
-                session.commit()
-                session.refresh(allergen)
+            allergen = self._get_or_create_allergen(session, allergen_name)
 
             # Create detection record
             if analysis.id and allergen.id:
@@ -151,7 +456,33 @@ class NutritionAnalysisService:
                 )
                 session.add(detection)
 
-        session.commit()
+    def _get_or_create_allergen(self, session: Session, name: str) -> Allergen:
+        """
+        The allergen with this name, created if it is new. Workers that detect the same new allergen at
+        once both try to insert it; the loser's insert is rolled back to a savepoint and it uses the
+        winner's row.
+        """
+        allergen = self._find_allergen(session, name)
+        if allergen is not None:
+            return allergen
+
+        try:
+            with session.begin_nested():
+                allergen = Allergen(name=name, description=f"Common allergen: {name}", severity_level="moderate")
+                session.add(allergen)
+        except IntegrityError:
+            allergen = self._find_allergen(session, name)
+            if allergen is None:
+                raise
+        return allergen
+
+    def _find_allergen(self, session: Session, name: str) -> Optional[Allergen]:
+        return session.exec(select(Allergen).where(Allergen.name == name)).first()
+
+    def get_analysis(self, analysis_id: int) -> Optional[NutritionalAnalysis]:
+        """Get an analysis by id."""
+        with get_session() as session:
+            return session.get(NutritionalAnalysis, analysis_id)
 
     def get_analysis_with_allergens(
         self, analysis_id: int
@@ -174,7 +505,8 @@ class NutritionAnalysisService:
             return analysis, list(allergen_detections)
 
     def get_recent_analyses(self, limit: int = 10) -> List[NutritionalAnalysis]:
-        """Get recent nutritional analyses."""
+        """Get recent nutritional analyses, with their food images loaded for thumbnails."""
         with get_session() as session:
-            stmt = select(NutritionalAnalysis).limit(limit)
+            food_image = selectinload(NutritionalAnalysis.food_image)  # type: ignore[arg-type]
+            stmt = select(NutritionalAnalysis).options(food_image).limit(limit)
             return list(session.exec(stmt).all())
@@ -0,0 +1,204 @@
+"""
+Resumable, chunked uploads.
+
+A client opens a session with the file's name and size, then appends chunks at the offset
+the server reports, each with a checksum. A dropped connection only costs the chunk in
+flight: the client asks for the current offset and continues from there. Completed files
+are handed over as a SpooledUpload, so they go through the regular ingestion path.
+Sessions that see no progress for EXPIRY_SECONDS are removed by sweep_expired().
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterable, Callable, Optional, Set
+
+from app.services.file_service import FileService
+from app.services.upload_spool import SpooledUpload, UploadTooLargeError
+
+logger = logging.getLogger(__name__)
+
+# Session ids are random 128-bit hex strings; knowing one is what authorizes access to it
+SESSION_ID_LENGTH = 32
+
+
+class UploadSessionError(ValueError):
+    """Base class for errors in the resumable upload protocol."""
+
+
+class UploadSessionNotFoundError(UploadSessionError):
+    pass
+
+
+class OffsetMismatchError(UploadSessionError):
+    """The chunk does not start where the stored data ends."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+
+class ChecksumMismatchError(UploadSessionError):
+    pass
+
+
+@dataclass
+class UploadSession:
+    id: str
+    filename: str
+    size: int
+    offset: int
+    created: float
+
+    @property
+    def complete(self) -> bool:
+        return self.offset == self.size
+
+
+class ResumableUploadStore:
+    """
+    Partial uploads on disk: <id>.part holds the bytes received so far, so its length is the
+    offset, and <id>.json holds the declared name and size.
+    """
+
+    CHUNK_SIZE = 1024 * 1024  # 1MB, suggested to clients
+    EXPIRY_SECONDS = int(os.environ.get("APP_UPLOAD_EXPIRY_SECONDS", 24 * 60 * 60))
+    SWEEP_INTERVAL_SECONDS = 60 * 60
+    CHECKSUM_ALGORITHMS = ("sha256", "crc32")
+
+    def __init__(self, root: Path, size_limit: Callable[[str], int]):
+        self.root = root
+        # Largest upload accepted for a given filename
+        self.size_limit = size_limit
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Sessions with a chunk being written; a second writer would race on the offset
+        self._writing: Set[str] = set()
+
+    def create(self, filename: str, size: int) -> UploadSession:
+        """Open a new upload session for a file of the given size."""
+        max_size = self.size_limit(filename)
+        if size <= 0 or size > max_size:
+            raise UploadTooLargeError(f"Upload size must be between 1 and {max_size} bytes")
+
+        session = UploadSession(
+            id=uuid.uuid4().hex, filename=Path(filename).name, size=size, offset=0, created=time.time()
+        )
+        self._data_path(session.id).touch()
+        metadata = {"filename": session.filename, "size": session.size, "created": session.created}
+        self._metadata_path(session.id).write_text(json.dumps(metadata))
+        return session
+
+    def get(self, session_id: str) -> Optional[UploadSession]:
+        """Look up a session and its current offset. Returns None for unknown or expired sessions."""
+        if len(session_id) != SESSION_ID_LENGTH or not all(c in "0123456789abcdef" for c in session_id):
+            return None
+
+        try:
+            metadata = json.loads(self._metadata_path(session_id).read_text())
+            offset = self._data_path(session_id).stat().st_size
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return UploadSession(id=session_id, offset=offset, **metadata)
+
+    async def append(self, session_id: str, offset: int, checksum: str, chunks: AsyncIterable[bytes]) -> UploadSession:
+        """
+        Append a chunk at offset, verifying it against checksum ("<algorithm> <hex digest>").
+        A chunk that fails the checksum, or is cut off, is discarded so the client can resend it.
+        """
+        session = self.get(session_id)
+        if session is None:
+            raise UploadSessionNotFoundError(f"Unknown upload session: {session_id}")
+        if offset != session.offset or session_id in self._writing:
+            raise OffsetMismatchError(session.offset)
+
+        algorithm, _, expected = checksum.partition(" ")
+        if algorithm not in self.CHECKSUM_ALGORITHMS or not expected:
+            raise ChecksumMismatchError(f"Unsupported checksum: {checksum}")
+
+        digest = hashlib.sha256() if algorithm == "sha256" else None
+        crc = 0
+        size = offset
+        self._writing.add(session_id)
+        try:
+            with self._data_path(session_id).open("r+b") as file:
+                file.seek(offset)
+                try:
+                    async for chunk in chunks:
+                        size += len(chunk)
+                        if size > session.size:
+                            raise UploadTooLargeError(f"Upload exceeds its declared size of {session.size} bytes")
+                        if digest is not None:
+                            digest.update(chunk)
+                        else:
+                            crc = zlib.crc32(chunk, crc)
+                        file.write(chunk)
+
+                    actual = digest.hexdigest() if digest is not None else f"{crc:08x}"
+                    if actual != expected.lower():
+                        raise ChecksumMismatchError(f"Chunk at offset {offset} failed its {algorithm} check")
+                except BaseException:
+                    # Also covers client disconnects mid-chunk: keep only the verified prefix
+                    file.truncate(offset)
+                    raise
+        finally:
+            self._writing.discard(session_id)
+
+        session.offset = size
+        return session
+
+    def finish(self, session_id: str) -> SpooledUpload:
+        """Hand a completed upload over for ingestion. The caller owns (and must close) the result."""
+        session = self.get(session_id)
+        if session is None:
+            raise UploadSessionNotFoundError(f"Unknown upload session: {session_id}")
+        if not session.complete:
+            raise OffsetMismatchError(session.offset)
+
+        self._metadata_path(session_id).unlink(missing_ok=True)
+        return SpooledUpload.from_path(self._data_path(session_id), session.filename)
+
+    def sweep_expired(self, now: Optional[float] = None) -> int:
+        """Remove sessions that have not received data within EXPIRY_SECONDS. Returns the number removed."""
+        cutoff = (now or time.time()) - self.EXPIRY_SECONDS
+        removed = 0
+        # Finished sessions have no metadata left; their data is only here if ingestion never closed it
+        for data_path in self.root.glob("*.part"):
+            metadata_path = data_path.with_suffix(".json")
+            mtimes = [path.stat().st_mtime for path in (data_path, metadata_path) if path.exists()]
+            if max(mtimes, default=0.0) < cutoff:
+                data_path.unlink(missing_ok=True)
+                metadata_path.unlink(missing_ok=True)
+                removed += 1
+
+        if removed:
+            logger.info(f"Removed {removed} expired upload sessions")
+        return removed
+
+    def _data_path(self, session_id: str) -> Path:
+        return self.root / f"{session_id}.part"
+
+    def _metadata_path(self, session_id: str) -> Path:
+        return self.root / f"{session_id}.json"
+
+
+_store: Optional[ResumableUploadStore] = None
+
+
+def get_resumable_store() -> ResumableUploadStore:
+    """Get the process-wide resumable upload store, created on first use."""
+    global _store
+    if _store is None:
+        _store = ResumableUploadStore(FileService.UPLOAD_DIR / ".partial", FileService.max_upload_size)
+    return _store
+
+
+def sweep_expired_uploads() -> None:
+    """Periodic task removing stale upload sessions."""
+    get_resumable_store().sweep_expired()
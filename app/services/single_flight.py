@@ -0,0 +1,43 @@
+"""Coalescing of concurrent identical calls, so only one of them does the work."""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Generic, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Runs func once per key at a time: calls arriving while one with the same key is in flight
+    wait for it and get its result (or exception) instead of running func themselves.
+    Safe to use from any number of threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> Tuple[T, bool]:
+        """Returns func's result and whether it came from another caller's call."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            return call.result(), True
+
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            # Later calls start a new flight, e.g. to retry after a failure
+            with self._lock:
+                del self._calls[key]
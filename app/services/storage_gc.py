@@ -0,0 +1,230 @@
+"""
+Reconciliation of stored files against food_images rows.
+
+Stored files and rows are both streamed in filename order, in batches, and merge-joined on the
+content hash every stored name starts with (renditions included), so neither side is ever held
+in memory in full. Files that no row refers to are deleted once they are older than the grace
+period, which covers uploads whose row is not committed yet. Rows whose file is gone are
+reported; they still hold the user's analysis, so removing them is left to a person.
+
+Run with: python -m app.services.storage_gc [--batch-size N] [--grace-seconds S] [--dry-run]
+"""
+
+import argparse
+import logging
+import os
+import time
+from dataclasses import dataclass
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple, TypeVar
+
+from nicegui import run
+from sqlalchemy import tuple_
+from sqlmodel import asc, col, select
+
+from app.database import get_session
+from app.models import FoodImage
+from app.services.file_service import FileService
+from app.services.image_store import ContentAddressedStore
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Stored names start with a 32 hex character content hash (or uuid, for older uploads)
+KEY_LENGTH = 32
+
+GC_INTERVAL_SECONDS = int(os.environ.get("APP_STORAGE_GC_INTERVAL_SECONDS", 6 * 60 * 60))
+GRACE_SECONDS = 60 * 60
+
+
+@dataclass
+class GCStats:
+    files_scanned: int = 0
+    rows_scanned: int = 0
+    orphan_files: int = 0
+    orphan_bytes: int = 0
+    files_deleted: int = 0
+    # Orphans inside the grace period, or files found out of name order
+    files_skipped: int = 0
+    orphan_rows: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_scanned / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_scanned / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+@dataclass(frozen=True)
+class RowRef:
+    id: int
+    filename: str
+    file_path: str
+
+
+def collect_garbage(
+    store: ContentAddressedStore, batch_size: int = 1000, grace_seconds: int = GRACE_SECONDS, dry_run: bool = False
+) -> GCStats:
+    """Delete stored files no row refers to and report rows whose file is missing."""
+    stats = GCStats()
+    started = time.monotonic()
+    cutoff = time.time() - grace_seconds
+
+    files = _groups(_in_order(store.iter_files(), lambda entry: entry.name[:KEY_LENGTH], stats))
+    rows = _groups(_iter_rows(batch_size))
+    file_group = next(files, None)
+    row_group = next(rows, None)
+
+    while file_group is not None or row_group is not None:
+        if row_group is None or (file_group is not None and file_group[0] < row_group[0]):
+            assert file_group is not None
+            for entry in file_group[1]:
+                stats.files_scanned += 1
+                _collect_file(entry, cutoff, stats, dry_run)
+            file_group = next(files, None)
+        elif file_group is None or row_group[0] < file_group[0]:
+            for row in row_group[1]:
+                stats.rows_scanned += 1
+                _report_row(row, stats)
+            row_group = next(rows, None)
+        else:
+            stored_paths = set()
+            for entry in file_group[1]:
+                stats.files_scanned += 1
+                stored_paths.add(entry.path)
+            for row in row_group[1]:
+                stats.rows_scanned += 1
+                # Rows not yet migrated to the current layout point elsewhere
+                if row.file_path not in stored_paths and not Path(row.file_path).exists():
+                    _report_row(row, stats)
+            file_group = next(files, None)
+            row_group = next(rows, None)
+
+    stats.elapsed_seconds = time.monotonic() - started
+    _publish(stats, dry_run)
+    return stats
+
+
+def _iter_rows(batch_size: int) -> Iterator[Tuple[str, RowRef]]:
+    """Stream (key, row) in filename order, one keyset-paginated batch per session."""
+    last_filename, last_id = "", 0
+    while True:
+        with get_session() as session:
+            stmt = (
+                select(FoodImage.id, FoodImage.filename, FoodImage.file_path)
+                # A row comparison, so the database can seek ix_food_images_filename_id to the next batch
+                .where(tuple_(col(FoodImage.filename), col(FoodImage.id)) > tuple_(last_filename, last_id))
+                .order_by(asc(FoodImage.filename), asc(FoodImage.id))
+                .limit(batch_size)
+            )
+            batch = list(session.exec(stmt).all())
+        if not batch:
+            return
+
+        previous_key = ""
+        for row_id, filename, file_path in batch:
+            key = filename[:KEY_LENGTH]
+            if key < previous_key:
+                # Deleting on a misordered stream would remove referenced files
+                raise RuntimeError("food_images.filename does not sort in byte order; check the column collation")
+            previous_key = key
+            yield key, RowRef(id=row_id or 0, filename=filename, file_path=file_path)
+
+        last_filename, last_id = batch[-1][1], batch[-1][0] or 0
+
+
+def _in_order(
+    entries: Iterator[os.DirEntry], key: Callable[[os.DirEntry], str], stats: GCStats
+) -> Iterator[Tuple[str, os.DirEntry]]:
+    """Pair entries with their key, dropping (and never deleting) any that break the order."""
+    previous_key = ""
+    for entry in entries:
+        entry_key = key(entry)
+        if entry_key < previous_key:
+            logger.warning(f"Skipping misplaced file {entry.path}; run the storage migration to fix the layout")
+            stats.files_skipped += 1
+            continue
+        previous_key = entry_key
+        yield entry_key, entry
+
+
+def _groups(pairs: Iterator[Tuple[str, T]]) -> Iterator[Tuple[str, List[T]]]:
+    for key, group in groupby(pairs, key=lambda pair: pair[0]):
+        yield key, [item for _, item in group]
+
+
+def _collect_file(entry: os.DirEntry, cutoff: float, stats: GCStats, dry_run: bool) -> None:
+    try:
+        stat = entry.stat()
+    except FileNotFoundError:
+        return
+
+    if stat.st_mtime > cutoff:
+        stats.files_skipped += 1
+        return
+
+    stats.orphan_files += 1
+    stats.orphan_bytes += stat.st_size
+    if dry_run:
+        logger.info(f"Would delete orphaned file {entry.path}")
+        return
+
+    try:
+        os.unlink(entry.path)
+        stats.files_deleted += 1
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to delete orphaned file {entry.path}: {e}")
+
+
+def _report_row(row: RowRef, stats: GCStats) -> None:
+    stats.orphan_rows += 1
+    logger.warning(f"Food image {row.id} refers to a missing file: {row.file_path}")
+
+
+def _publish(stats: GCStats, dry_run: bool) -> None:
+    logger.info(
+        f"Storage GC{' (dry run)' if dry_run else ''}: {stats}, "
+        f"{stats.files_per_second:.0f} files/s, {stats.rows_per_second:.0f} rows/s"
+    )
+    metrics.set_gauge("storage_gc.orphan_files", stats.orphan_files)
+    metrics.set_gauge("storage_gc.orphan_bytes", stats.orphan_bytes)
+    metrics.set_gauge("storage_gc.orphan_rows", stats.orphan_rows)
+    metrics.set_gauge("storage_gc.files_per_second", stats.files_per_second)
+    metrics.set_gauge("storage_gc.rows_per_second", stats.rows_per_second)
+    metrics.set_gauge("storage_gc.last_run_seconds", stats.elapsed_seconds)
+    metrics.increment("storage_gc.files_deleted", stats.files_deleted)
+
+
+async def collect_garbage_periodically() -> None:
+    """Background run of collect_garbage, off the event loop."""
+    try:
+        await run.io_bound(collect_garbage, FileService().store)
+    except Exception as e:
+        logger.error(f"Storage GC failed: {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Delete orphaned uploads and report rows with missing files.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per query")
+    parser.add_argument(
+        "--grace-seconds", type=int, default=GRACE_SECONDS, help="leave orphans younger than this alone"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="report orphans without deleting anything")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    collect_garbage(
+        FileService().store, batch_size=args.batch_size, grace_seconds=args.grace_seconds, dry_run=args.dry_run
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+One-shot migration of stored uploads into the configured directory layout.
+
+Moves every file referenced by food_images (and its renditions) to the path the current
+layout expects, rewriting FoodImage.file_path in batched transactions, then moves any
+remaining top-level files. Safe to re-run: rows and files already in place are skipped.
+
+Run with: python -m app.services.storage_migration [--batch-size N] [--dry-run]
+"""
+
+import argparse
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from sqlmodel import asc, col, select
+
+from app.database import get_session
+from app.models import FoodImage
+from app.services.file_service import FileService
+from app.services.image_store import ContentAddressedStore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MigrationStats:
+    rows_scanned: int = 0
+    rows_updated: int = 0
+    files_moved: int = 0
+    files_missing: int = 0
+
+
+def migrate_uploads(store: ContentAddressedStore, batch_size: int = 500, dry_run: bool = False) -> MigrationStats:
+    """Move files into the store's layout and point FoodImage rows at their new paths."""
+    stats = MigrationStats()
+    last_id = 0
+    # A dry run leaves files where they are, so the final sweep must not count them twice
+    planned: Set[Path] = set()
+
+    while True:
+        with get_session() as session:
+            stmt = select(FoodImage).where(col(FoodImage.id) > last_id).order_by(asc(FoodImage.id)).limit(batch_size)
+            batch = list(session.exec(stmt).all())
+            if not batch:
+                break
+
+            # Deduplicated rows share a file, so remember where each one went within the batch
+            moved: Dict[str, str] = {}
+            for food_image in batch:
+                stats.rows_scanned += 1
+                target = store.path_for(food_image.filename)
+                if food_image.file_path == str(target):
+                    continue
+
+                new_path = moved.get(food_image.file_path)
+                if new_path is None and Path(food_image.file_path) in planned:
+                    new_path = str(target)
+                if new_path is None:
+                    new_path = _move_file(store, Path(food_image.file_path), food_image.filename, stats, dry_run)
+                    if new_path is None:
+                        continue
+                    # Renditions, the inference one included, live next to the original
+                    renditions = list((food_image.renditions or {}).values())
+                    if food_image.inference_rendition is not None:
+                        renditions.append(food_image.inference_rendition)
+                    for rendition in renditions:
+                        rendition_source = Path(food_image.file_path).parent / rendition
+                        if rendition_source.exists():
+                            _move_file(store, rendition_source, rendition, stats, dry_run)
+                            if dry_run:
+                                planned.add(rendition_source)
+                    moved[food_image.file_path] = new_path
+                    if dry_run:
+                        planned.add(Path(food_image.file_path))
+
+                food_image.file_path = new_path
+                stats.rows_updated += 1
+
+            last_id = batch[-1].id or last_id
+            if dry_run:
+                session.rollback()
+            else:
+                session.commit()
+            logger.info(f"Migrated batch up to food image {last_id}: {stats}")
+
+    # Files no row refers to (e.g. leaked uploads) still belong in the layout
+    for source in sorted(store.root.iterdir()):
+        if source in planned or not source.is_file() or source.name.startswith("."):
+            continue
+        if store.path_for(source.name) != source:
+            _move_file(store, source, source.name, stats, dry_run)
+
+    return stats
+
+
+def _move_file(
+    store: ContentAddressedStore, source: Path, filename: str, stats: MigrationStats, dry_run: bool
+) -> Optional[str]:
+    """Move one file into place. Returns the new path, or None if the file is gone."""
+    target = store.path_for(filename)
+    if source.exists():
+        if not dry_run:
+            store.move_into_layout(source, filename)
+        stats.files_moved += 1
+        return str(target)
+
+    # An earlier, interrupted run may already have moved it
+    if target.exists():
+        return str(target)
+
+    logger.warning(f"Stored file missing, leaving row untouched: {source}")
+    stats.files_missing += 1
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move uploads into the configured directory layout.")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without touching anything")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    store = FileService().store
+    logger.info(f"Migrating {store.root} to the {store.layout.name} layout")
+    stats = migrate_uploads(store, batch_size=args.batch_size, dry_run=args.dry_run)
+    logger.info(f"Done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Spooling of incoming uploads to temporary files, so request bodies are never held in memory whole."""
+
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import IO, BinaryIO, Callable, List, Optional
+
+CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class UploadTooLargeError(ValueError):
+    """The upload exceeded the size limit while it was being spooled."""
+
+
+class SpooledUpload:
+    """
+    An upload held in a file on disk, deleted on close.
+    Hand the path (or the open file) to FileService; both are decoded straight from disk.
+    """
+
+    def __init__(self, file: IO[bytes], filename: str, size: int):
+        self.file = file
+        self.filename = filename
+        self.size = size
+
+    @classmethod
+    def from_path(cls, path: Path, filename: str) -> "SpooledUpload":
+        """Take ownership of an existing file, e.g. a completed resumable upload."""
+        return cls(path.open("rb"), filename, path.stat().st_size)
+
+    @property
+    def path(self) -> Path:
+        return Path(self.file.name)
+
+    def read(self) -> bytes:
+        """Read the whole upload into memory. Only for callers that genuinely need bytes."""
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+        # Temporary files are already gone; adopted files are removed here
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def spool_upload(
+    source: BinaryIO, filename: str, max_size: int, chunk_size: int = CHUNK_SIZE, directory: Optional[Path] = None
+) -> SpooledUpload:
+    """
+    Copy an upload stream to a temporary file chunk by chunk.
+    Raises UploadTooLargeError as soon as more than max_size bytes have been read.
+    """
+    spool = tempfile.NamedTemporaryFile(prefix="upload-", suffix=Path(filename).suffix.lower(), dir=directory)
+    size = 0
+    try:
+        while chunk := source.read(chunk_size):
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(f"Upload {filename} exceeds {max_size} bytes")
+            spool.write(chunk)
+        spool.flush()
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return SpooledUpload(spool, filename, size)
+
+
+def expand_archive(
+    upload: SpooledUpload, max_size: int, max_files: int, is_allowed: Callable[[str], bool]
+) -> List[SpooledUpload]:
+    """
+    Spool the allowed files inside a ZIP upload, each checked against max_size while it is extracted,
+    so the sizes the archive declares are never trusted. Other members are skipped. Raises
+    UploadTooLargeError for oversized members or more than max_files, and zipfile.BadZipFile.
+    """
+    uploads: List[SpooledUpload] = []
+    try:
+        with zipfile.ZipFile(upload.file) as archive:
+            for info in archive.infolist():
+                filename = Path(info.filename).name
+                if info.is_dir() or filename.startswith(".") or "__MACOSX" in info.filename:
+                    continue
+                if not is_allowed(filename):
+                    continue
+                if len(uploads) >= max_files:
+                    raise UploadTooLargeError(f"Archive {upload.filename} holds more than {max_files} images")
+                with archive.open(info) as member:
+                    uploads.append(spool_upload(member, filename, max_size))
+    except BaseException:
+        for extracted in uploads:
+            extracted.close()
+        raise
+
+    return uploads
@@ -1,8 +1,20 @@
-from typing import Optional, List
-from sqlmodel import select
+import asyncio
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Optional, List, Sequence, Tuple, Union
+from sqlmodel import func, select
 from app.database import get_session
 from app.models import User, FoodImage, UserCreate, UserUpdate
-from app.services.file_service import FileService
+from app.services.file_service import FileService, IngestedImage
+from app.services.image_processing import ImageSource
+from app.services.near_duplicates import get_near_duplicate_index
+
+
+class BulkItemStatus(str, Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    STORED = "stored"
+    FAILED = "failed"
 
 
 class UserService:
@@ -51,36 +63,33 @@ class UserService:
             return user
 
     def create_food_image(
-        self, user_id: int, content: bytes, original_filename: str, source_type: str = "upload"
+        self, user_id: int, content: ImageSource, original_filename: str, source_type: str = "upload"
     ) -> Optional[FoodImage]:
         """Create a new food image record after saving the file."""
-        # Validate and save the image file
-        if not self.file_service.validate_image_file(content, original_filename):
+        try:
+            # Validate, normalize and save the image file in one pass
+            ingested = self.file_service.ingest_image(content, original_filename)
+            if ingested is None:
+                return None
+
+            return self._create_food_image_record(user_id, ingested, original_filename, source_type)
+
+        except Exception as e:
+            import logging
+
+            logging.info(f"Error creating food image: {e}")
             return None
 
+    async def create_food_image_async(
+        self, user_id: int, content: Union[bytes, Path], original_filename: str, source_type: str = "upload"
+    ) -> Optional[FoodImage]:
+        """Create a new food image record, transcoding the file off the event loop."""
         try:
-            filename, file_path, file_size, width, height = self.file_service.save_image(content, original_filename)
-
-            # Get MIME type
-            mime_type = self._get_mime_type(original_filename)
+            ingested = await self.file_service.ingest_image_async(content, original_filename)
+            if ingested is None:
+                return None
 
-            # Create database record
-            with get_session() as session:
-                food_image = FoodImage(
-                    filename=filename,
-                    original_filename=original_filename,
-                    file_path=file_path,
-                    file_size=file_size,
-                    mime_type=mime_type,
-                    source_type=source_type,  # type: ignore[arg-type]
-                    width=width,
-                    height=height,
-                    user_id=user_id,
-                )
-                session.add(food_image)
-                session.commit()
-                session.refresh(food_image)
-                return food_image
+            return self._create_food_image_record(user_id, ingested, original_filename, source_type)
 
         except Exception as e:
             import logging
@@ -88,6 +97,73 @@ class UserService:
             logging.info(f"Error creating food image: {e}")
             return None
 
+    async def create_food_images_bulk(
+        self,
+        user_id: int,
+        uploads: Sequence[Tuple[Union[bytes, Path], str]],
+        source_type: str = "upload",
+        on_progress: Optional[Callable[[int, BulkItemStatus], None]] = None,
+    ) -> List[Optional[FoodImage]]:
+        """
+        Create food image records for many (content, original filename) uploads at once.
+        Images are transcoded concurrently, at most BULK_CONCURRENCY at a time, and all rows are
+        inserted in a single transaction. on_progress receives the index of each upload as it moves
+        through the stages. The result lines up with uploads, with None for images that failed.
+        """
+        semaphore = asyncio.Semaphore(self.file_service.BULK_CONCURRENCY)
+
+        def report(index: int, status: BulkItemStatus) -> None:
+            if on_progress is not None:
+                on_progress(index, status)
+
+        async def ingest(index: int, content: Union[bytes, Path], original_filename: str) -> Optional[IngestedImage]:
+            async with semaphore:
+                report(index, BulkItemStatus.PROCESSING)
+                try:
+                    ingested = await self.file_service.ingest_image_async(content, original_filename)
+                except Exception as e:
+                    import logging
+
+                    logging.info(f"Error ingesting {original_filename}: {e}")
+                    ingested = None
+                # Rows are not written yet, so success is only reported after the insert
+                if ingested is None:
+                    report(index, BulkItemStatus.FAILED)
+                return ingested
+
+        ingested_images = await asyncio.gather(
+            *(ingest(index, content, original_filename) for index, (content, original_filename) in enumerate(uploads))
+        )
+
+        food_images: List[Optional[FoodImage]] = [
+            self._build_food_image(user_id, ingested, original_filename, source_type) if ingested is not None else None
+            for ingested, (_, original_filename) in zip(ingested_images, uploads)
+        ]
+        rows = [food_image for food_image in food_images if food_image is not None]
+        if not rows:
+            return food_images
+
+        try:
+            with get_session() as session:
+                # The flush sends one multi-row INSERT; keeping attributes loaded avoids a refresh per row
+                session.expire_on_commit = False
+                session.add_all(rows)
+                session.commit()
+        except Exception as e:
+            import logging
+
+            logging.info(f"Error inserting food images: {e}")
+            for index, food_image in enumerate(food_images):
+                if food_image is not None:
+                    report(index, BulkItemStatus.FAILED)
+            return [None] * len(food_images)
+
+        for index, food_image in enumerate(food_images):
+            if food_image is not None:
+                self._index_food_image(food_image)
+                report(index, BulkItemStatus.STORED)
+        return food_images
+
     def get_user_food_images(self, user_id: int, limit: int = 20) -> List[FoodImage]:
         """Get user's food images, most recent first."""
         with get_session() as session:
@@ -95,7 +171,13 @@ class UserService:
             return list(session.exec(stmt).all())
 
     def delete_food_image(self, image_id: int, user_id: int) -> bool:
-        """Delete a food image (only if it belongs to the user)."""
+        """
+        Delete a food image (only if it belongs to the user).
+        Content-addressed files and their renditions may be shared with other rows, and an upload
+        of the same image can take a new reference to them at any moment, so they are left to the
+        storage garbage collector, whose grace period covers such uploads. Files of older uploads
+        are unique to their row and are removed once no row refers to them.
+        """
         with get_session() as session:
             stmt = select(FoodImage).where(FoodImage.id == image_id, FoodImage.user_id == user_id)
             food_image = session.exec(stmt).first()
@@ -103,14 +185,58 @@ class UserService:
             if not food_image:
                 return False
 
-            # Delete the physical file
-            self.file_service.delete_image(food_image.file_path)
+            file_path = food_image.file_path
+            legacy = food_image.content_hash is None
 
-            # Delete from database
             session.delete(food_image)
+            session.flush()
+            remaining = 0
+            if legacy:
+                result = session.exec(select(func.count()).where(FoodImage.file_path == file_path)).first()
+                remaining = result if result is not None else 0
             session.commit()
+            get_near_duplicate_index().forget(user_id)
+
+            if legacy and remaining == 0:
+                self.file_service.delete_image(file_path)
             return True
 
+    def _create_food_image_record(
+        self, user_id: int, ingested: IngestedImage, original_filename: str, source_type: str
+    ) -> FoodImage:
+        """Insert the database record for an ingested image."""
+        with get_session() as session:
+            food_image = self._build_food_image(user_id, ingested, original_filename, source_type)
+            session.add(food_image)
+            session.commit()
+            session.refresh(food_image)
+            self._index_food_image(food_image)
+            return food_image
+
+    def _index_food_image(self, food_image: FoodImage) -> None:
+        """Make a stored image findable as a near duplicate of later uploads."""
+        if food_image.id is not None and food_image.perceptual_hash is not None:
+            get_near_duplicate_index().add(food_image.user_id, food_image.id, food_image.perceptual_hash)
+
+    def _build_food_image(
+        self, user_id: int, ingested: IngestedImage, original_filename: str, source_type: str
+    ) -> FoodImage:
+        return FoodImage(
+            filename=ingested.filename,
+            original_filename=original_filename,
+            file_path=ingested.file_path,
+            file_size=ingested.file_size,
+            mime_type=self._get_mime_type(original_filename),
+            source_type=source_type,  # type: ignore[arg-type]
+            width=ingested.width,
+            height=ingested.height,
+            content_hash=ingested.content_hash,
+            perceptual_hash=ingested.perceptual_hash,
+            renditions=ingested.renditions,
+            inference_rendition=ingested.inference_rendition,
+            user_id=user_id,
+        )
+
     def _get_mime_type(self, filename: str) -> str:
         """Get MIME type from filename extension."""
         extension = filename.lower().split(".")[-1] if "." in filename else ""
@@ -1,5 +1,7 @@
 from app.database import create_tables
 import app.pages.main_page
+import app.image_api
+import app.upload_api
 
 
 def startup() -> None:
@@ -8,3 +10,5 @@ def startup() -> None:
 
     # Register page modules
     app.pages.main_page.create()
+    app.image_api.create()
+    app.upload_api.create()
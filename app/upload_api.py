@@ -0,0 +1,99 @@
+"""
+HTTP endpoints of the resumable upload protocol.
+
+    POST  /uploads            {"filename", "size"} -> 201 {"id", "offset", "chunk_size"}
+    HEAD  /uploads/{id}       -> Upload-Offset / Upload-Length headers
+    PATCH /uploads/{id}       chunk body with Upload-Offset and Upload-Checksum ("sha256 <hex>" or "crc32 <hex>")
+                              -> 204 with the new Upload-Offset
+
+A PATCH at the wrong offset gets 409 with the current Upload-Offset, and a chunk failing its
+checksum gets 460 (as in tus); either way the client resends from the reported offset.
+Completed uploads are claimed by the page through ResumableUploadStore.finish().
+"""
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from nicegui import app
+from pydantic import BaseModel
+
+from app.services.file_service import FileService
+from app.services.resumable_upload import (
+    ChecksumMismatchError,
+    OffsetMismatchError,
+    ResumableUploadStore,
+    UploadSession,
+    UploadSessionNotFoundError,
+    get_resumable_store,
+)
+from app.services.upload_spool import UploadTooLargeError
+
+router = APIRouter()
+
+CHECKSUM_MISMATCH = 460
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+
+
+@router.post("/uploads", status_code=201)
+async def create_upload(
+    upload: UploadSessionCreate, store: ResumableUploadStore = Depends(get_resumable_store)
+) -> JSONResponse:
+    """Open a resumable upload session."""
+    if not (FileService.is_allowed_filename(upload.filename) or FileService.is_archive(upload.filename)):
+        raise HTTPException(status_code=415, detail="Unsupported file type")
+
+    try:
+        session = store.create(upload.filename, upload.size)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return JSONResponse(
+        status_code=201,
+        content={"id": session.id, "offset": session.offset, "chunk_size": ResumableUploadStore.CHUNK_SIZE},
+        headers={"Location": f"/uploads/{session.id}", **_offset_headers(session)},
+    )
+
+
+@router.head("/uploads/{session_id}")
+async def get_upload_offset(session_id: str, store: ResumableUploadStore = Depends(get_resumable_store)) -> Response:
+    """Report how many bytes of the upload have been stored."""
+    session = store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return Response(status_code=200, headers={**_offset_headers(session), "Cache-Control": "no-store"})
+
+
+@router.patch("/uploads/{session_id}")
+async def append_upload_chunk(
+    session_id: str,
+    request: Request,
+    upload_offset: int = Header(),
+    upload_checksum: str = Header(),
+    store: ResumableUploadStore = Depends(get_resumable_store),
+) -> Response:
+    """Append one chunk, streamed from the request body to disk."""
+    try:
+        session = await store.append(session_id, upload_offset, upload_checksum, request.stream())
+    except OffsetMismatchError as e:
+        return Response(status_code=409, headers={"Upload-Offset": str(e.offset)})
+    except ChecksumMismatchError as e:
+        raise HTTPException(status_code=CHECKSUM_MISMATCH, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadSessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return Response(status_code=204, headers=_offset_headers(session))
+
+
+def _offset_headers(session: UploadSession) -> dict:
+    return {"Upload-Offset": str(session.offset), "Upload-Length": str(session.size)}
+
+
+def create():
+    """Register the upload routes on the app."""
+    app.include_router(router)
@@ -0,0 +1,100 @@
+"""
+Load-test the HTTP AI client against the local stand-in server, offline.
+
+Many threads analyze an inference-sized image at once, first through one shared, pooled
+HTTPAIClient (what get_ai_client() returns), then with a new client per analysis, as when
+every NutritionAnalysisService built its own. Reports throughput and latency percentiles of the
+analyses that succeeded, and how many failed.
+
+Run with: python -m benchmarks.ai_client_load_benchmark
+"""
+
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+from app.ai_client import HTTPAIClient
+from app.ai_standin import run_standin_server
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = 400
+CONCURRENCY = 32
+LATENCY_MS = 50
+
+
+def build_image() -> bytes:
+    buffer = BytesIO()
+    Image.effect_noise((768, 512), 40).convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def run_load(analyze: Callable[[bytes], Optional[dict]], image: bytes) -> Tuple[List[float], int]:
+    """
+    Latencies in seconds of the analyses that succeeded out of REQUESTS, CONCURRENCY at a time, and
+    the number that failed. Failures are counted rather than stopping the run: under this load a
+    client per call can run out of sockets or hit its deadline, and how often it does is part of the result.
+    """
+
+    def timed(_: int) -> Optional[float]:
+        start = time.perf_counter()
+        try:
+            if analyze(image) is None:
+                return None
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        results = list(executor.map(timed, range(REQUESTS)))
+    latencies = [latency for latency in results if latency is not None]
+    return latencies, len(results) - len(latencies)
+
+
+def report(name: str, latencies: List[float], failed: int, elapsed: float) -> None:
+    if not latencies:
+        logger.info(f"{name:>17}: all {failed} analyses failed")
+        return
+
+    ordered = sorted(latencies)
+    p95, p99 = ordered[int(0.95 * len(ordered))], ordered[int(0.99 * len(ordered))]
+    logger.info(
+        f"{name:>17}: {len(latencies) / elapsed:7.1f} req/s, p50 {statistics.median(ordered) * 1000:6.1f} ms, "
+        f"p95 {p95 * 1000:6.1f} ms, p99 {p99 * 1000:6.1f} ms, {failed} failed"
+    )
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    image = build_image()
+    with run_standin_server(latency_ms=LATENCY_MS) as url:
+        shared = HTTPAIClient(url, max_connections=CONCURRENCY)
+
+        def per_call(image: bytes) -> Optional[dict]:
+            client = HTTPAIClient(url)
+            try:
+                return client.analyze_food_image(image)
+            finally:
+                client.close()
+
+        try:
+            logger.info(
+                f"{REQUESTS} analyses of a {len(image) / 1024:.0f} KiB image, {CONCURRENCY} at a time, "
+                f"stand-in latency {LATENCY_MS} ms, HTTP/2 {'on' if shared.http2 else 'off (h2 not installed)'}"
+            )
+            for name, analyze in (("pooled client", shared.analyze_food_image), ("client per call", per_call)):
+                start = time.perf_counter()
+                latencies, failed = run_load(analyze, image)
+                report(name, latencies, failed, time.perf_counter() - start)
+        finally:
+            shared.close()
+
+
+if __name__ == "__main__":
+    main()
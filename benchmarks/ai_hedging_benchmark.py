@@ -0,0 +1,73 @@
+"""
+Measure how request hedging cuts the AI client's tail latency, offline against the stand-in.
+
+The stand-in answers in LATENCY_MS plus jitter, except for SLOW_RATE of requests that take
+SLOW_MS, like a model server with the odd slow replica. The same load runs without hedging and
+with a HEDGE_BUDGET share of extra calls; reports latency percentiles, hedges sent and their
+win rate.
+
+Run with: python -m benchmarks.ai_hedging_benchmark
+"""
+
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from app.ai_client import HTTPAIClient
+from app.ai_standin import run_standin_server
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = 600
+CONCURRENCY = 8
+LATENCY_MS = 40
+JITTER_MS = 20
+SLOW_RATE = 0.03
+SLOW_MS = 800
+HEDGE_BUDGET = 0.1
+IMAGE = b"\xff\xd8" + bytes(16 * 1024)
+
+
+def run_load(client: HTTPAIClient) -> List[float]:
+    """Latencies in seconds of REQUESTS analyses, CONCURRENCY at a time."""
+
+    def timed(_: int) -> float:
+        start = time.perf_counter()
+        if client.analyze_food_image(IMAGE) is None:
+            raise RuntimeError("Analysis failed")
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        return list(executor.map(timed, range(REQUESTS)))
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with run_standin_server(LATENCY_MS, JITTER_MS, slow_rate=SLOW_RATE, slow_ms=SLOW_MS) as url:
+        logger.info(
+            f"{REQUESTS} analyses, {CONCURRENCY} at a time; stand-in {LATENCY_MS}-{LATENCY_MS + JITTER_MS} ms, "
+            f"{SLOW_RATE:.0%} of requests {SLOW_MS} ms"
+        )
+        for name, budget in (("no hedging", 0.0), (f"hedge budget {HEDGE_BUDGET:.0%}", HEDGE_BUDGET)):
+            client = HTTPAIClient(url, hedge_budget=budget)
+            sent, wins = metrics.get("ai.hedge.sent"), metrics.get("ai.hedge.wins")
+            try:
+                ordered = sorted(run_load(client))
+            finally:
+                client.close()
+
+            sent, wins = metrics.get("ai.hedge.sent") - sent, metrics.get("ai.hedge.wins") - wins
+            p95, p99 = ordered[int(0.95 * len(ordered))], ordered[int(0.99 * len(ordered))]
+            logger.info(
+                f"{name:>17}: p50 {statistics.median(ordered) * 1000:6.1f} ms, p95 {p95 * 1000:6.1f} ms, "
+                f"p99 {p99 * 1000:6.1f} ms; {sent:.0f} hedges ({sent / REQUESTS:.1%}), "
+                f"{wins / sent if sent else 0:.0%} won"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark Python heap allocated per analysis when handing a stored image to the AI client.
+
+Compares the previous handoff (read the file, base64-encode it, decode to str) with the
+memory-mapped view NutritionAnalysisService._analyze_with_ai passes now, both for a client
+that uses the bytes as they are and for one whose transport needs base64 text. Peak traced
+allocations are measured with tracemalloc; mapped file pages live in the page cache, not
+on the heap, so they do not count.
+
+Run with: python -m benchmarks.analysis_memory_benchmark
+"""
+
+import base64
+import logging
+import mmap
+import shutil
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.ai_client import AIClient, ImageData, image_base64
+from benchmarks.ingest_benchmark import build_corpus
+
+logger = logging.getLogger(__name__)
+
+# Stored images are normalized to at most 2048 px on the long side
+STORED_SIZES: List[Tuple[int, int]] = [(2048, 1536), (2048, 1365), (1536, 2048)]
+
+
+class BytesClient(AIClient):
+    """A client whose transport sends raw bytes, e.g. a multipart upload."""
+
+    def analyze_food_image(self, image_data: ImageData) -> Optional[Dict[str, Any]]:
+        return {"received": image_data is not None}
+
+
+class Base64Client(AIClient):
+    """A client whose transport embeds the image in JSON."""
+
+    def analyze_food_image(self, image_data: ImageData) -> Optional[Dict[str, Any]]:
+        return {"size": len(image_base64(image_data))}
+
+
+def legacy_handoff(client: AIClient, path: Path) -> None:
+    with path.open("rb") as image_file:
+        image_data = base64.b64encode(image_file.read()).decode()
+    client.analyze_food_image(image_data)
+
+
+def mapped_handoff(client: AIClient, path: Path) -> None:
+    with path.open("rb") as image_file:
+        mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+    with mapped, memoryview(mapped) as image_data:
+        client.analyze_food_image(image_data)
+
+
+def peak_allocation(handoff: Callable[[AIClient, Path], None], client: AIClient, paths: List[Path]) -> float:
+    """Mean of the peak traced heap allocation per analysis, in bytes."""
+    total = 0
+    for path in paths:
+        tracemalloc.start()
+        handoff(client, path)
+        total += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return total / len(paths)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    directory = Path(tempfile.mkdtemp(prefix="analysis-bench-"))
+    try:
+        paths = []
+        for index, content in enumerate(build_corpus(STORED_SIZES)):
+            path = directory / f"{index}.jpg"
+            path.write_bytes(content)
+            paths.append(path)
+        mean_size = sum(path.stat().st_size for path in paths) / len(paths)
+        logger.info(f"corpus: {len(paths)} JPEGs, {mean_size / 1024:.0f} KiB on average")
+
+        for client in (BytesClient(), Base64Client()):
+            legacy = peak_allocation(legacy_handoff, client, paths)
+            mapped = peak_allocation(mapped_handoff, client, paths)
+            name = type(client).__name__
+            logger.info(
+                f"{name:>13}: read + base64 str {legacy / 1024:8.0f} KiB, "
+                f"mapped view {mapped / 1024:8.0f} KiB per analysis ({legacy / max(mapped, 1):.1f}x less)"
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compare AI analysis of the inference rendition with analysis of the full stored image.
+
+Each corpus image is normalized the way ingestion does it, then analyzed by the configured AI
+client once from the stored (up to 2048 px) image and once from its inference rendition
+(FileService.INFERENCE_RENDITION, set with APP_INFERENCE_SIZE, APP_INFERENCE_FORMAT and
+APP_INFERENCE_QUALITY). Reports payload size, latency and how far the rendition's results
+drift from the full-size ones: overlap of the recognized food items, and the relative
+difference of the confidence score and each nutrient.
+
+Run with: python -m benchmarks.inference_rendition_benchmark
+"""
+
+import logging
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.ai_client import AIClient, get_ai_client
+from app.services.file_service import FileService
+from app.services.image_processing import transcode_image
+from benchmarks.ingest_benchmark import CORPUS_SIZES, build_corpus
+
+logger = logging.getLogger(__name__)
+
+ROUNDS = 3
+
+AnalysisResult = Optional[Dict[str, Any]]
+
+
+def timed_analysis(client: AIClient, image: bytes) -> Tuple[List[float], AnalysisResult]:
+    """Latencies of ROUNDS analyses of the image in seconds, and the last result."""
+    latencies = []
+    result = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = client.analyze_food_image(image)
+        latencies.append(time.perf_counter() - start)
+    return latencies, result
+
+
+def relative_difference(full: Any, reduced: Any) -> Optional[float]:
+    if not isinstance(full, (int, float)) or not isinstance(reduced, (int, float)):
+        return None
+    if full == reduced:
+        return 0.0
+    return abs(reduced - full) / max(abs(full), abs(reduced))
+
+
+def drift(full: AnalysisResult, reduced: AnalysisResult) -> Dict[str, float]:
+    """Per-field drift of the rendition's result: 1 - Jaccard overlap for food items, else relative difference."""
+    if full is None or reduced is None:
+        return {"failed": float((full is None) != (reduced is None))}
+
+    drifts: Dict[str, float] = {}
+    full_items = set(full.get("food_items", []))
+    reduced_items = set(reduced.get("food_items", []))
+    if full_items or reduced_items:
+        drifts["food_items"] = 1 - len(full_items & reduced_items) / len(full_items | reduced_items)
+
+    fields = [("confidence_score", full.get("confidence_score"), reduced.get("confidence_score"))]
+    full_nutrients = full.get("nutritional_info") or {}
+    reduced_nutrients = reduced.get("nutritional_info") or {}
+    fields += [(name, value, reduced_nutrients.get(name)) for name, value in full_nutrients.items()]
+    for name, full_value, reduced_value in fields:
+        difference = relative_difference(full_value, reduced_value)
+        if difference is not None:
+            drifts[name] = difference
+    return drifts
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    client = get_ai_client()
+    settings = FileService.INFERENCE_RENDITION
+
+    full_sizes: List[int] = []
+    reduced_sizes: List[int] = []
+    full_latencies: List[float] = []
+    reduced_latencies: List[float] = []
+    drifts: Dict[str, List[float]] = {}
+    for content in build_corpus(CORPUS_SIZES):
+        transcoded = transcode_image(
+            content, "JPEG", FileService.MAX_IMAGE_SIZE, FileService.RESAMPLE_QUALITY, (), settings
+        )
+        rendition = transcoded.inference_rendition or transcoded.data
+        full_sizes.append(len(transcoded.data))
+        reduced_sizes.append(len(rendition))
+
+        latencies, full_result = timed_analysis(client, transcoded.data)
+        full_latencies += latencies
+        latencies, reduced_result = timed_analysis(client, rendition)
+        reduced_latencies += latencies
+        for name, value in drift(full_result, reduced_result).items():
+            drifts.setdefault(name, []).append(value)
+
+    logger.info(
+        f"corpus: {len(full_sizes)} JPEGs, {ROUNDS} rounds, client {type(client).__name__} "
+        f"({client.model_version}), rendition {settings.size} px {settings.format} q{settings.quality}"
+    )
+    for name, sizes, latencies in (
+        ("full image", full_sizes, full_latencies),
+        ("rendition", reduced_sizes, reduced_latencies),
+    ):
+        logger.info(
+            f"{name:>10}: {statistics.mean(sizes) / 1024:7.0f} KiB, latency mean "
+            f"{statistics.mean(latencies) * 1000:8.1f} ms, p95 {percentile(latencies, 0.95) * 1000:8.1f} ms"
+        )
+    logger.info("drift of rendition results (mean / max):")
+    for name, values in drifts.items():
+        logger.info(f"{name:>16}: {statistics.mean(values):6.1%} / {max(values):6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark per-upload CPU time of the image ingestion path.
+
+Compares the original two-stage path (verify, then decode, LANCZOS-resize and save again) with
+FileService.save_image, which does the same job in one pass with the default resampling tier, on a
+synthetic corpus of 4-12 MP JPEGs. FileService.ingest_image is timed too, but it also builds the
+renditions, the inference rendition and the perceptual hash, so it is reported on its own rather than
+compared. Then times each resampling quality tier on 12-48 MP phone-sized JPEGs.
+
+Run with: python -m benchmarks.ingest_benchmark
+"""
+
+import logging
+import shutil
+import tempfile
+import time
+import uuid
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from PIL import Image
+
+from app.services.file_service import FileService
+from app.services.image_processing import ResampleQuality, transcode_image
+
+logger = logging.getLogger(__name__)
+
+# (width, height) pairs covering roughly 4, 8 and 12 megapixels
+CORPUS_SIZES: List[Tuple[int, int]] = [(2448, 1632), (3264, 2448), (4000, 3000)]
+# Roughly 12, 24 and 48 megapixels
+LARGE_CORPUS_SIZES: List[Tuple[int, int]] = [(4000, 3000), (5664, 4248), (8000, 6000)]
+ROUNDS = 5
+
+
+def build_corpus(sizes: List[Tuple[int, int]]) -> List[bytes]:
+    """Create photo-like JPEGs (noise over a gradient) so the encoder does real work."""
+    corpus = []
+    for width, height in sizes:
+        noise = Image.effect_noise((width, height), 40).convert("RGB")
+        gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        img = Image.blend(noise, gradient, 0.5)
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=92)
+        corpus.append(buffer.getvalue())
+    return corpus
+
+
+def measure(runs: Dict[str, Callable[[bytes], None]], corpus: List[bytes]) -> Dict[str, float]:
+    """
+    Return mean CPU seconds per upload of each run. The runs take turns on every upload, and each
+    upload counts with its fastest of ROUNDS turns, so other load on the machine skews none of them.
+    """
+    fastest = {name: [float("inf")] * len(corpus) for name in runs}
+    for _ in range(ROUNDS):
+        for i, content in enumerate(corpus):
+            for name, run in runs.items():
+                start = time.process_time()
+                run(content)
+                fastest[name][i] = min(fastest[name][i], time.process_time() - start)
+    return {name: sum(seconds) / len(corpus) for name, seconds in fastest.items()}
+
+
+def legacy_save(content: bytes, upload_dir: Path, max_size: Tuple[int, int]) -> None:
+    """The ingestion path before single-pass transcoding: verify, then decode again to resize and save."""
+    with Image.open(BytesIO(content)) as img:
+        img.verify()
+
+    with Image.open(BytesIO(content)) as img:
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+        img.save(upload_dir / f"{uuid.uuid4().hex}.jpg", optimize=True, quality=85)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    corpus = build_corpus(CORPUS_SIZES)
+
+    upload_dir = Path(tempfile.mkdtemp(prefix="ingest-bench-"))
+    service = FileService(upload_dir)
+
+    def legacy(content: bytes) -> None:
+        legacy_save(content, upload_dir, FileService.MAX_IMAGE_SIZE)
+
+    def single_pass(content: bytes) -> None:
+        service.save_image(content, "photo.jpg")
+
+    def full_ingest(content: bytes) -> None:
+        service.ingest_image(content, "photo.jpg")
+
+    try:
+        timings = measure({"legacy": legacy, "single_pass": single_pass, "full_ingest": full_ingest}, corpus)
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    legacy_s, single_s, full_s = timings["legacy"], timings["single_pass"], timings["full_ingest"]
+    single_label = f"single-pass save_image ({FileService.RESAMPLE_QUALITY.value}):"
+    logger.info(f"corpus: {len(corpus)} JPEGs, fastest of {ROUNDS} rounds")
+    logger.info(f"{'original verify + save:':<36} {legacy_s * 1000:.1f} ms CPU/upload")
+    logger.info(f"{single_label:<36} {single_s * 1000:.1f} ms CPU/upload")
+    logger.info(f"{'speedup:':<36} {legacy_s / single_s:.2f}x")
+    logger.info(f"{'ingest_image with all its outputs:':<36} {full_s * 1000:.1f} ms CPU/upload")
+
+    large_corpus = build_corpus(LARGE_CORPUS_SIZES)
+    logger.info(f"resample tiers on {len(large_corpus)} JPEGs of 12-48 MP")
+    tiers = measure(
+        {
+            quality.value: lambda content, q=quality: transcode_image(content, "JPEG", FileService.MAX_IMAGE_SIZE, q)
+            for quality in ResampleQuality
+        },
+        large_corpus,
+    )
+    for name, seconds in tiers.items():
+        speedup = tiers[ResampleQuality.BEST.value] / seconds
+        logger.info(f"{name:>9}: {seconds * 1000:.1f} ms CPU/upload ({speedup:.2f}x vs best)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
 import logging
 import os
 from app.startup import startup
+from app.ai_client import shutdown_ai_client
+from app.services.ai_batcher import shutdown_ai_batcher
+from app.services.analysis_cache import invalidate_stale_results
+from app.services.analysis_queue import (
+    AnalysisQueue,
+    reap_expired_analyses,
+    shutdown_analysis_queue,
+    start_analysis_queue,
+)
+from app.services.image_processing import shutdown_image_pool
+from app.services.metrics import metrics
+from app.services.resumable_upload import ResumableUploadStore, sweep_expired_uploads
+from app.services.storage_gc import GC_INTERVAL_SECONDS, collect_garbage_periodically
 from nicegui import app, ui
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -26,10 +39,25 @@ async def health():
     return {"status": "healthy", "service": "nicegui-app"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+
 # suppress sqlalchemy engine logs below warning level
 logging.getLogger("sqlalchemy.engine.Engine").setLevel(logging.WARNING)
 
 app.on_startup(startup)
+app.on_startup(invalidate_stale_results)
+app.on_startup(start_analysis_queue)
+# In order: running analyses finish before the batcher, AI client and image pool they use are closed
+app.on_shutdown(shutdown_analysis_queue)
+app.on_shutdown(shutdown_ai_batcher)
+app.on_shutdown(shutdown_ai_client)
+app.on_shutdown(shutdown_image_pool)
+app.timer(ResumableUploadStore.SWEEP_INTERVAL_SECONDS, sweep_expired_uploads)
+app.timer(GC_INTERVAL_SECONDS, collect_garbage_periodically, immediate=False)
+app.timer(AnalysisQueue.REAP_INTERVAL_SECONDS, reap_expired_analyses)
 
 # Add security headers middleware
 app.add_middleware(SecurityHeadersMiddleware)
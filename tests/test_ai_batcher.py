@@ -0,0 +1,103 @@
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from app.ai_client import AIClient
+from app.services.ai_batcher import AIBatcher
+
+
+class EchoClient(AIClient):
+    """Answers each image with its own data and records the size of every batch."""
+
+    def __init__(self, fail: bool = False):
+        self.batches: List[int] = []
+        self.fail = fail
+
+    def analyze_food_images(self, images: List[str]) -> List[Optional[Dict[str, Any]]]:
+        self.batches.append(len(images))
+        if self.fail:
+            raise ConnectionError("backend unavailable")
+        return [{"food_items": [image_data]} for image_data in images]
+
+
+def test_requests_are_grouped_up_to_the_batch_size():
+    """Test concurrent requests share calls of at most max_batch_size, each getting its own result."""
+    client = EchoClient()
+    batcher = AIBatcher(client, max_batch_size=4, max_wait_ms=500)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(batcher.analyze, [f"image-{i}" for i in range(8)]))
+    finally:
+        batcher.close()
+
+    assert [result["food_items"] for result in results if result] == [[f"image-{i}"] for i in range(8)]
+    assert sum(client.batches) == 8
+    assert max(client.batches) == 4
+    assert len(client.batches) < 8
+
+
+def test_lone_request_is_sent_after_the_wait():
+    """Test a request without company is not held longer than max_wait_ms."""
+    client = EchoClient()
+    batcher = AIBatcher(client, max_batch_size=4, max_wait_ms=10)
+    try:
+        assert batcher.analyze("only") == {"food_items": ["only"]}
+    finally:
+        batcher.close()
+
+    assert client.batches == [1]
+
+
+def test_batch_failure_reaches_every_request():
+    """Test a failed batch call raises in each caller of the batch."""
+    batcher = AIBatcher(EchoClient(fail=True), max_batch_size=2, max_wait_ms=100)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(batcher.analyze, image_data) for image_data in ("a", "b")]
+            for future in futures:
+                with pytest.raises(ConnectionError):
+                    future.result()
+    finally:
+        batcher.close()
+
+
+class BlockingClient(EchoClient):
+    """Holds every call until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def analyze_food_images(self, images: List[str]) -> List[Optional[Dict[str, Any]]]:
+        self.release.wait(5)
+        return super().analyze_food_images(images)
+
+
+def test_requests_collect_while_every_batch_is_in_flight():
+    """Test no batch is formed while all batch slots are busy, so waiting requests go out together."""
+    client = BlockingClient()
+    batcher = AIBatcher(client, max_batch_size=4, max_wait_ms=1, max_concurrent_batches=1)
+    try:
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            first = executor.submit(batcher.analyze, "first")
+            time.sleep(0.1)
+            rest = []
+            for i in range(4):
+                # Further apart than max_wait_ms, so only backpressure can group them
+                rest.append(executor.submit(batcher.analyze, f"image-{i}"))
+                time.sleep(0.02)
+            client.release.set()
+            assert first.result() == {"food_items": ["first"]}
+            assert [future.result() for future in rest] == [{"food_items": [f"image-{i}"]} for i in range(4)]
+    finally:
+        batcher.close()
+
+    assert client.batches == [1, 4]
+
+
+def test_default_client_batch_api_lines_up_with_input():
+    """Test the stock client answers one result per image."""
+    results = AIClient().analyze_food_images(["a", "b", "c"])
+    assert len(results) == 3
+    assert all(result is not None and "food_items" in result for result in results)
@@ -0,0 +1,176 @@
+import asyncio
+import base64
+import time
+import pytest
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from app.ai_client import HTTPAIClient, get_ai_client, shutdown_ai_client
+from app.ai_standin import run_standin_server
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from app.services.metrics import metrics
+
+IMAGE = b"\xff\xd8 food photo"
+
+
+@pytest.fixture(scope="module")
+def standin():
+    with run_standin_server(latency_ms=20) as url:
+        yield url
+
+
+@pytest.fixture
+def client(standin):
+    client = HTTPAIClient(standin, timeout_seconds=5)
+    yield client
+    client.close()
+
+
+def test_http_client_analyzes_single_and_batched_images(client):
+    """Test results come back per image, and images that are not valid base64 get none."""
+    result = client.analyze_food_image(IMAGE)
+    assert result is not None
+    assert result["food_items"] == ["mixed salad", "grilled chicken"]
+
+    results = client.analyze_food_images([IMAGE, memoryview(IMAGE), base64.b64encode(IMAGE).decode(), "not base64!"])
+    assert [result is not None for result in results] == [True, True, True, False]
+
+
+def test_http_client_serves_many_threads_from_one_pool(client):
+    """Test blocking callers on many threads share the client's loop and connection pool."""
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(client.analyze_food_image, [IMAGE] * 32))
+
+    assert all(result is not None for result in results)
+
+
+async def test_http_client_async_api(client):
+    """Test coroutines on another event loop can await the client."""
+    result = await client.analyze_food_image_async(IMAGE)
+    assert result is not None
+
+    results = await client.analyze_food_images_async([IMAGE, IMAGE])
+    assert len(results) == 2
+
+
+def test_http_client_enforces_deadlines():
+    """Test a slow backend fails the request at its deadline instead of hanging."""
+    with run_standin_server(latency_ms=1000) as url:
+        client = HTTPAIClient(url, timeout_seconds=0.1)
+        try:
+            assert client.analyze_food_image(IMAGE) is None
+            with pytest.raises(TimeoutError):
+                client.analyze_food_images([IMAGE])
+        finally:
+            client.close()
+
+
+def test_http_client_reports_backend_errors():
+    """Test error statuses raise for batches and give no result for single images."""
+    with run_standin_server(failure_rate=1.0) as url:
+        client = HTTPAIClient(url)
+        try:
+            assert client.analyze_food_image(IMAGE) is None
+            with pytest.raises(httpx.HTTPStatusError):
+                client.analyze_food_images([IMAGE])
+        finally:
+            client.close()
+
+
+def test_get_ai_client_is_process_wide():
+    """Test every caller shares one client until shutdown."""
+    assert get_ai_client() is get_ai_client()
+    first = get_ai_client()
+    shutdown_ai_client()
+    assert get_ai_client() is not first
+
+
+def test_http_client_timeout_adapts_to_recent_latencies(client):
+    """Test the deadline follows the latency percentile once there are enough samples, within its bounds."""
+    assert client.current_timeout() == client.timeout_seconds
+
+    for _ in range(HTTPAIClient.MIN_LATENCY_SAMPLES):
+        client.latencies.record(0.5)
+    assert client.current_timeout() == pytest.approx(0.5 * HTTPAIClient.TIMEOUT_MULTIPLIER)
+
+    for _ in range(HTTPAIClient.LATENCY_WINDOW):
+        client.latencies.record(0.01)
+    assert client.current_timeout() == HTTPAIClient.MIN_TIMEOUT_SECONDS
+
+
+def test_http_client_breaker_sheds_load_while_backend_is_down():
+    """Test failing requests open the circuit, after which calls are rejected without waiting on the backend."""
+    with run_standin_server(failure_rate=1.0, latency_ms=50) as url:
+        client = HTTPAIClient(url)
+        try:
+            for _ in range(HTTPAIClient.BREAKER_FAILURES):
+                assert client.analyze_food_image(IMAGE) is None
+
+            start = time.monotonic()
+            with pytest.raises(CircuitOpenError):
+                client.analyze_food_image(IMAGE)
+            assert time.monotonic() - start < 0.05
+        finally:
+            client.close()
+
+
+def test_http_client_hedges_slow_requests_within_budget():
+    """Test a request slower than the hedge delay is sent again and the faster answer wins, as the budget allows."""
+    with run_standin_server(latency_ms=500) as slow, run_standin_server() as fast:
+        client = HTTPAIClient(slow, hedge_endpoint=fast, hedge_budget=1.0)
+        try:
+            for _ in range(HTTPAIClient.MIN_LATENCY_SAMPLES):
+                client.latencies.record(0.02)
+            assert client.hedge_delay() == 0.02
+
+            start = time.monotonic()
+            assert client.analyze_food_image(IMAGE) is not None
+            assert time.monotonic() - start < 0.4
+            assert metrics.get("ai.hedge.win_rate") == 1.0
+            # The winner's latency is recorded, and the abandoned primary's time so far as a lower bound on its own
+            time.sleep(0.05)
+            assert len(client.latencies) == HTTPAIClient.MIN_LATENCY_SAMPLES + 2
+            assert client.latencies.percentile(1.0) < 0.4
+
+            # Half a hedge per request: the next request is not hedged and waits for the slow backend
+            client.hedge_budget = 0.5
+            sent = metrics.get("ai.hedge.sent")
+            assert client.analyze_food_image(IMAGE) is not None
+            assert metrics.get("ai.hedge.sent") == sent
+        finally:
+            client.close()
+
+
+def test_http_client_does_not_hedge_without_budget(client):
+    """Test hedging is off with the default budget."""
+    for _ in range(HTTPAIClient.MIN_LATENCY_SAMPLES):
+        client.latencies.record(0.001)
+    assert client.hedge_delay() is None
+
+
+async def test_http_client_cancelled_probe_gives_its_slot_back():
+    """Test a half-open probe cancelled mid-request leaves the breaker able to admit the next probe."""
+    with run_standin_server(latency_ms=2000) as url:
+        client = HTTPAIClient(url)
+        client.breaker = CircuitBreaker("test_cancelled_probe", failure_threshold=1, reset_seconds=0.01)
+        try:
+            client.breaker.record_failure()
+            await asyncio.sleep(0.02)
+            assert client.breaker.state == CircuitState.HALF_OPEN
+
+            probe = asyncio.create_task(client.analyze_food_images_async([IMAGE]))
+            await asyncio.sleep(0.1)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+
+            # The cancellation reaches the client's own loop shortly after
+            deadline = time.monotonic() + 1
+            while True:
+                try:
+                    assert client.breaker.acquire() is True
+                    break
+                except CircuitOpenError:
+                    assert time.monotonic() < deadline
+                    await asyncio.sleep(0.01)
+        finally:
+            client.close()
@@ -0,0 +1,118 @@
+import pytest
+from dataclasses import replace
+from io import BytesIO
+from PIL import Image
+from app.database import reset_db
+from app.services.analysis_cache import AnalysisCache, result_version
+from app.services.metrics import metrics
+from app.services.nutrition_service import NutritionAnalysisService
+from app.services.user_service import UserService
+
+RESULT = {"food_items": ["soup"], "nutritional_info": {"calories": 80.0}}
+
+
+@pytest.fixture()
+def new_db():
+    reset_db()
+    yield
+    reset_db()
+
+
+def test_cache_serves_from_memory_then_database(new_db):
+    """Test results are served from memory, and from the shared table in a process that never saw them."""
+    cache = AnalysisCache()
+    assert cache.get("a" * 32, "v1") is None
+
+    cache.put("a" * 32, "v1", RESULT)
+    hits = metrics.get("analysis_cache.memory_hits")
+    assert cache.get("a" * 32, "v1") == RESULT
+    assert metrics.get("analysis_cache.memory_hits") == hits + 1
+    assert cache.get("a" * 32, "v2") is None
+
+    other_process = AnalysisCache()
+    db_hits = metrics.get("analysis_cache.db_hits")
+    assert other_process.get("a" * 32, "v1") == RESULT
+    assert metrics.get("analysis_cache.db_hits") == db_hits + 1
+
+    # A second put of the same key, e.g. from a racing process, is harmless
+    other_process.put("a" * 32, "v1", RESULT)
+
+
+def test_cache_memory_tier_evicts_and_expires(new_db):
+    """Test the in-process tier keeps only the most recently used entries, each for the TTL."""
+    cache = AnalysisCache(max_entries=2)
+    evictions = metrics.get("analysis_cache.evictions")
+    for key in ("a", "b", "c"):
+        cache.put(key * 32, "v1", RESULT)
+    assert metrics.get("analysis_cache.evictions") == evictions + 1
+    assert cache._get_memory(("a" * 32, "v1")) is None
+    assert cache._get_memory(("c" * 32, "v1")) == RESULT
+
+    expiring = AnalysisCache(ttl_seconds=0)
+    expiring.put("d" * 32, "v1", RESULT)
+    assert expiring._get_memory(("d" * 32, "v1")) is None
+    # The shared tier has no TTL
+    assert expiring.get("d" * 32, "v1") == RESULT
+
+
+def test_cache_invalidates_other_model_versions(new_db):
+    """Test switching models drops the results of every other version."""
+    cache = AnalysisCache()
+    cache.put("a" * 32, "old-model", RESULT)
+    cache.put("b" * 32, "new-model", RESULT)
+
+    assert cache.invalidate_other_versions("new-model") == 1
+    assert cache.get("a" * 32, "old-model") is None
+    assert AnalysisCache().get("a" * 32, "old-model") is None
+    assert cache.get("b" * 32, "new-model") == RESULT
+
+
+def test_identical_images_are_analyzed_once(new_db):
+    """Test a second upload of the same content, by another user, reuses the cached AI result."""
+    byte_arr = BytesIO()
+    Image.new("RGB", (48, 36), color="teal").save(byte_arr, format="JPEG")
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+
+    def upload_and_analyze(email: str):
+        user = user_service.get_or_create_user(email, "Cache User")
+        assert user.id is not None
+        food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "teal.jpg")
+        assert food_image is not None and food_image.id is not None
+        return nutrition_service.analyze_food_image(food_image.id)
+
+    first = upload_and_analyze("first@test.com")
+    misses = metrics.get("analysis_cache.misses")
+    hits = metrics.get("analysis_cache.memory_hits") + metrics.get("analysis_cache.db_hits")
+    second = upload_and_analyze("second@test.com")
+
+    assert metrics.get("analysis_cache.misses") == misses
+    assert metrics.get("analysis_cache.memory_hits") + metrics.get("analysis_cache.db_hits") == hits + 1
+    assert first is not None and second is not None
+    assert second.food_items == first.food_items
+    assert second.calories == first.calories
+
+
+def test_other_inference_rendition_settings_miss_the_cache(new_db):
+    """Test results cached for one inference rendition are not served for another size or quality."""
+    byte_arr = BytesIO()
+    Image.new("RGB", (48, 36), color="olive").save(byte_arr, format="JPEG")
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+
+    def upload_and_analyze(email: str):
+        user = user_service.get_or_create_user(email, "Cache User")
+        assert user.id is not None
+        food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "olive.jpg")
+        assert food_image is not None and food_image.id is not None
+        return nutrition_service.analyze_food_image(food_image.id)
+
+    assert upload_and_analyze("first@test.com") is not None
+    misses = metrics.get("analysis_cache.misses")
+    inference = nutrition_service.file_service.INFERENCE_RENDITION
+    nutrition_service.file_service.INFERENCE_RENDITION = replace(inference, quality=inference.quality - 10)
+    assert upload_and_analyze("second@test.com") is not None
+
+    assert metrics.get("analysis_cache.misses") == misses + 1
+    version = result_version(nutrition_service.ai_client.model_version, inference)
+    assert AnalysisCache().invalidate_other_versions(version) == 1
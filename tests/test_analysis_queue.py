@@ -0,0 +1,344 @@
+import asyncio
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from io import BytesIO
+from PIL import Image
+from typing import Any, Dict, List, Optional
+from app.ai_client import AIClient, ImageData
+from app.database import get_session, reset_db
+from app.models import AnalysisStatus, NutritionalAnalysis
+from app.services.ai_batcher import AIBatcher
+from app.services.analysis_queue import AnalysisQueue
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.metrics import metrics
+from app.services.nutrition_service import AnalysisLease, NutritionAnalysisService
+from app.services.user_service import UserService
+
+
+class DownClient(AIClient):
+    """A client whose circuit breaker is open."""
+
+    def analyze_food_images(self, images: List[ImageData]) -> List[Optional[Dict[str, Any]]]:
+        raise CircuitOpenError("ai", retry_after=5.0)
+
+
+@pytest.fixture()
+def new_db():
+    reset_db()
+    yield
+    reset_db()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_returns_pending_and_workers_finish_jobs(new_db):
+    """Test enqueue answers with a PENDING record and the worker pool completes every job."""
+    user_service = UserService()
+    user = user_service.get_or_create_user("queue@test.com", "Queue User")
+    assert user.id is not None
+
+    image_ids = []
+    for color in ("red", "green", "blue"):
+        byte_arr = BytesIO()
+        Image.new("RGB", (40, 30), color=color).save(byte_arr, format="JPEG")
+        food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), f"{color}.jpg")
+        assert food_image is not None and food_image.id is not None
+        image_ids.append(food_image.id)
+
+    queue = AnalysisQueue(workers=2)
+    try:
+        pending = [await queue.enqueue(image_id) for image_id in image_ids]
+        assert all(analysis is not None and analysis.status == AnalysisStatus.PENDING for analysis in pending)
+        assert await queue.enqueue(999999) is None
+
+        for analysis in pending:
+            assert analysis is not None and analysis.id is not None
+            finished = await queue.wait(analysis.id)
+            assert finished is not None
+            assert finished.status == AnalysisStatus.COMPLETED
+
+        # Finished jobs are read back from the database
+        first = pending[0]
+        assert first is not None and first.id is not None
+        again = await queue.wait(first.id)
+        assert again is not None and again.status == AnalysisStatus.COMPLETED
+    finally:
+        await queue.stop()
+
+
+def test_claim_next_analysis_by_priority_then_age(new_db):
+    """Test claims take the highest priority first, lease the job and never hand it out twice."""
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+    user = user_service.get_or_create_user("claims@test.com", "Claims User")
+    assert user.id is not None
+
+    analysis_ids = []
+    for priority in (0, 10, 0):
+        byte_arr = BytesIO()
+        Image.new("RGB", (40, 30), color=(priority * 20, len(analysis_ids) * 60, 0)).save(byte_arr, format="JPEG")
+        food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "meal.jpg")
+        assert food_image is not None and food_image.id is not None
+        analysis = nutrition_service.create_pending_analysis(food_image.id, priority)
+        assert analysis is not None
+        analysis_ids.append(analysis.id)
+
+    claimed = [nutrition_service.claim_next_analysis() for _ in range(4)]
+    assert claimed == [
+        AnalysisLease(analysis_ids[1], 1),
+        AnalysisLease(analysis_ids[0], 1),
+        AnalysisLease(analysis_ids[2], 1),
+        None,
+    ]
+
+    analysis = nutrition_service.get_analysis(analysis_ids[1])
+    assert analysis is not None
+    assert analysis.status == AnalysisStatus.PROCESSING
+    assert analysis.attempts == 1
+    assert analysis.lease_expires_at is not None and analysis.lease_expires_at > datetime.utcnow()
+
+    finished = nutrition_service.run_analysis(analysis_ids[1])
+    assert finished is not None and finished.status == AnalysisStatus.COMPLETED
+    assert finished.lease_expires_at is None
+    assert finished.attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_workers_pick_up_jobs_queued_before_start(new_db):
+    """Test analyses left PENDING, e.g. by a restart, are run once workers start."""
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+    user = user_service.get_or_create_user("restart@test.com", "Restart User")
+    assert user.id is not None
+    byte_arr = BytesIO()
+    Image.new("RGB", (40, 30), color="orange").save(byte_arr, format="JPEG")
+    food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "dinner.jpg")
+    assert food_image is not None and food_image.id is not None
+    pending = nutrition_service.create_pending_analysis(food_image.id)
+    assert pending is not None and pending.id is not None
+
+    queue = AnalysisQueue(nutrition_service, workers=1)
+    queue.start()
+    try:
+        finished = await asyncio.wait_for(queue.wait(pending.id), 10)
+    finally:
+        await queue.stop()
+
+    assert finished is not None and finished.status == AnalysisStatus.COMPLETED
+
+
+def test_reaper_requeues_expired_leases_until_attempts_run_out(new_db):
+    """Test analyses whose worker stopped heartbeating are requeued, then failed after MAX_ATTEMPTS."""
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+    user = user_service.get_or_create_user("reaper@test.com", "Reaper User")
+    assert user.id is not None
+    byte_arr = BytesIO()
+    Image.new("RGB", (40, 30), color="purple").save(byte_arr, format="JPEG")
+    food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "snack.jpg")
+    assert food_image is not None and food_image.id is not None
+    pending = nutrition_service.create_pending_analysis(food_image.id)
+    assert pending is not None and pending.id is not None
+
+    def expire_lease():
+        with get_session() as session:
+            analysis = session.get(NutritionalAnalysis, pending.id)
+            assert analysis is not None
+            analysis.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+            session.commit()
+
+    # A live lease is left alone, and heartbeats extend it
+    lease = nutrition_service.claim_next_analysis()
+    assert lease == AnalysisLease(pending.id, 1)
+    assert nutrition_service.reap_expired_analyses() == (0, 0)
+    assert nutrition_service.renew_lease(lease)
+
+    for attempt in range(1, NutritionAnalysisService.MAX_ATTEMPTS):
+        expire_lease()
+        assert nutrition_service.reap_expired_analyses() == (1, 0)
+        analysis = nutrition_service.get_analysis(pending.id)
+        assert analysis is not None and analysis.status == AnalysisStatus.PENDING
+        assert analysis.attempts == attempt
+        lease = nutrition_service.claim_next_analysis()
+        assert lease == AnalysisLease(pending.id, attempt + 1)
+
+    expire_lease()
+    assert nutrition_service.reap_expired_analyses() == (0, 1)
+    analysis = nutrition_service.get_analysis(pending.id)
+    assert analysis is not None and analysis.status == AnalysisStatus.FAILED
+    assert analysis.error_message is not None
+    assert not nutrition_service.renew_lease(lease)
+
+
+def test_stale_worker_is_fenced_off_after_its_job_is_claimed_again(new_db):
+    """Test a worker whose lease ran out and was claimed again can neither renew it nor store its results."""
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+    user = user_service.get_or_create_user("fencing@test.com", "Fencing User")
+    assert user.id is not None
+    byte_arr = BytesIO()
+    Image.new("RGB", (40, 30), color="navy").save(byte_arr, format="JPEG")
+    food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "stew.jpg")
+    assert food_image is not None and food_image.id is not None
+    pending = nutrition_service.create_pending_analysis(food_image.id)
+    assert pending is not None and pending.id is not None
+
+    stale = nutrition_service.claim_next_analysis()
+    assert stale is not None
+    with get_session() as session:
+        analysis = session.get(NutritionalAnalysis, pending.id)
+        assert analysis is not None
+        analysis.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+        session.commit()
+    assert nutrition_service.reap_expired_analyses() == (1, 0)
+    current = nutrition_service.claim_next_analysis()
+    assert current == AnalysisLease(pending.id, stale.token + 1)
+
+    lost = metrics.get("analysis.leases_lost")
+    assert not nutrition_service.renew_lease(stale)
+    assert nutrition_service.run_analysis(pending.id, stale.token) is None
+    assert metrics.get("analysis.leases_lost") == lost + 1
+    analysis = nutrition_service.get_analysis(pending.id)
+    assert analysis is not None and analysis.status == AnalysisStatus.PROCESSING
+
+    assert nutrition_service.renew_lease(current)
+    finished = nutrition_service.run_analysis(pending.id, current.token)
+    assert finished is not None and finished.status == AnalysisStatus.COMPLETED
+
+
+def _shed_analysis(nutrition_service: NutritionAnalysisService, email: str, color: str) -> int:
+    """Queue an analysis for a fresh image with the service's AI client down. Returns its id."""
+    user_service = UserService()
+    nutrition_service.ai_batcher = AIBatcher(DownClient(), max_batch_size=2, max_wait_ms=1)
+    user = user_service.get_or_create_user(email, "Breaker User")
+    assert user.id is not None
+    byte_arr = BytesIO()
+    Image.new("RGB", (41, 29), color=color).save(byte_arr, format="JPEG")
+    food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "soup.jpg")
+    assert food_image is not None and food_image.id is not None
+    pending = nutrition_service.create_pending_analysis(food_image.id)
+    assert pending is not None and pending.id is not None
+    return pending.id
+
+
+def test_open_circuit_hands_analyses_back(new_db):
+    """Test analyses shed by an open circuit go back to the queue at once without using up attempts."""
+    nutrition_service = NutritionAnalysisService()
+    analysis_id = _shed_analysis(nutrition_service, "breaker@test.com", "teal")
+
+    try:
+        for _ in range(NutritionAnalysisService.MAX_ATTEMPTS + 1):
+            lease = nutrition_service.claim_next_analysis()
+            assert lease is not None and lease.analysis_id == analysis_id
+            with pytest.raises(CircuitOpenError) as shed:
+                nutrition_service.run_analysis(analysis_id, lease.token)
+            assert shed.value.retry_after == 5.0
+
+            analysis = nutrition_service.get_analysis(analysis_id)
+            assert analysis is not None and analysis.lease_expires_at is None
+            assert analysis.status == AnalysisStatus.PENDING
+            assert analysis.attempts == 0
+    finally:
+        nutrition_service.ai_batcher.close()
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_pauses_the_whole_pool(new_db):
+    """Test once one worker's job is shed, no worker claims it again until the breaker's retry_after."""
+    nutrition_service = NutritionAnalysisService()
+    analysis_id = _shed_analysis(nutrition_service, "pause@test.com", "olive")
+    shed_before = metrics.get("analysis.jobs_shed")
+
+    queue = AnalysisQueue(nutrition_service, workers=3)
+    try:
+        queue.start()
+        await asyncio.sleep(0.5)
+        queue.wake()
+        await asyncio.sleep(0.5)
+
+        assert metrics.get("analysis.jobs_shed") - shed_before == 1
+        analysis = nutrition_service.get_analysis(analysis_id)
+        assert analysis is not None
+        assert analysis.status == AnalysisStatus.PENDING and analysis.attempts == 0
+    finally:
+        await queue.stop()
+        nutrition_service.ai_batcher.close()
+
+
+class FlakyClaimService(NutritionAnalysisService):
+    """Fails the first claim, as when the database connection drops."""
+
+    def __init__(self):
+        super().__init__()
+        self.failed = False
+
+    def claim_next_analysis(self) -> Optional[AnalysisLease]:
+        if not self.failed:
+            self.failed = True
+            raise ConnectionError("server closed the connection unexpectedly")
+        return super().claim_next_analysis()
+
+
+@pytest.mark.asyncio
+async def test_workers_survive_claim_errors_and_dead_workers_are_replaced(new_db):
+    """Test a failed claim only delays the worker, and start() replaces workers that are gone."""
+    user_service = UserService()
+    user = user_service.get_or_create_user("flaky@test.com", "Flaky User")
+    assert user.id is not None
+    byte_arr = BytesIO()
+    Image.new("RGB", (43, 31), color="navy").save(byte_arr, format="JPEG")
+    food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "stew.jpg")
+    assert food_image is not None and food_image.id is not None
+
+    queue = AnalysisQueue(FlakyClaimService(), workers=1)
+    queue.POLL_INTERVAL_SECONDS = 0.05
+    try:
+        pending = await queue.enqueue(food_image.id)
+        assert pending is not None and pending.id is not None
+        finished = await asyncio.wait_for(queue.wait(pending.id), 10)
+        assert finished is not None and finished.status == AnalysisStatus.COMPLETED
+
+        worker = queue._tasks[0]
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        queue.start()
+        assert len(queue._tasks) == 1 and not queue._tasks[0].done()
+    finally:
+        await queue.stop()
+
+
+class SlowRunService(NutritionAnalysisService):
+    """Takes a while over every analysis, like a slow AI backend."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+
+    def run_analysis(self, analysis_id: int, token: Optional[int] = None) -> Optional[NutritionalAnalysis]:
+        self.started.set()
+        time.sleep(0.3)
+        return super().run_analysis(analysis_id, token)
+
+
+@pytest.mark.asyncio
+async def test_stop_lets_running_analyses_finish(new_db):
+    """Test stop() returns only once the analyses in progress are done, so nothing outlives the AI client."""
+    user_service = UserService()
+    user = user_service.get_or_create_user("stop@test.com", "Stop User")
+    assert user.id is not None
+    byte_arr = BytesIO()
+    Image.new("RGB", (44, 32), color="maroon").save(byte_arr, format="JPEG")
+    food_image = user_service.create_food_image(user.id, byte_arr.getvalue(), "pie.jpg")
+    assert food_image is not None and food_image.id is not None
+
+    nutrition_service = SlowRunService()
+    queue = AnalysisQueue(nutrition_service, workers=1)
+    pending = await queue.enqueue(food_image.id)
+    assert pending is not None and pending.id is not None
+    assert await asyncio.to_thread(nutrition_service.started.wait, 5)
+
+    await queue.stop()
+
+    analysis = nutrition_service.get_analysis(pending.id)
+    assert analysis is not None and analysis.status == AnalysisStatus.COMPLETED
@@ -0,0 +1,72 @@
+import time
+import pytest
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from app.services.latency_tracker import LatencyTracker
+from app.services.metrics import metrics
+
+
+def test_breaker_opens_after_consecutive_failures():
+    """Test only an unbroken run of failure_threshold failures opens the circuit, which then rejects calls."""
+    breaker = CircuitBreaker("test_open", failure_threshold=3, reset_seconds=60)
+
+    for _ in range(2):
+        breaker.record_failure(breaker.acquire())
+    breaker.record_success(breaker.acquire())
+    for _ in range(2):
+        breaker.record_failure(breaker.acquire())
+    assert breaker.state == CircuitState.CLOSED
+
+    breaker.record_failure(breaker.acquire())
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.acquire()
+    assert 0 < rejected.value.retry_after <= 60
+    assert metrics.get("test_open.breaker.opened") == 1
+    assert metrics.get("test_open.breaker.rejected") == 1
+
+
+def test_breaker_half_open_probe_closes_or_reopens():
+    """Test after reset_seconds one probe at a time is let through; its outcome closes or reopens the circuit."""
+    breaker = CircuitBreaker("test_probe", failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure(breaker.acquire())
+    assert breaker.state == CircuitState.OPEN
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.acquire() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record_failure(probe=True)
+    assert breaker.state == CircuitState.OPEN
+
+    time.sleep(0.06)
+    assert breaker.acquire() is True
+    breaker.record_success(probe=True)
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.acquire() is False
+    assert breaker.acquire() is False
+
+
+def test_latency_tracker_percentiles_over_rolling_window():
+    """Test percentiles use nearest rank over the most recent window of latencies."""
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(0.5) is None
+
+    for ms in range(1, 201):
+        tracker.record(ms / 1000)
+    assert len(tracker) == 100
+    assert tracker.percentile(0.5) == 0.150
+    assert tracker.percentile(0.99) == 0.199
+    assert tracker.percentile(1.0) == 0.200
+
+
+def test_breaker_release_frees_a_probe_without_an_outcome():
+    """Test a released probe slot can be taken by the next call and the circuit stays half-open."""
+    breaker = CircuitBreaker("test_release", failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure(breaker.acquire())
+    time.sleep(0.02)
+
+    assert breaker.acquire() is True
+    breaker.release(probe=True)
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.acquire() is True
@@ -1,4 +1,6 @@
-from app.database import reset_db, get_session
+from sqlalchemy import inspect
+from sqlmodel import text
+from app.database import COLUMN_MIGRATIONS, ENGINE, create_tables, reset_db, get_session
 from app.models import User
 
 
@@ -15,3 +17,24 @@ def test_database_connection():
         # Verify user was created
         assert user.id is not None
         assert user.name == "Test"
+
+
+def test_migrate_upgrades_tables_from_older_releases():
+    """Test columns added since a table first shipped are added back to it, and migrating again is a no-op."""
+    reset_db()
+    with ENGINE.begin() as conn:
+        for table in {migration.table for migration in COLUMN_MIGRATIONS}:
+            for index in inspect(conn).get_indexes(table):
+                conn.execute(text(f"DROP INDEX {index['name']}"))
+        for migration in reversed(COLUMN_MIGRATIONS):
+            conn.execute(text(f"ALTER TABLE {migration.table} DROP COLUMN {migration.column}"))
+
+    create_tables()
+    create_tables()
+
+    for migration in COLUMN_MIGRATIONS:
+        assert migration.column in {column["name"] for column in inspect(ENGINE).get_columns(migration.table)}
+    indexes = {index["name"] for index in inspect(ENGINE).get_indexes("food_images")}
+    assert {"ix_food_images_content_hash", "ix_food_images_filename_id"} <= indexes
+    indexes = {index["name"] for index in inspect(ENGINE).get_indexes("nutritional_analyses")}
+    assert "ix_nutritional_analyses_pending" in indexes
@@ -1,13 +1,15 @@
 import pytest
+import zipfile
 from pathlib import Path
 from PIL import Image
 from io import BytesIO
 from app.services.file_service import FileService
+from app.services.upload_spool import UploadTooLargeError, expand_archive, spool_upload
 
 
 @pytest.fixture
-def file_service():
-    return FileService()
+def file_service(tmp_path):
+    return FileService(tmp_path)
 
 
 @pytest.fixture
@@ -146,3 +148,135 @@ def test_upload_directory_creation():
     # Directory should be created during initialization
     assert file_service.UPLOAD_DIR.exists()
     assert file_service.UPLOAD_DIR.is_dir()
+
+
+def test_ingest_image_success(file_service, sample_image_bytes):
+    """Test single-pass ingestion returns a structured result."""
+    ingested = file_service.ingest_image(sample_image_bytes, "meal.jpg")
+
+    assert ingested is not None
+    assert ingested.filename.endswith(".jpg")
+    assert Path(ingested.file_path).exists()
+    assert ingested.file_size == Path(ingested.file_path).stat().st_size
+    assert ingested.width == 100
+    assert ingested.height == 100
+    assert ingested.format == "JPEG"
+
+
+def test_ingest_image_resizes_large_images(file_service, large_image_bytes):
+    """Test that ingestion resizes oversized images."""
+    ingested = file_service.ingest_image(large_image_bytes, "large.jpg")
+
+    assert ingested is not None
+    assert ingested.width <= file_service.MAX_IMAGE_SIZE[0]
+    assert ingested.height <= file_service.MAX_IMAGE_SIZE[1]
+
+
+def test_ingest_image_rejects_invalid(file_service, sample_image_bytes):
+    """Test that ingestion rejects bad extensions, unsupported formats and corrupt data."""
+    gif = BytesIO()
+    Image.new("RGB", (10, 10)).save(gif, format="GIF")
+
+    assert file_service.ingest_image(sample_image_bytes, "meal.txt") is None
+    assert file_service.ingest_image(gif.getvalue(), "meal.jpg") is None
+    assert file_service.ingest_image(b"not an image", "meal.jpg") is None
+    assert file_service.ingest_image(sample_image_bytes[: len(sample_image_bytes) // 2], "meal.jpg") is None
+
+
+def test_ingest_image_deduplicates_identical_content(file_service, sample_image_bytes):
+    """Test identical uploads are stored once under their content hash."""
+    first = file_service.ingest_image(sample_image_bytes, "first.jpg")
+    second = file_service.ingest_image(sample_image_bytes, "second.jpg")
+
+    assert first is not None and second is not None
+    assert first.content_hash == second.content_hash
+    assert first.filename == f"{first.content_hash}.jpg"
+    assert second.file_path == first.file_path
+    assert not second.created
+
+
+def test_ingest_image_stores_renditions(file_service, large_image_bytes):
+    """Test ingestion stores WebP renditions next to the original."""
+    ingested = file_service.ingest_image(large_image_bytes, "large.jpg")
+
+    assert ingested is not None
+    assert set(ingested.renditions) == {"128", "512", "2048"}
+    for size, filename in ingested.renditions.items():
+        path = file_service.get_image_path(filename)
+        assert path is not None
+        assert Path(path).parent == Path(ingested.file_path).parent
+        assert filename == f"{ingested.content_hash}_{size}.webp"
+
+    # Smallest rendition covering the requested size, else the largest available
+    assert file_service.get_rendition_path(ingested.renditions, 100) == file_service.get_image_path(
+        ingested.renditions["128"]
+    )
+    assert file_service.get_rendition_path(ingested.renditions, 300) == file_service.get_image_path(
+        ingested.renditions["512"]
+    )
+    assert file_service.get_rendition_path(ingested.renditions, 4000) == file_service.get_image_path(
+        ingested.renditions["2048"]
+    )
+    assert file_service.get_rendition_path({}, 128) is None
+
+
+def test_ingest_image_stores_inference_rendition(file_service, large_image_bytes):
+    """Test ingestion stores the smaller rendition the AI model is given."""
+    ingested = file_service.ingest_image(large_image_bytes, "large.jpg")
+
+    assert ingested is not None
+    assert ingested.inference_rendition == f"{ingested.content_hash}_ai768.jpeg"
+    path = file_service.get_image_path(ingested.inference_rendition)
+    assert path is not None
+    with Image.open(path) as img:
+        assert img.format == "JPEG"
+        assert img.size == (768, 512)
+
+
+def test_ingest_image_from_spooled_upload(file_service, large_image_bytes):
+    """Test ingestion decodes spooled uploads from disk, by path or by open file."""
+    with spool_upload(BytesIO(large_image_bytes), "large.jpg", file_service.MAX_FILE_SIZE) as upload:
+        assert upload.size == len(large_image_bytes)
+        by_path = file_service.ingest_image(upload.path, upload.filename)
+        by_file = file_service.ingest_image(upload.file, upload.filename)
+
+    assert by_path is not None and by_file is not None
+    assert by_path.content_hash == by_file.content_hash
+    assert by_path.width <= file_service.MAX_IMAGE_SIZE[0]
+
+
+def test_spool_upload_aborts_when_too_large(tmp_path):
+    """Test spooling stops at the size limit and leaves no temporary file behind."""
+    source = BytesIO(b"x" * (10 * 1024))
+    with pytest.raises(UploadTooLargeError):
+        spool_upload(source, "big.jpg", max_size=2 * 1024, chunk_size=1024, directory=tmp_path)
+
+    # Reading stopped with the first chunk past the limit
+    assert source.tell() == 3 * 1024
+    assert not any(tmp_path.iterdir())
+
+
+def test_expand_archive_spools_images(sample_image_bytes):
+    """Test images are extracted from a ZIP upload and everything else is skipped."""
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("day/breakfast.jpg", sample_image_bytes)
+        zf.writestr("day/lunch.png", sample_image_bytes)
+        zf.writestr("notes.txt", b"not an image")
+        zf.writestr("__MACOSX/day/._breakfast.jpg", b"resource fork")
+    archive.seek(0)
+
+    with spool_upload(archive, "meals.zip", FileService.MAX_ARCHIVE_SIZE) as upload:
+        images = expand_archive(upload, FileService.MAX_FILE_SIZE, 10, FileService.is_allowed_filename)
+
+    assert [image.filename for image in images] == ["breakfast.jpg", "lunch.png"]
+    assert images[0].read() == sample_image_bytes
+    for image in images:
+        image.close()
+
+    archive.seek(0)
+    with spool_upload(archive, "meals.zip", FileService.MAX_ARCHIVE_SIZE) as upload:
+        with pytest.raises(UploadTooLargeError):
+            expand_archive(upload, FileService.MAX_FILE_SIZE, 1, FileService.is_allowed_filename)
+        with pytest.raises(UploadTooLargeError):
+            expand_archive(upload, 100, 10, FileService.is_allowed_filename)
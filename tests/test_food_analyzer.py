@@ -1,7 +1,8 @@
 import pytest
 from app.services.user_service import UserService
 from app.services.nutrition_service import NutritionAnalysisService
-from app.ai_client import get_ai_client
+import base64
+from app.ai_client import get_ai_client, image_base64
 from app.models import UserCreate
 from app.database import reset_db
 
@@ -24,6 +25,33 @@ def test_ai_client_works():
     assert "nutritional_info" in result
 
 
+def test_image_base64_accepts_every_image_form(tmp_path):
+    """Bytes, views and files encode alike; text is taken as already encoded."""
+    content = b"\xff\xd8 not really a jpeg"
+    expected = base64.b64encode(content).decode()
+    path = tmp_path / "food.jpg"
+    path.write_bytes(content)
+
+    assert image_base64(content) == expected
+    assert image_base64(memoryview(content)) == expected
+    assert image_base64(expected) == expected
+    with path.open("rb") as image_file:
+        assert image_base64(image_file) == expected
+
+
+def test_analyze_with_ai_maps_the_stored_file(tmp_path):
+    """The stored file reaches the AI client; missing or empty files yield no result."""
+    service = NutritionAnalysisService()
+    path = tmp_path / "food.jpg"
+    path.write_bytes(b"\xff\xd8 image bytes")
+    empty = tmp_path / "empty.jpg"
+    empty.write_bytes(b"")
+
+    assert service._analyze_with_ai(str(path)) is not None
+    assert service._analyze_with_ai(str(empty)) is None
+    assert service._analyze_with_ai(str(tmp_path / "missing.jpg")) is None
+
+
 def test_user_service_basic_operations(new_db):
     """Test basic user service operations."""
     service = UserService()
@@ -0,0 +1,82 @@
+import pytest
+from io import BytesIO
+from pathlib import Path
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.image_api import image_url, rendition_url, router
+from app.services.file_service import FileService
+
+
+@pytest.fixture
+def client():
+    api = FastAPI()
+    api.include_router(router)
+    return TestClient(api)
+
+
+@pytest.fixture
+def stored_image():
+    """Ingest a sample image and remove it afterwards."""
+    img = Image.new("RGB", (600, 400), color="orange")
+    byte_arr = BytesIO()
+    img.save(byte_arr, format="JPEG")
+
+    file_service = FileService()
+    ingested = file_service.ingest_image(byte_arr.getvalue(), "dinner.jpg")
+    assert ingested is not None
+    yield ingested
+
+    Path(ingested.file_path).unlink(missing_ok=True)
+    for filename in (*ingested.renditions.values(), ingested.inference_rendition):
+        if filename is not None:
+            file_service.store.path_for(filename).unlink(missing_ok=True)
+
+
+def test_get_image_serves_file_with_cache_headers(client, stored_image):
+    """Test images are served with a strong content-derived ETag and immutable caching."""
+    response = client.get(image_url(stored_image.filename))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"] == f'"{stored_image.content_hash}"'
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == Path(stored_image.file_path).read_bytes()
+
+
+def test_get_image_if_none_match_returns_304(client, stored_image):
+    """Test a matching If-None-Match short-circuits with 304."""
+    etag = f'"{stored_image.content_hash}"'
+
+    response = client.get(image_url(stored_image.filename), headers={"If-None-Match": f'"other", W/{etag}'})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+
+def test_get_image_range_request(client, stored_image):
+    """Test byte ranges return partial content."""
+    response = client.get(image_url(stored_image.filename), headers={"Range": "bytes=0-99"})
+
+    assert response.status_code == 206
+    assert response.headers["content-range"].startswith("bytes 0-99/")
+    assert response.content == Path(stored_image.file_path).read_bytes()[:100]
+
+
+def test_get_image_rendition(client, stored_image):
+    """Test renditions are served by size and through their own filename."""
+    response = client.get(f"{image_url(stored_image.filename)}/128")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert rendition_url(stored_image.renditions, 100) == image_url(stored_image.renditions["128"])
+    assert client.get(rendition_url(stored_image.renditions, 100) or "").content == response.content
+
+
+def test_get_image_rejects_unknown_and_malformed_names(client):
+    """Test missing files and names outside the stored-name pattern are 404s."""
+    assert client.get(image_url("0" * 32 + ".jpg")).status_code == 404
+    assert client.get("/images/..%2Fapp%2Fmodels.py").status_code == 404
+    assert client.get("/images/not-a-hash.jpg").status_code == 404
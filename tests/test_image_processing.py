@@ -0,0 +1,164 @@
+import os
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from PIL import Image, ImageDraw
+from app.services.metrics import metrics
+from app.services.image_processing import (
+    ImageProcessingPool,
+    InferenceSettings,
+    ResampleQuality,
+    _draft_for_target,
+    perceptual_hash,
+    transcode_image,
+)
+
+
+@pytest.fixture
+def large_image_bytes():
+    """Create a large image that should be resized."""
+    img = Image.new("RGB", (3000, 2000), color="blue")
+    byte_arr = BytesIO()
+    img.save(byte_arr, format="JPEG")
+    return byte_arr.getvalue()
+
+
+def test_transcode_image_resizes_and_encodes(large_image_bytes):
+    """Test transcoding resizes into the bounding box and encodes the requested format."""
+    transcoded = transcode_image(large_image_bytes, "PNG", (2048, 2048))
+
+    assert transcoded.format == "PNG"
+    assert (transcoded.width, transcoded.height) == (2048, 1365)
+    with Image.open(BytesIO(transcoded.data)) as img:
+        assert img.format == "PNG"
+        assert img.size == (2048, 1365)
+
+
+def test_transcode_image_rejects_unsupported_format():
+    """Test transcoding refuses formats outside the allow-list."""
+    gif = BytesIO()
+    Image.new("RGB", (10, 10)).save(gif, format="GIF")
+
+    with pytest.raises(ValueError):
+        transcode_image(gif.getvalue(), "JPEG", (2048, 2048))
+
+
+def test_transcode_image_builds_rendition_pyramid(large_image_bytes):
+    """Test WebP renditions are produced for each size smaller than the image."""
+    transcoded = transcode_image(large_image_bytes, "JPEG", (2048, 2048), rendition_sizes=(128, 512, 2048, 4096))
+
+    assert set(transcoded.renditions) == {128, 512, 2048}
+    for size, data in transcoded.renditions.items():
+        with Image.open(BytesIO(data)) as img:
+            assert img.format == "WEBP"
+            assert max(img.size) == size
+
+
+def test_transcode_image_small_image_still_gets_thumbnail():
+    """Test images smaller than every rendition still get the smallest one."""
+    byte_arr = BytesIO()
+    Image.new("RGB", (100, 80), color="red").save(byte_arr, format="JPEG")
+
+    transcoded = transcode_image(byte_arr.getvalue(), "JPEG", (2048, 2048), rendition_sizes=(128, 512))
+
+    assert set(transcoded.renditions) == {128}
+
+
+def test_transcode_image_builds_inference_rendition(large_image_bytes):
+    """Test the inference rendition is downscaled and re-encoded, and skipped when nothing would change."""
+    inference = InferenceSettings(size=768, format="WEBP", quality=80)
+    transcoded = transcode_image(large_image_bytes, "JPEG", (2048, 2048), inference=inference)
+
+    assert transcoded.inference_rendition is not None
+    with Image.open(BytesIO(transcoded.inference_rendition)) as img:
+        assert img.format == "WEBP"
+        assert img.size == (768, 512)
+
+    byte_arr = BytesIO()
+    Image.new("RGB", (100, 80), color="red").save(byte_arr, format="JPEG")
+    small = transcode_image(byte_arr.getvalue(), "JPEG", (2048, 2048), inference=InferenceSettings(768, "JPEG", 85))
+    assert small.inference_rendition is None
+    off = transcode_image(large_image_bytes, "JPEG", (2048, 2048), inference=InferenceSettings(0, "JPEG", 85))
+    assert off.inference_rendition is None
+
+
+@pytest.mark.parametrize("quality", list(ResampleQuality))
+def test_transcode_image_quality_tiers(large_image_bytes, quality):
+    """Test every resampling tier produces the same output dimensions."""
+    transcoded = transcode_image(large_image_bytes, "JPEG", (1024, 1024), quality)
+
+    assert (transcoded.width, transcoded.height) == (1024, 683)
+
+
+def test_draft_decodes_jpeg_at_reduced_scale(large_image_bytes):
+    """Test DCT-domain reduction kicks in when the target is a fraction of the source."""
+    with Image.open(BytesIO(large_image_bytes)) as img:
+        _draft_for_target(img, (512, 512), reducing_gap=1.0)
+        assert img.size == (750, 500)
+
+    with Image.open(BytesIO(large_image_bytes)) as img:
+        _draft_for_target(img, (4096, 4096), reducing_gap=1.0)
+        assert img.size == (3000, 2000)
+
+
+@pytest.mark.asyncio
+async def test_pool_runs_in_thread_without_workers(large_image_bytes):
+    """Test the in-thread fallback used when no workers are configured."""
+    pool = ImageProcessingPool(workers=0, max_pending=1)
+
+    transcoded = await pool.run(transcode_image, large_image_bytes, "JPEG", (1024, 1024))
+
+    assert (transcoded.width, transcoded.height) == (1024, 683)
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_runs_in_worker_process(large_image_bytes):
+    """Test transcoding in a worker process returns the same result."""
+    pool = ImageProcessingPool(workers=1, max_pending=2)
+    try:
+        transcoded = await pool.run(transcode_image, large_image_bytes, "JPEG", (1024, 1024))
+    finally:
+        pool.shutdown()
+
+    assert (transcoded.width, transcoded.height) == (1024, 683)
+
+
+@pytest.mark.asyncio
+async def test_pool_replaces_workers_that_died(large_image_bytes):
+    """Test a dead worker fails the job that killed it, and later jobs run on a new pool instead of failing too."""
+    pool = ImageProcessingPool(workers=1, max_pending=2)
+    restarts = metrics.get("image_pool.restarts")
+    try:
+        # Kills the worker on its first try and on its retry, leaving the replacement pool broken too
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(os._exit, 1)
+        assert metrics.get("image_pool.restarts") - restarts == 1
+
+        transcoded = await pool.run(transcode_image, large_image_bytes, "JPEG", (1024, 1024))
+        assert metrics.get("image_pool.restarts") - restarts == 2
+    finally:
+        pool.shutdown()
+
+    assert (transcoded.width, transcoded.height) == (1024, 683)
+
+
+def test_perceptual_hash_tolerates_reencoding():
+    """Test a rescaled, recompressed copy hashes close to the original and a different image does not."""
+    img = Image.linear_gradient("L").convert("RGB").resize((400, 300))
+    ImageDraw.Draw(img).ellipse((50, 50, 200, 200), fill="red")
+    copy = Image.open(BytesIO(_jpeg(img.resize((300, 225)), quality=50)))
+    different = img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+    def distance(a: Image.Image, b: Image.Image) -> int:
+        return bin(int(perceptual_hash(a), 16) ^ int(perceptual_hash(b), 16)).count("1")
+
+    assert len(perceptual_hash(img)) == 16
+    assert distance(img, copy) <= 4
+    assert distance(img, different) > 16
+
+
+def _jpeg(img: Image.Image, quality: int) -> bytes:
+    byte_arr = BytesIO()
+    img.save(byte_arr, format="JPEG", quality=quality)
+    return byte_arr.getvalue()
@@ -0,0 +1,63 @@
+import pytest
+from pathlib import Path
+from app.services.image_store import ContentAddressedStore, FlatLayout, HashPrefixLayout, StorageLayout, get_layout
+
+
+def test_hash_prefix_layout_fans_out_by_name():
+    """Test the sharded layout nests files under their leading characters."""
+    layout = HashPrefixLayout()
+
+    assert layout.relative_path("abcdef0123.jpg") == Path("ab", "cd", "abcdef0123.jpg")
+    assert FlatLayout().relative_path("abcdef0123.jpg") == Path("abcdef0123.jpg")
+
+
+def test_get_layout_by_name():
+    """Test layouts are selected by their configured name."""
+    assert isinstance(get_layout("flat"), FlatLayout)
+    assert isinstance(get_layout("sharded"), HashPrefixLayout)
+
+    with pytest.raises(ValueError):
+        get_layout("unknown")
+
+
+def test_layouts_must_implement_relative_path():
+    """Test a layout without relative_path cannot be created."""
+
+    class Incomplete(StorageLayout):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()  # type: ignore[abstract]
+
+
+def test_store_put_writes_once_into_layout(tmp_path):
+    """Test the store writes new content into its shard and reuses existing blobs."""
+    store = ContentAddressedStore(tmp_path, HashPrefixLayout())
+
+    first = store.put(b"image bytes", ".jpg")
+    second = store.put(b"image bytes", ".jpg")
+
+    assert first.created
+    assert not second.created
+    assert first.file_path == second.file_path
+    assert Path(first.file_path) == tmp_path / first.content_hash[:2] / first.content_hash[2:4] / first.filename
+    assert Path(first.file_path).read_bytes() == b"image bytes"
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_store_iter_files_streams_in_name_order(tmp_path):
+    """Test stored files come back sorted by name across shards and leftover flat files."""
+    store = ContentAddressedStore(tmp_path, HashPrefixLayout())
+    for name in ["cd34.jpg", "ab12.jpg", "ab12_256.webp", "ff00.png"]:
+        store.put_named(name, b"data")
+    (tmp_path / "bb99.jpg").write_bytes(b"flat")
+    (tmp_path / ".partial").mkdir()
+    (tmp_path / ".partial" / "00.part").write_bytes(b"partial")
+
+    assert [entry.name for entry in store.iter_files()] == [
+        "ab12.jpg",
+        "ab12_256.webp",
+        "bb99.jpg",
+        "cd34.jpg",
+        "ff00.png",
+    ]
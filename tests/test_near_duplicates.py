@@ -0,0 +1,113 @@
+import random
+import pytest
+from io import BytesIO
+from PIL import Image, ImageDraw
+from app.database import get_session, reset_db
+from app.models import AnalysisStatus, NutritionalAnalysis
+from app.services.metrics import metrics
+from app.services.near_duplicates import BKTree, hamming_distance, get_near_duplicate_index
+from app.services.nutrition_service import NutritionAnalysisService
+from app.services.user_service import UserService
+
+
+@pytest.fixture()
+def new_db():
+    reset_db()
+    yield
+    reset_db()
+
+
+def _plate(size, shapes, quality=90) -> bytes:
+    """A JPEG with a few shapes on a gradient, scaled to size."""
+    img = Image.linear_gradient("L").convert("RGB").resize((400, 300))
+    draw = ImageDraw.Draw(img)
+    for box, color in shapes:
+        draw.ellipse(box, fill=color)
+    byte_arr = BytesIO()
+    img.resize(size).save(byte_arr, format="JPEG", quality=quality)
+    return byte_arr.getvalue()
+
+
+def test_bk_tree_search_matches_linear_scan():
+    """Test the tree finds exactly the keys a brute-force scan finds, closest first."""
+    rng = random.Random(7)
+    keys = [rng.getrandbits(64) for _ in range(500)]
+    # Near copies of the first few keys, a couple of bits flipped
+    keys += [key ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for key in keys[:20]]
+    tree = BKTree()
+    for value, key in enumerate(keys):
+        tree.add(key, value)
+
+    for query in keys[:20] + [rng.getrandbits(64) for _ in range(5)]:
+        expected = sorted(
+            (hamming_distance(query, key), value) for value, key in enumerate(keys) if hamming_distance(query, key) <= 6
+        )
+        assert tree.search(query, 6) == expected
+
+    assert len(tree) == len(keys)
+
+
+def test_near_duplicate_upload_reuses_analysis(new_db):
+    """Test a re-shot of an analyzed plate copies its analysis, while a different plate is analyzed anew."""
+    shapes = [((50, 50, 200, 200), "red"), ((220, 80, 360, 260), "green")]
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+    user = user_service.get_or_create_user("twice@test.com", "Twice")
+    assert user.id is not None
+    get_near_duplicate_index().forget(user.id)
+
+    first = user_service.create_food_image(user.id, _plate((400, 300), shapes), "plate.jpg")
+    again = user_service.create_food_image(user.id, _plate((380, 285), shapes, quality=60), "plate-2.jpg")
+    other = user_service.create_food_image(user.id, _plate((400, 300), [((10, 150, 120, 290), "blue")]), "other.jpg")
+    assert first is not None and first.id is not None
+    assert again is not None and again.id is not None
+    assert other is not None and other.id is not None
+    assert first.content_hash != again.content_hash
+
+    original = nutrition_service.analyze_food_image(first.id)
+    assert original is not None and original.status == AnalysisStatus.COMPLETED
+
+    hits = metrics.get("analysis.near_duplicate_hits")
+    reused = nutrition_service.analyze_food_image(again.id)
+    assert reused is not None and reused.id is not None and original.id is not None
+    assert metrics.get("analysis.near_duplicate_hits") == hits + 1
+    assert reused.status == AnalysisStatus.COMPLETED
+    assert reused.food_items == original.food_items
+    assert reused.calories == original.calories
+    original_allergens = nutrition_service.get_analysis_with_allergens(original.id)
+    reused_allergens = nutrition_service.get_analysis_with_allergens(reused.id)
+    assert original_allergens is not None and reused_allergens is not None
+    assert [d.allergen_id for d in reused_allergens[1]] == [d.allergen_id for d in original_allergens[1]]
+
+    nutrition_service.analyze_food_image(other.id)
+    assert metrics.get("analysis.near_duplicate_hits") == hits + 1
+
+
+def test_near_duplicate_reuse_skips_other_models(new_db):
+    """Test analyses by another model version are not reused for a near duplicate."""
+    shapes = [((60, 40, 210, 190), "orange"), ((230, 90, 370, 250), "purple")]
+    user_service = UserService()
+    nutrition_service = NutritionAnalysisService()
+    user = user_service.get_or_create_user("upgrade@test.com", "Upgrade")
+    assert user.id is not None
+    get_near_duplicate_index().forget(user.id)
+
+    first = user_service.create_food_image(user.id, _plate((400, 300), shapes), "plate.jpg")
+    again = user_service.create_food_image(user.id, _plate((380, 285), shapes, quality=60), "plate-2.jpg")
+    assert first is not None and first.id is not None
+    assert again is not None and again.id is not None
+    original = nutrition_service.analyze_food_image(first.id)
+    assert original is not None and original.status == AnalysisStatus.COMPLETED
+
+    # As if analyzed before a model upgrade
+    with get_session() as session:
+        stored = session.get(NutritionalAnalysis, original.id)
+        assert stored is not None
+        stored.ai_model_used = "retired-model"
+        session.commit()
+
+    hits = metrics.get("analysis.near_duplicate_hits")
+    fresh = nutrition_service.analyze_food_image(again.id)
+    assert fresh is not None and fresh.status == AnalysisStatus.COMPLETED
+    assert fresh.ai_model_used == nutrition_service.ai_client.model_version
+    assert metrics.get("analysis.near_duplicate_hits") == hits
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import os
+import time
+import zlib
+import pytest
+from io import BytesIO
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.services.resumable_upload import (
+    ChecksumMismatchError,
+    OffsetMismatchError,
+    ResumableUploadStore,
+    UploadSessionNotFoundError,
+    get_resumable_store,
+)
+from app.services.upload_spool import UploadTooLargeError
+from app.upload_api import CHECKSUM_MISMATCH, router
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResumableUploadStore(tmp_path, size_limit=lambda filename: 1024 * 1024)
+
+
+@pytest.fixture
+def client(store):
+    api = FastAPI()
+    api.include_router(router)
+    api.dependency_overrides[get_resumable_store] = lambda: store
+    return TestClient(api)
+
+
+async def _stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def _append(store, session_id, offset, data, checksum=None):
+    checksum = checksum or f"crc32 {zlib.crc32(data):08x}"
+    return asyncio.run(store.append(session_id, offset, checksum, _stream(data)))
+
+
+def test_chunks_append_at_the_reported_offset(store):
+    """Test a file sent in checksummed chunks is reassembled exactly."""
+    data = os.urandom(3000)
+    session = store.create("meal.jpg", len(data))
+
+    assert _append(store, session.id, 0, data[:1000]).offset == 1000
+    sha256 = f"sha256 {hashlib.sha256(data[1000:]).hexdigest()}"
+    session = _append(store, session.id, 1000, data[1000:], checksum=sha256)
+
+    assert session.complete
+    with store.finish(session.id) as upload:
+        assert upload.filename == "meal.jpg"
+        assert upload.read() == data
+        path = upload.path
+    assert not path.exists()
+    assert store.get(session.id) is None
+
+
+def test_retry_after_failure_resumes_from_stored_offset(store):
+    """Test bad or misplaced chunks are rejected without losing the bytes already stored."""
+    data = os.urandom(2000)
+    session = store.create("meal.jpg", len(data))
+    _append(store, session.id, 0, data[:1000])
+
+    # A corrupted chunk is discarded
+    with pytest.raises(ChecksumMismatchError):
+        _append(store, session.id, 1000, data[1000:], checksum="crc32 00000000")
+    assert store.get(session.id).offset == 1000
+
+    # Resending the first chunk is answered with the current offset
+    with pytest.raises(OffsetMismatchError) as excinfo:
+        _append(store, session.id, 0, data[:1000])
+    assert excinfo.value.offset == 1000
+
+    # More data than declared is refused
+    with pytest.raises(UploadTooLargeError):
+        _append(store, session.id, 1000, data[1000:] + b"extra")
+    assert store.get(session.id).offset == 1000
+
+    assert _append(store, session.id, 1000, data[1000:]).complete
+
+
+def test_create_and_finish_validate_session(store):
+    """Test oversized, unknown and incomplete sessions are refused."""
+    with pytest.raises(UploadTooLargeError):
+        store.create("huge.jpg", 2 * 1024 * 1024)
+    with pytest.raises(UploadSessionNotFoundError):
+        store.finish("0" * 32)
+    assert store.get("../../etc/passwd") is None
+
+    session = store.create("meal.jpg", 10)
+    with pytest.raises(OffsetMismatchError):
+        store.finish(session.id)
+
+
+def test_sweep_removes_only_stale_sessions(store):
+    """Test the sweeper removes sessions without recent progress."""
+    stale = store.create("old.jpg", 10)
+    fresh = store.create("new.jpg", 10)
+    long_ago = time.time() - store.EXPIRY_SECONDS - 60
+    for path in store.root.glob(f"{stale.id}.*"):
+        os.utime(path, (long_ago, long_ago))
+
+    assert store.sweep_expired() == 1
+    assert store.get(stale.id) is None
+    assert store.get(fresh.id) is not None
+
+
+def test_upload_protocol_over_http(client):
+    """Test the HTTP protocol end to end, including a retried chunk."""
+    img = Image.new("RGB", (300, 200), color="green")
+    byte_arr = BytesIO()
+    img.save(byte_arr, format="JPEG")
+    data = byte_arr.getvalue()
+    half = len(data) // 2
+
+    assert client.post("/uploads", json={"filename": "meal.gif", "size": len(data)}).status_code == 415
+    response = client.post("/uploads", json={"filename": "meal.jpg", "size": len(data)})
+    assert response.status_code == 201
+    session_id = response.json()["id"]
+
+    def send_chunk(offset, chunk, checksum=None):
+        headers = {"Upload-Offset": str(offset), "Upload-Checksum": checksum or f"crc32 {zlib.crc32(chunk):08x}"}
+        return client.patch(f"/uploads/{session_id}", content=chunk, headers=headers)
+
+    assert send_chunk(0, data[:half]).headers["upload-offset"] == str(half)
+    assert send_chunk(half, data[half:], checksum="crc32 00000000").status_code == CHECKSUM_MISMATCH
+
+    # The client probes the offset and resends only the missing part
+    probe = client.head(f"/uploads/{session_id}")
+    assert probe.headers["upload-offset"] == str(half)
+    conflict = send_chunk(0, data[:half])
+    assert conflict.status_code == 409 and conflict.headers["upload-offset"] == str(half)
+
+    response = send_chunk(half, data[half:])
+    assert response.status_code == 204
+    assert response.headers["upload-offset"] == str(len(data))
+
+    assert client.head("/uploads/" + "0" * 32).status_code == 404
@@ -1,8 +1,15 @@
 import pytest
-from app.services.user_service import UserService
+from io import BytesIO
+from pathlib import Path
+from PIL import Image
+from app.services.metrics import Metrics
+from app.services.user_service import BulkItemStatus, UserService
+from typing import Optional
+from sqlmodel import Session, select
 from app.services.nutrition_service import NutritionAnalysisService
-from app.models import UserCreate
-from app.database import reset_db
+from app.services.storage_gc import collect_garbage
+from app.models import Allergen, FoodImage, User, UserCreate
+from app.database import get_session, reset_db
 
 
 @pytest.fixture()
@@ -36,6 +43,39 @@ def test_nutrition_service_initialization(new_db):
     assert service.ai_client is not None
 
 
+class RacedAllergenService(NutritionAnalysisService):
+    """Misses every allergen on its first lookup, as when another worker inserts it right after."""
+
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def _find_allergen(self, session: Session, name: str) -> Optional[Allergen]:
+        self.lookups += 1
+        if self.lookups == 1:
+            return None
+        return super()._find_allergen(session, name)
+
+
+def test_get_or_create_allergen_survives_a_concurrent_insert(new_db):
+    """Test losing the race to insert an allergen uses the winner's row and keeps the transaction going."""
+    with get_session() as session:
+        session.add(Allergen(name="peanuts"))
+        session.commit()
+
+    service = RacedAllergenService()
+    with get_session() as session:
+        session.add(User(name="Racer", email="racer@test.com"))
+        allergen = service._get_or_create_allergen(session, "peanuts")
+        assert allergen.id is not None and allergen.name == "peanuts"
+        assert service.lookups == 2
+        session.commit()
+
+    with get_session() as session:
+        assert session.exec(select(User).where(User.email == "racer@test.com")).first() is not None
+        assert len(session.exec(select(Allergen)).all()) == 1
+
+
 def test_get_or_create_user(new_db):
     """Test get_or_create_user functionality."""
     user_service = UserService()
@@ -49,3 +89,111 @@ def test_get_or_create_user(new_db):
     user2 = user_service.get_or_create_user("new@test.com", "Different Name")
     assert user2.id == user1.id
     assert user2.name == "New User"  # Should keep original name
+
+
+def test_delete_food_image_keeps_shared_file(new_db):
+    """Test the stored file outlives the deletion of every image referencing it until garbage collection."""
+    img = Image.new("RGB", (64, 64), color="green")
+    byte_arr = BytesIO()
+    img.save(byte_arr, format="JPEG")
+    content = byte_arr.getvalue()
+
+    user_service = UserService()
+    user = user_service.get_or_create_user("dedupe@test.com", "Dedupe User")
+    assert user.id is not None
+
+    first = user_service.create_food_image(user.id, content, "lunch.jpg")
+    second = user_service.create_food_image(user.id, content, "lunch-again.jpg")
+    assert first is not None and first.id is not None
+    assert second is not None and second.id is not None
+    assert first.content_hash == second.content_hash
+    assert first.file_path == second.file_path
+
+    assert user_service.delete_food_image(first.id, user.id)
+    assert Path(second.file_path).exists()
+
+    # The last reference is gone, but an upload of the same image could be reusing the file right
+    # now: removing it is left to the garbage collector
+    assert user_service.delete_food_image(second.id, user.id)
+    assert Path(second.file_path).exists()
+
+    collect_garbage(user_service.file_service.store, grace_seconds=0)
+    assert not Path(second.file_path).exists()
+    for filename in second.renditions.values():
+        assert user_service.file_service.get_image_path(filename) is None
+
+
+def test_delete_food_image_removes_legacy_file(new_db, tmp_path):
+    """Test a file from before content addressing is removed with the last image referencing it."""
+    user_service = UserService()
+    user = user_service.get_or_create_user("legacy@test.com", "Legacy User")
+    assert user.id is not None
+    legacy_file = tmp_path / "3f2a.jpg"
+    legacy_file.write_bytes(b"\xff\xd8 legacy upload")
+
+    with get_session() as session:
+        rows = [
+            FoodImage(
+                filename=legacy_file.name,
+                original_filename=name,
+                file_path=str(legacy_file),
+                file_size=legacy_file.stat().st_size,
+                user_id=user.id,
+            )
+            for name in ("soup.jpg", "soup-copy.jpg")
+        ]
+        session.add_all(rows)
+        session.commit()
+        first_id, second_id = [row.id for row in rows]
+    assert first_id is not None and second_id is not None
+
+    assert user_service.delete_food_image(first_id, user.id)
+    assert legacy_file.exists()
+    assert user_service.delete_food_image(second_id, user.id)
+    assert not legacy_file.exists()
+
+
+@pytest.mark.asyncio
+async def test_create_food_images_bulk(new_db):
+    """Test a batch is ingested with per-file progress and inserted together."""
+    contents = []
+    for color in ("red", "green", "blue"):
+        byte_arr = BytesIO()
+        Image.new("RGB", (80, 60), color=color).save(byte_arr, format="JPEG")
+        contents.append(byte_arr.getvalue())
+
+    user_service = UserService()
+    user = user_service.get_or_create_user("bulk@test.com", "Bulk User")
+    assert user.id is not None
+
+    progress = []
+    uploads = [(contents[0], "breakfast.jpg"), (b"not an image", "broken.jpg"), (contents[1], "lunch.jpg")]
+    food_images = await user_service.create_food_images_bulk(
+        user.id, uploads, on_progress=lambda index, status: progress.append((index, status))
+    )
+
+    assert [food_image is not None for food_image in food_images] == [True, False, True]
+    assert food_images[0] is not None and food_images[0].id is not None
+    assert food_images[0].original_filename == "breakfast.jpg"
+    assert {food_image.id for food_image in user_service.get_user_food_images(user.id)} == {
+        food_image.id for food_image in food_images if food_image is not None
+    }
+    assert (1, BulkItemStatus.FAILED) in progress
+    assert [status for index, status in progress if index == 0] == [BulkItemStatus.PROCESSING, BulkItemStatus.STORED]
+
+    for food_image in food_images:
+        if food_image is not None and food_image.id is not None:
+            user_service.delete_food_image(food_image.id, user.id)
+
+
+def test_metrics_counters_and_gauges():
+    """Test counters accumulate while gauges keep the latest value."""
+    metrics = Metrics()
+    metrics.increment("uploads")
+    metrics.increment("uploads", 2)
+    metrics.set_gauge("queue_depth", 5)
+    metrics.set_gauge("queue_depth", 3)
+
+    assert metrics.get("uploads") == 3
+    assert metrics.get("missing") == 0
+    assert metrics.snapshot() == {"queue_depth": 3, "uploads": 3}
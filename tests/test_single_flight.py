@@ -0,0 +1,48 @@
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    """Test callers arriving while a call is in flight get its result without running it again."""
+    flight: SingleFlight[int] = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_call() -> int:
+        calls.append(1)
+        release.wait(5)
+        return 42
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(flight.do, "image", slow_call) for _ in range(5)]
+        time.sleep(0.2)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert sorted(results) == [(42, False)] + [(42, True)] * 4
+    # Once finished, the next call runs again
+    assert flight.do("image", lambda: 7) == (7, False)
+
+
+def test_failures_reach_every_waiter_and_are_not_remembered():
+    """Test an exception is raised in all coalesced callers, and a later call retries."""
+    flight: SingleFlight[int] = SingleFlight()
+    release = threading.Event()
+
+    def failing_call() -> int:
+        release.wait(5)
+        raise RuntimeError("backend down")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(flight.do, "image", failing_call) for _ in range(3)]
+        time.sleep(0.2)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+
+    assert flight.do("image", lambda: 1) == (1, False)
@@ -0,0 +1,78 @@
+import os
+import pytest
+from pathlib import Path
+from app.database import reset_db, get_session
+from app.models import FoodImage, User
+from app.services.image_store import ContentAddressedStore, HashPrefixLayout
+from app.services.metrics import metrics
+from app.services.storage_gc import collect_garbage
+
+OLD = 1_000_000_000
+
+
+@pytest.fixture()
+def new_db():
+    reset_db()
+    yield
+    reset_db()
+
+
+@pytest.fixture()
+def stored(new_db, tmp_path):
+    """A referenced image with a rendition, an old orphan, a fresh orphan and a row without a file."""
+    store = ContentAddressedStore(tmp_path, HashPrefixLayout())
+    referenced = store.put(b"referenced", ".jpg")
+    rendition = store.put_named(f"{referenced.content_hash}_256.webp", b"thumb")
+    orphan = store.put(b"orphan", ".jpg")
+    fresh = store.put(b"fresh", ".jpg")
+    for path in (referenced.file_path, str(store.path_for(f"{referenced.content_hash}_256.webp")), orphan.file_path):
+        os.utime(path, (OLD, OLD))
+
+    with get_session() as session:
+        user = User(name="Collector", email="gc@test.com")
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        assert user.id is not None
+
+        missing = "f" * 32 + ".jpg"
+        for filename, file_path in [(referenced.filename, referenced.file_path), (missing, str(tmp_path / missing))]:
+            session.add(
+                FoodImage(
+                    filename=filename, original_filename=filename, file_path=file_path, file_size=1, user_id=user.id
+                )
+            )
+        session.commit()
+
+    assert rendition
+    return store, referenced, orphan, fresh
+
+
+def test_collect_garbage_deletes_old_orphans_only(stored):
+    """Test referenced files, their renditions and recent orphans survive; old orphans are deleted."""
+    store, referenced, orphan, fresh = stored
+
+    stats = collect_garbage(store, batch_size=1)
+
+    assert not Path(orphan.file_path).exists()
+    assert Path(referenced.file_path).exists()
+    assert store.path_for(f"{referenced.content_hash}_256.webp").exists()
+    assert Path(fresh.file_path).exists()
+    assert stats.files_scanned == 4
+    assert stats.rows_scanned == 2
+    assert stats.orphan_files == stats.files_deleted == 1
+    assert stats.orphan_bytes == len(b"orphan")
+    assert stats.files_skipped == 1
+    assert stats.orphan_rows == 1
+    assert metrics.get("storage_gc.orphan_rows") == 1
+
+
+def test_collect_garbage_dry_run_deletes_nothing(stored):
+    """Test a dry run reports orphans without touching them."""
+    store, _, orphan, _ = stored
+
+    stats = collect_garbage(store, dry_run=True)
+
+    assert stats.orphan_files == 1
+    assert stats.files_deleted == 0
+    assert Path(orphan.file_path).exists()
@@ -0,0 +1,117 @@
+import pytest
+from pathlib import Path
+from sqlmodel import select
+from app.database import reset_db, get_session
+from app.models import FoodImage, User
+from app.services.image_store import ContentAddressedStore, FlatLayout, HashPrefixLayout
+from app.services.storage_migration import migrate_uploads
+
+
+@pytest.fixture()
+def new_db():
+    reset_db()
+    yield
+    reset_db()
+
+
+@pytest.fixture()
+def flat_images(new_db, tmp_path):
+    """Two rows sharing one flat file plus one row per distinct flat file."""
+    with get_session() as session:
+        user = User(name="Migrator", email="migrate@test.com")
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        assert user.id is not None
+
+        filenames = ["aa11.jpg", "aa11.jpg", "bb22.png"]
+        for filename in filenames:
+            file_path = tmp_path / filename
+            file_path.write_bytes(b"data")
+            session.add(
+                FoodImage(
+                    filename=filename,
+                    original_filename=filename,
+                    file_path=str(file_path),
+                    file_size=4,
+                    user_id=user.id,
+                )
+            )
+        session.commit()
+
+    # A file no row refers to
+    (tmp_path / "cc33.jpg").write_bytes(b"data")
+    return tmp_path
+
+
+def test_migrate_uploads_moves_files_and_rewrites_paths(flat_images):
+    """Test migration moves every file into the sharded layout and updates the rows."""
+    store = ContentAddressedStore(flat_images, HashPrefixLayout())
+
+    stats = migrate_uploads(store, batch_size=2)
+
+    assert stats.rows_scanned == 3
+    assert stats.rows_updated == 3
+    assert stats.files_moved == 3
+    assert stats.files_missing == 0
+
+    with get_session() as session:
+        for food_image in session.exec(select(FoodImage)).all():
+            assert food_image.file_path == str(store.path_for(food_image.filename))
+            assert Path(food_image.file_path).exists()
+
+    assert (flat_images / "cc" / "33" / "cc33.jpg").exists()
+    assert not (flat_images / "aa11.jpg").exists()
+
+    # A second run has nothing left to do
+    again = migrate_uploads(store)
+    assert again.rows_updated == 0
+    assert again.files_moved == 0
+
+
+def test_migrate_uploads_dry_run_changes_nothing(flat_images):
+    """Test a dry run reports moves without touching files or rows."""
+    store = ContentAddressedStore(flat_images, HashPrefixLayout())
+
+    stats = migrate_uploads(store, dry_run=True)
+
+    assert stats.files_moved == 3
+    assert (flat_images / "aa11.jpg").exists()
+    with get_session() as session:
+        for food_image in session.exec(select(FoodImage)).all():
+            assert Path(food_image.file_path).parent == flat_images
+
+
+def test_migrate_uploads_moves_renditions_with_their_image(new_db, tmp_path):
+    """Test the renditions of an image, the inference one included, follow it into the new layout."""
+    sharded = ContentAddressedStore(tmp_path, HashPrefixLayout())
+    renditions = {"128": "dd44_128.webp"}
+    names = ["dd44.jpg", "dd44_128.webp", "dd44_ai768.jpeg"]
+    for name in names:
+        sharded.put_named(name, b"data")
+    with get_session() as session:
+        user = User(name="Migrator", email="renditions@test.com")
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        assert user.id is not None
+        session.add(
+            FoodImage(
+                filename="dd44.jpg",
+                original_filename="dd44.jpg",
+                file_path=str(sharded.path_for("dd44.jpg")),
+                file_size=4,
+                renditions=renditions,
+                inference_rendition="dd44_ai768.jpeg",
+                user_id=user.id,
+            )
+        )
+        session.commit()
+
+    flat = ContentAddressedStore(tmp_path, FlatLayout())
+    stats = migrate_uploads(flat)
+
+    assert stats.files_moved == 3
+    for name in names:
+        assert flat.path_for(name).exists()
+        assert not sharded.path_for(name).exists()
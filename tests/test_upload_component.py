@@ -0,0 +1,110 @@
+import pytest
+import zipfile
+from io import BytesIO
+from nicegui import ui
+from nicegui.testing import User
+
+from app.components.upload_component import ImageUploadComponent, PreviewMode
+from app.services.upload_spool import spool_upload
+
+
+@pytest.mark.asyncio
+async def test_preview_modes(user: User):
+    components = {}
+
+    @ui.page("/upload-preview-test")
+    def page():
+        for mode in PreviewMode:
+            components[mode] = ImageUploadComponent(lambda upload: upload.close(), preview_mode=mode)
+            components[mode].create()
+            with spool_upload(BytesIO(b"\xff\xd8" * 1024), "food.jpg", 10 * 1024) as upload:
+                components[mode]._show_preview(upload)
+
+    await user.open("/upload-preview-test")
+
+    object_url = components[PreviewMode.OBJECT_URL]
+    assert object_url.preview_image is not None
+    assert "src" not in object_url.preview_image._props
+    assert object_url.upload is not None
+    handlers = [listener.js_handler or "" for listener in object_url.upload._event_listeners.values()]
+    assert any("URL.createObjectURL" in handler for handler in handlers)
+
+    data_url = components[PreviewMode.DATA_URL]
+    assert data_url.preview_image is not None
+    assert data_url.preview_image._props["src"].startswith("data:image/jpeg;base64,")
+
+    object_url.show_saved_preview({"128": "a" * 32 + "_128.webp", "512": "a" * 32 + "_512.webp"})
+    assert object_url.preview_image._props["src"] == f"/images/{'a' * 32}_512.webp"
+
+
+@pytest.mark.asyncio
+async def test_pre_resize_defers_upload_to_browser(user: User):
+    components = {}
+
+    @ui.page("/upload-pre-resize-test")
+    def page():
+        for pre_resize in (False, True):
+            components[pre_resize] = ImageUploadComponent(lambda upload: upload.close(), pre_resize=pre_resize)
+            components[pre_resize].create()
+
+    await user.open("/upload-pre-resize-test")
+
+    for pre_resize, component in components.items():
+        assert component.upload is not None
+        handlers = [listener.js_handler or "" for listener in component.upload._event_listeners.values()]
+        assert any("canvas.toBlob" in handler for handler in handlers) == pre_resize
+        # The browser starts pre-resized uploads itself, and the server enforces the size limit
+        assert component.upload._props.get("auto-upload", False) != pre_resize
+        assert ("max-file-size" in component.upload._props) != pre_resize
+
+
+@pytest.mark.asyncio
+async def test_resumable_mode_sends_files_in_chunks(user: User):
+    components = []
+
+    @ui.page("/upload-resumable-test")
+    def page():
+        components.append(ImageUploadComponent(lambda upload: upload.close(), pre_resize=True, resumable=True))
+        components[0].create()
+
+    await user.open("/upload-resumable-test")
+
+    upload = components[0].upload
+    assert upload is not None
+    assert not upload._props.get("auto-upload", False)
+    handlers = [listener.js_handler or "" for listener in upload._event_listeners.values()]
+    # Pre-resizing hands over to the resumable sender instead of starting the uploader itself
+    assert any("Upload-Checksum" in handler for handler in handlers)
+    assert any("canvas.toBlob" in handler and "&& false" in handler for handler in handlers)
+
+
+@pytest.mark.asyncio
+async def test_bulk_mode_expands_archives(user: User):
+    components = []
+    batches = []
+
+    @ui.page("/upload-bulk-test")
+    def page():
+        components.append(
+            ImageUploadComponent(lambda upload: upload.close(), on_bulk_upload=lambda uploads: batches.append(uploads))
+        )
+        components[0].create()
+
+    await user.open("/upload-bulk-test")
+
+    component = components[0]
+    assert component.upload is not None
+    assert component.upload._props["multiple"]
+    assert component.upload._props["accept"] == "image/*,.zip"
+
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("breakfast.jpg", b"\xff\xd8" * 16)
+        zf.writestr("dinner.jpg", b"\xff\xd8" * 16)
+    archive.seek(0)
+    component._accept_uploads([spool_upload(archive, "day.zip", 1024 * 1024)])
+
+    assert len(batches) == 1
+    assert [upload.filename for upload in batches[0]] == ["breakfast.jpg", "dinner.jpg"]
+    for upload in batches[0]:
+        upload.close()